@@ -1,8 +1,9 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 import os
+import shutil
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     debug: bool = False
@@ -15,28 +16,106 @@ class Settings(BaseSettings):
     STATIC_PATH: str = "/static"
     TARGET_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'mock')
 
+    # 服务状态(下载队列、热度数据、下载工作区)所在目录, 默认位于漫画目录旁边。
+    # 漫画目录通过/static公开, 状态文件不能放在其中; 下载工作区需要与漫画目录在同一文件系统
+    state_dir: Optional[str] = None
+
     cors_origins: List[str] = ["http://0.0.0.0:5173", "http://localhost:5173", "*"]
 
+    catalog_backend: str = "json"  # json, sqlite
+    catalog_db_path: Optional[str] = None
+
+    # 内存中保留的目录变更数, 客户端版本早于该范围时需要重新加载全部列表
+    catalog_change_log_size: int = 1000
+
+    popularity_half_life: int = 7 * 86400
+    popularity_flush_interval: int = 60
+
+    response_cache_pages: int = 5
+
     cache_enabled: bool = True
     cache_ttl: int = 3600
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_stale_ttl: int = 30
+    # 按路径前缀设置TTL(秒), 0表示不缓存
+    cache_route_ttls: Dict[str, int] = {
+        "/static": 0,
+        "/download": 0,
+        "/api/download": 0,
+        "/api/cache": 0,
+        "/api/bundles": 0,
+        "/api/comics/recommended": 0,
+        "/api/comics/changes": 0,
+        "/api/comics/popular": 60,
+        "/api/comics/search": 300,
+    }
+    # sort=popular的列表与搜索结果随热度变化, 与/api/comics/popular使用相同的TTL
+    cache_popular_ttl: int = 60
+
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    static_precompress: bool = True
 
     rate_limit_enabled: bool = True
     rate_limit_requests: int = 100
+    # 路由前缀 -> 每分钟请求数(同时作为突发上限), 未匹配的路由使用rate_limit_requests, 0表示不限流
+    # 漫画图片由最外层的StaticImageMiddleware直接发送, 不经过限流
+    rate_limit_routes: Dict[str, int] = {}
+    # 超过该时间没有请求的客户端会被清理
+    rate_limit_idle_ttl: int = 300
 
     security_enabled: bool = True
     max_request_size: int = 10485760 * 3
 
     download_path: Optional[str] = None
-    download_timeout: Optional[int] = None
-    max_concurrent_downloads: Optional[int] = None
+    # 单个下载任务的超时时间(秒), 0表示不限制
+    download_timeout: int = 3600
+    max_concurrent_downloads: int = 2
+    download_queue_path: Optional[str] = None
+    # 通过WebSocket推送下载进度的最小间隔(秒)
+    download_progress_interval: float = 0.5
+    # 一个下载子进程最多依次处理的漫画数, 批量导入时共享jmcomic导入与漫画目录写入
+    download_batch_size: int = 20
+    # 下载模块, 需提供JmOption.construct与download_album, 可替换为本地的替身实现
+    download_fetcher: str = "jmcomic"
+    # 留有断点的下载在服务启动时自动继续的最大尝试次数
+    download_resume_attempts: int = 3
+
+    # 每个WebSocket连接最多缓存的待发送消息数, 超出时断开该连接
+    ws_queue_size: int = 64
+    # 心跳间隔(秒), 回复过pong的客户端超过两个间隔没有消息时断开
+    ws_heartbeat_interval: float = 30.0
+    # 单条消息的发送超时(秒)
+    ws_send_timeout: float = 10.0
 
     jwt_secret: Optional[str] = None
     jwt_algorithm: Optional[str] = None
     jwt_expires_in: Optional[str] = None
 
-    image_quality: Optional[int] = None
-    image_max_size: Optional[int] = None
-    allowed_image_types: Optional[List[str]] = None
+    # 入库时把页面转码为image_format/image_quality, 长边不超过image_max_size(见transcode)
+    transcode_on_ingest: bool = False
+    # 转码进程数, 0表示CPU核数
+    transcode_workers: int = 0
+
+    # 页面存储方式: loose(每页一个文件), packed(每个漫画一个打包文件, 见page_pack)
+    page_storage: str = "loose"
+    # 入库时按内容哈希去重, 相同页面以硬链接共享同一份数据(见page_dedup)
+    page_dedup: bool = True
+    page_object_dir: Optional[str] = None
+
+    image_quality: int = 80
+    # 缩放版本的最大宽高
+    image_max_size: int = 1600
+    image_format: str = "webp"
+    allowed_image_types: List[str] = ["image/webp", "image/jpeg", "image/png", "image/gif"]
+
+    image_variants_enabled: bool = True
+    # ?w=参数会对齐到这些宽度
+    image_variant_widths: List[int] = [160, 320, 640, 1080]
+    image_cover_width: int = 320
+    image_cache_dir: Optional[str] = None
+    image_cache_max_bytes: int = 512 * 1024 * 1024
+    image_workers: int = 2
 
     class Config:
         env_file = os.getenv("ENV_FILE", ".env.development")
@@ -46,4 +125,17 @@ class Settings(BaseSettings):
 
 @lru_cache()
 def get_settings():
-    return Settings()
\ No newline at end of file
+    return Settings()
+
+def state_path(settings: Settings, name: str, legacy_name: Optional[str] = None) -> str:
+    """状态目录中的文件或目录路径
+
+    旧版本把状态文件放在漫画目录中(legacy_name, 默认与name相同), 首次访问时移入状态目录。
+    """
+    state_dir = settings.state_dir or os.path.join(os.path.dirname(os.path.abspath(settings.TARGET_DIR)), ".state")
+    path = os.path.join(state_dir, name)
+    legacy = os.path.join(settings.TARGET_DIR, legacy_name or name)
+    if not os.path.exists(path) and os.path.exists(legacy):
+        os.makedirs(state_dir, exist_ok=True)
+        shutil.move(legacy, path)
+    return path
@@ -1,7 +1,10 @@
 import sys
+import ctypes
+import errno
+import importlib
 import json
 import shutil
-import time
+import threading
 import re
 import os
 from pathlib import Path
@@ -15,202 +18,423 @@ BASE_URL = os.environ.get("BASE_URL", "http://localhost:3000")
 STATIC_PATH = "/static"
 script_dir = os.path.dirname(os.path.abspath(__file__))  # app目录
 backend_dir = os.path.dirname(script_dir)  # backend目录
-TARGET_DIR = os.path.join(backend_dir, 'mock')
+TARGET_DIR = os.environ.get("TARGET_DIR") or os.path.join(backend_dir, 'mock')
+
+# 以脚本方式运行时也能导入app包, 与API共用漫画目录存储
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
 
 def get_static_url(path):
     if path.startswith('/'):
         path = path[1:]
     return f"{BASE_URL}{STATIC_PATH}/{path}"
 
+# 与app.services.downloads.PROGRESS_PREFIX一致, 调度器据此解析进度
+PROGRESS_PREFIX = "@@progress "
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+# renameat2参数: 相对当前目录解析路径, 原子交换两个路径
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+def report_progress(comic_id, **progress):
+    """向下载调度器报告漫画的进度(status/pagesDone/pagesTotal/bytes/error)"""
+    print(PROGRESS_PREFIX + json.dumps({"comicId": comic_id, **progress}, ensure_ascii=False), flush=True)
+
+class DownloadWatcher(threading.Thread):
+    """下载过程中定期统计已下载的图片数与字节数"""
+
+    def __init__(self, comic_id, root, interval=0.5):
+        super().__init__(daemon=True)
+        self.comic_id = comic_id
+        self.root = Path(root)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def scan(self):
+        pages = size = 0
+        for directory in self.root.iterdir():
+            if not directory.is_dir():
+                continue
+            for path in directory.rglob("*"):
+                if path.suffix.lower() in IMAGE_EXTENSIONS:
+                    try:
+                        size += path.stat().st_size
+                    except OSError:
+                        continue
+                    pages += 1
+        return pages, size
+
+    def run(self):
+        last = None
+        while not self._stopped.wait(self.interval):
+            try:
+                current = self.scan()
+            except OSError:
+                continue
+            if current != last:
+                report_progress(self.comic_id, pagesDone=current[0], bytes=current[1])
+                last = current
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
 print(f"下载脚本中的BASE_URL: {BASE_URL}")
 print(f"下载脚本中的TARGET_DIR: {TARGET_DIR}")
 print(f"当前工作目录: {Path.cwd().absolute()}")
 
-def download_and_process(comic_id):
-    """下载漫画并处理"""
-    try:
-        print(f"开始下载漫画 {comic_id}...")
-        print(f"当前工作目录: {Path.cwd().absolute()}")
+def download_and_process(comic_ids):
+    """在同一进程中依次下载并处理多个漫画, 全部完成后一次性写入漫画目录
 
-        before_dirs = set(d.name for d in Path(".").iterdir() if d.is_dir())
-        print(f"下载前的目录: {before_dirs}")
+    下载模块(默认jmcomic, 见settings.download_fetcher)只导入一次。每个漫画的结果
+    以进度行报告给下载调度器, 成功的漫画在漫画目录写入后才报告为done。
 
-        print(f"正在导入jmcomic模块...")
+    Returns:
+        漫画ID -> 失败原因
+    """
+    from app.config.settings import get_settings
+    fetcher_name = get_settings().download_fetcher
+    print(f"正在导入{fetcher_name}模块...")
+    try:
+        jmcomic = importlib.import_module(fetcher_name)
+        print(f"{fetcher_name}模块导入成功, 版本: {getattr(jmcomic, '__version__', '未知')}")
+    except ImportError as e:
+        print(f"导入{fetcher_name}模块失败: {e}")
+        print("请确保已安装jmcomic模块: pip install jmcomic")
+        return {comic_id: f"导入{fetcher_name}模块失败: {e}" for comic_id in comic_ids}
+
+    failed = {}
+    entries = []
+    for comic_id in comic_ids:
         try:
-            import jmcomic
-            print(f"jmcomic模块导入成功, 版本: {getattr(jmcomic, '__version__', '未知')}")
-        except ImportError as e:
-            print(f"导入jmcomic模块失败: {e}")
-            print("请确保已安装jmcomic模块: pip install jmcomic")
-            return False
-
-        print(f"开始下载漫画ID: {comic_id}...")
-        jmcomic.download_album(comic_id)
-
-        time.sleep(2)
-
-        after_dirs = set(d.name for d in Path(".").iterdir() if d.is_dir())
-        new_dirs = after_dirs - before_dirs
-        print(f"下载后新增的目录: {new_dirs}")
-
-        if not new_dirs:
-            print("下载完成，但找不到新增的目录")
-            return False
-
-        newest_dir = max(new_dirs, key=lambda d: Path(d).stat().st_mtime)
-        source_path = Path(newest_dir)
-        print(f"找到下载目录: {source_path.absolute()}")
-
-        script_dir = Path(__file__).parent
-        print(f"脚本目录: {script_dir.absolute()}")
-
-        target_dir = Path(TARGET_DIR)
-        print(f"最终目标目录: {target_dir.absolute()}")
-        target_dir.mkdir(parents=True, exist_ok=True)
-
-        target_path = target_dir / comic_id
-        print(f"漫画目标目录: {target_path.absolute()}")
-
-        if target_path.exists():
-            print(f"目标目录 {target_path} 已存在，正在删除...")
-            shutil.rmtree(target_path)
-
-        target_path.mkdir(parents=True, exist_ok=True)
-
-        print(f"正在处理文件从 {source_path} 到 {target_path}...")
-
-        image_files = []
-        for ext in ['.jpg', '.png', '.webp']:
-            image_files.extend(list(source_path.glob(f"*{ext}")))
-
-        print(f"找到 {len(image_files)} 个图片文件")
-
-        def extract_page_number(path):
-            numbers = re.findall(r'\d+', path.stem)
-            return int(numbers[0]) if numbers else 0
-
-        image_files.sort(key=extract_page_number)
-
-        image_paths = []
-        for i, img_file in enumerate(image_files):
-            new_name = f"{i+1:05d}{img_file.suffix}"
-            dest_file = target_path / new_name
-            print(f"复制 {img_file} -> {dest_file}")
-            shutil.copy2(img_file, dest_file)
-            image_paths.append(f"{comic_id}/{new_name}")
+            entries.append(ingest_comic(jmcomic, comic_id))
+        except Exception as e:
+            print(f"下载或处理漫画 {comic_id} 时出错: {e}")
+            import traceback
+            traceback.print_exc()
+            failed[comic_id] = str(e)
+            report_progress(comic_id, status="failed", error=str(e))
+
+    if entries and not update_comics_list(entries):
+        # 保留已发布漫画的工作区与断点, 重试时直接写入漫画列表
+        for comic_info, _ in entries:
+            failed[comic_info["id"]] = "更新漫画列表失败"
+            report_progress(comic_info["id"], status="failed", error="更新漫画列表失败")
+        return failed
+
+    for comic_info, _ in entries:
+        discard_workspace(comic_info["id"])
+        print(f"漫画 {comic_info['id']} 处理完成, 已添加到mock数据")
+        report_progress(comic_info["id"], status="done")
+    return failed
+
+def discard_workspace(comic_id):
+    """漫画写入漫画列表后删除其工作区与断点"""
+    from app.config.settings import get_settings
+    from app.services.download_checkpoint import workspace_root
+    shutil.rmtree(workspace_root(get_settings()) / comic_id, ignore_errors=True)
+
+def ingest_comic(jmcomic, comic_id):
+    """下载单个漫画并发布到漫画目录, 不更新漫画列表
+
+    每个漫画下载到状态目录中固定的工作区, 与漫画目录位于同一文件系统。
+    失败时保留工作区与断点, 再次执行时只下载缺少或残缺的页面。
+    页面通过硬链接放入待发布目录, 最后以目录重命名原子地发布。
+    发布后断点记录漫画列表条目, 工作区由调用方在漫画列表写入成功后删除;
+    已发布但尚未写入漫画列表的漫画再次执行时直接返回记录的条目。
+
+    Returns:
+        (漫画信息, 页面路径列表)
+
+    Raises:
+        RuntimeError: 下载后找不到下载目录
+    """
+    from app.config.settings import get_settings
+    from app.services.download_checkpoint import DownloadCheckpoint, workspace_root
+
+    print(f"开始下载漫画 {comic_id}...")
+    target_dir = Path(TARGET_DIR)
+    workspace = workspace_root(get_settings()) / comic_id
+    download_dir = workspace / "download"
+    download_dir.mkdir(parents=True, exist_ok=True)
+    print(f"下载工作区: {workspace}")
+
+    checkpoint = DownloadCheckpoint.load(workspace, comic_id)
+    if checkpoint.published is not None and (target_dir / comic_id).is_dir():
+        print(f"漫画 {comic_id} 已发布, 尚未写入漫画列表, 跳过下载")
+        report_progress(comic_id, status="running")
+        return checkpoint.published["comic"], checkpoint.published["pages"]
+    checkpoint.published = None
+    checkpoint.attempts += 1
+    resumed = checkpoint.verify(download_dir)
+    checkpoint.save()
+    if resumed:
+        print(f"从断点继续下载: 已有 {resumed} 个完整页面, 第 {checkpoint.attempts} 次尝试")
+
+    report_progress(comic_id, status="running")
+    # cache: 已存在的图片不再下载
+    option = jmcomic.JmOption.construct({
+        "dir_rule": {"base_dir": str(download_dir)},
+        "download": {"cache": True},
+    })
+    watcher = DownloadWatcher(comic_id, download_dir)
+    watcher.start()
+    try:
+        jmcomic.download_album(comic_id, option)
+    finally:
+        watcher.stop()
+        # 中途失败时记录已完整下载的页面, 下次从这里继续
+        checkpoint.verify(download_dir)
+        checkpoint.save()
+
+    downloaded = [d for d in download_dir.iterdir() if d.is_dir()]
+    if not downloaded:
+        raise RuntimeError("下载完成，但找不到下载目录")
+
+    source_path = max(downloaded, key=lambda d: d.stat().st_mtime)
+    print(f"找到下载目录: {source_path}")
+
+    # 在工作区中组装漫画目录, 完成后整体发布; 上次未完成的组装结果直接丢弃
+    staging_path = workspace / comic_id
+    if staging_path.exists():
+        shutil.rmtree(staging_path)
+    staging_path.mkdir()
+
+    print(f"正在处理文件从 {source_path} 到 {staging_path}...")
+
+    image_files = []
+    for ext in ['.jpg', '.png', '.webp']:
+        image_files.extend(list(source_path.glob(f"*{ext}")))
+
+    print(f"找到 {len(image_files)} 个图片文件")
+
+    def extract_page_number(path):
+        numbers = re.findall(r'\d+', path.stem)
+        return int(numbers[0]) if numbers else 0
+
+    image_files.sort(key=extract_page_number)
+    report_progress(comic_id, status="processing", pagesDone=0, pagesTotal=len(image_files), bytes=0)
+
+    linked_bytes = 0
+    for i, img_file in enumerate(image_files):
+        new_name = f"{i+1:05d}{img_file.suffix}"
+        linked_bytes += img_file.stat().st_size
+        link_page(img_file, staging_path / new_name)
+        report_progress(comic_id, pagesDone=i + 1, bytes=linked_bytes)
+
+    transcode_pages(comic_id, staging_path)
+
+    # 按转码后的最终内容去重
+    object_store = get_object_store()
+    if object_store is not None:
+        _, saved = object_store.dedup_dir(staging_path)
+        if saved:
+            print(f"与已有页面内容相同, 已共享存储, 节省 {saved / 1048576:.1f} MB")
+
+    from app.services.page_manifest import list_pages, write_manifest
+    image_paths = [f"{comic_id}/{path.name}" for path in list_pages(staging_path)]
+
+    title = source_path.name
+    print(f"漫画标题: {title}")
+
+    comic_info = {
+        "id": comic_id,
+        "title": title,
+        "cover": image_paths[0] if image_paths else "",
+        "author": "未知",
+        "description": "从JM漫画下载的漫画",
+        "tags": ["漫画", "JM漫画"],
+        "updateTime": datetime.now().isoformat().split('T')[0],
+        "status": "completed"
+    }
+
+    manifest = write_manifest(staging_path)
+    print(f"已生成页面清单: {len(manifest['pages'])} 页")
+
+    # 缩略图按内容缓存, 在发布前生成即可
+    if image_paths:
+        generate_cover_variant(staging_path / Path(image_paths[0]).name)
+
+    pack_pages(staging_path)
+
+    target_path = target_dir / comic_id
+    publish_comic(staging_path, target_path, workspace)
+    print(f"已发布漫画目录: {target_path}")
+
+    checkpoint.published = {"comic": comic_info, "pages": image_paths}
+    checkpoint.save()
+    return comic_info, image_paths
+
+def link_page(source, dest):
+    """把下载的页面硬链接到待发布目录, 下载目录保持完整以便失败后继续; 无法链接时移动"""
+    try:
+        os.link(source, dest)
+    except OSError:
+        os.replace(source, dest)
+
+def publish_comic(staging_path, target_path, workspace):
+    """用目录重命名发布漫画
+
+    目录重命名不能覆盖非空目录。已有旧版本时用renameat2(RENAME_EXCHANGE)原子交换新旧目录,
+    读取方只会看到完整的旧目录或新目录; 换下的旧版本移入工作区, 随工作区一起删除。
+    系统不支持原子交换时退回为两次重命名, 两次重命名之间目标目录短暂不存在。
+    """
+    previous = workspace / "previous"
+    if previous.exists():
+        shutil.rmtree(previous)
+    if target_path.exists():
+        print(f"目标目录 {target_path} 已存在，替换为新下载的版本")
+        if exchange_paths(staging_path, target_path):
+            # 交换后待发布目录中是旧版本
+            os.replace(staging_path, previous)
+            return
+        os.replace(target_path, previous)
+    os.replace(staging_path, target_path)
+
+def exchange_paths(path_a, path_b):
+    """用renameat2(RENAME_EXCHANGE)原子交换两个路径, 系统或文件系统不支持时返回False"""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        # glibc 2.28之前没有renameat2
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    renameat2.restype = ctypes.c_int
+    if renameat2(AT_FDCWD, os.fsencode(path_a), AT_FDCWD, os.fsencode(path_b), RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+        return False
+    raise OSError(err, os.strerror(err), str(path_b))
+
+def get_object_store():
+    """启用去重时返回页面对象存储; 打包存储会删除散文件, 不使用硬链接去重"""
+    from app.config.settings import get_settings
+    from app.services.page_dedup import create_object_store
+    settings = get_settings()
+    if not settings.page_dedup or settings.page_storage == "packed":
+        return None
+    return create_object_store(settings)
+
+def generate_cover_variant(cover_path):
+    """预先生成封面缩略图, 列表页首次访问时无需等待编码"""
+    try:
+        from app.config.settings import get_settings
+        from app.services.image_variants import create_image_variant_service
+        # 只创建需要的服务, 不构建API的整个服务图
+        settings = get_settings()
+        variant = create_image_variant_service(settings).ensure(cover_path, settings.image_cover_width)
+        print(f"封面缩略图: {variant or '无需缩放或不可用'}")
+    except Exception as e:
+        print(f"生成封面缩略图时出错: {e}")
 
-        title = source_path.name
-        print(f"漫画标题: {title}")
+def transcode_pages(comic_id, comic_path):
+    """配置了入库转码时, 在进程池中把页面重新编码为目标格式与质量"""
+    try:
+        from app.config.settings import get_settings
+        settings = get_settings()
+        if not settings.transcode_on_ingest:
+            return
+        from app.services.transcode import transcode_dir
+
+        def on_page(done, before, after):
+            report_progress(comic_id, pagesDone=done, bytes=after)
+
+        report_progress(comic_id, pagesDone=0, bytes=0)
+        report = transcode_dir(
+            comic_path, settings.image_format, settings.image_quality, settings.image_max_size,
+            settings.transcode_workers or None, on_page
+        )
+        if report:
+            print(f"已转码为{report['format']}: {report['bytesBefore'] / 1048576:.1f} MB -> "
+                  f"{report['bytesAfter'] / 1048576:.1f} MB")
+    except Exception as e:
+        print(f"转码页面时出错, 保留未转码的页面: {e}")
 
-        comic_info = {
-            "id": comic_id,
-            "title": title,
-            "cover": image_paths[0] if image_paths else "",
-            "author": "未知",
-            "description": "从JM漫画下载的漫画",
-            "tags": ["漫画", "JM漫画"],
-            "updateTime": datetime.now().isoformat().split('T')[0],
-            "status": "completed"
-        }
+def pack_pages(comic_path):
+    """配置为打包存储时, 把页面写入打包文件并删除散文件"""
+    try:
+        from app.config.settings import get_settings
+        if get_settings().page_storage != "packed":
+            return
+        from app.services.page_pack import pack_comic
+        count = pack_comic(comic_path, remove_loose=True)
+        print(f"已打包 {count} 个页面")
+    except Exception as e:
+        print(f"打包页面时出错, 保留散文件: {e}")
 
-        if source_path.exists():
-            print(f"清理源目录: {source_path}")
-            shutil.rmtree(source_path)
+def update_comics_list(entries):
+    """把一批漫画一次性写入漫画列表
 
-        update_comics_list(comic_id, comic_info, image_paths)
+    Args:
+        entries: [(漫画信息, 页面路径列表)]
 
-        print(f"漫画 {comic_id} 处理完成, 已添加到mock数据")
+    Returns:
+        是否写入成功
+    """
+    try:
+        print(f"开始更新漫画列表，共 {len(entries)} 个漫画")
+
+        items = []
+        for comic_info, image_paths in entries:
+            comic_id = comic_info["id"]
+            chapter = {
+                "id": f"{comic_id}-1",
+                "comicId": comic_id,
+                "title": "第1话",
+                "order": 1,
+                "updateTime": datetime.now().isoformat().split('T')[0],
+                "pageCount": len(image_paths)
+            }
+            items.append((comic_info, [chapter]))
+
+        from app.config.settings import get_settings
+        from app.services.catalog import create_catalog_store
+        catalog_store = create_catalog_store(get_settings())
+        print(f"漫画目录存储: {type(catalog_store).__name__}")
+        catalog_store.upsert_comics(items)
+
+        print(f"{len(entries)} 个漫画已成功添加到漫画列表")
         return True
     except Exception as e:
-        print(f"下载或处理漫画 {comic_id} 时出错: {e}")
+        print(f"更新漫画列表时出错: {e}")
         import traceback
         traceback.print_exc()
         return False
 
-def update_comics_list(comic_id, comic_info, image_paths):
-    """更新漫画列表"""
-    try:
-        print(f"开始更新漫画列表，漫画ID: {comic_id}")
-
-        target_dir = Path(TARGET_DIR)
-        print(f"最终目标目录: {target_dir.absolute()}")
-        target_dir.mkdir(parents=True, exist_ok=True)
-
-        comics_list_path = target_dir / "comics.json"
-        print(f"漫画列表文件路径: {comics_list_path.absolute()}")
-
-        if not comics_list_path.exists():
-            print(f"漫画列表文件不存在，将创建新文件")
-            comics_list = []
-        else:
-            print(f"读取现有漫画列表文件")
-            with open(comics_list_path, "r", encoding="utf-8") as f:
-                comics_list = json.load(f)
-            print(f"读取到 {len(comics_list)} 个漫画")
-
-        comic_exists = False
-        for i, comic in enumerate(comics_list):
-            if comic["id"] == comic_id:
-                print(f"漫画 {comic_id} 已存在，更新信息")
-                comics_list[i] = comic_info
-                comic_exists = True
-                break
-
-        if not comic_exists:
-            print(f"漫画 {comic_id} 不存在，添加到列表")
-            comics_list.append(comic_info)
-
-        print(f"保存更新后的漫画列表，共 {len(comics_list)} 个漫画")
-        with open(comics_list_path, "w", encoding="utf-8") as f:
-            json.dump(comics_list, f, ensure_ascii=False, indent=2)
-
-        chapter = {
-            "id": f"{comic_id}-1",
-            "comicId": comic_id,
-            "title": "第1话",
-            "order": 1,
-            "updateTime": datetime.now().isoformat().split('T')[0],
-            "pageCount": len(image_paths)
-        }
-
-        chapters_path = target_dir / "chapters.json"
-        print(f"章节列表文件路径: {chapters_path.absolute()}")
-
-        if not chapters_path.exists():
-            print(f"章节列表文件不存在，将创建新文件")
-            chapters = []
+def read_comic_ids(args):
+    """命令行参数中的漫画ID, --file指定的文件中每行一个ID, #开头的行为注释"""
+    comic_ids = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--file":
+            with open(args.pop(0), "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.split("#", 1)[0].strip()
+                    if line:
+                        comic_ids.append(line)
         else:
-            print(f"读取现有章节列表文件")
-            with open(chapters_path, "r", encoding="utf-8") as f:
-                chapters = json.load(f)
-            print(f"读取到 {len(chapters)} 个章节")
-
-        chapter_exists = False
-        for i, ch in enumerate(chapters):
-            if ch["id"] == chapter["id"]:
-                print(f"章节 {chapter['id']} 已存在，更新信息")
-                chapters[i] = chapter
-                chapter_exists = True
-                break
-
-        if not chapter_exists:
-            print(f"章节 {chapter['id']} 不存在，添加到列表")
-            chapters.append(chapter)
-
-        print(f"保存更新后的章节列表，共 {len(chapters)} 个章节")
-        with open(chapters_path, "w", encoding="utf-8") as f:
-            json.dump(chapters, f, ensure_ascii=False, indent=2)
-
-        print(f"漫画 {comic_id} 已成功添加到漫画列表")
-    except Exception as e:
-        print(f"更新漫画列表时出错: {e}")
-        import traceback
-        traceback.print_exc()
+            comic_ids.append(arg)
+    # 去重并保持顺序
+    return list(dict.fromkeys(comic_ids))
 
 def main():
-    comic_id = sys.argv[1] if len(sys.argv) > 1 else "416330"
-
-    download_and_process(comic_id)
+    """下载一个或多个漫画
+
+    用法:
+        python download_and_process.py 416330 [漫画ID ...]
+        python download_and_process.py --file ids.txt
+    """
+    comic_ids = read_comic_ids(sys.argv[1:]) or ["416330"]
+
+    # 返回码供下载调度器判断任务是否全部成功
+    failed = download_and_process(comic_ids)
+    print(f"完成 {len(comic_ids) - len(failed)} 个, 失败 {len(failed)} 个")
+    sys.exit(1 if failed else 0)
 
 if __name__ == "__main__":
     main()
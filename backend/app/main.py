@@ -1,22 +1,40 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import subprocess
 from pathlib import Path
-import json
-import os
 from typing import List, Optional, Dict
 from pydantic import BaseModel
-import sys
 
 from app.config.settings import get_settings
 from app.middleware import (
     rate_limit_middleware,
     cache_middleware,
+    cache_store,
+    popularity_middleware,
     security_middleware,
-    static_files_middleware
+    static_files_middleware,
+    StaticImageMiddleware
 )
+from app.services import (
+    catalog_store,
+    search_index,
+    popularity_tracker,
+    catalog_views,
+    response_cache,
+    image_variants,
+    page_store,
+    page_manifests,
+    download_scheduler,
+    broadcaster,
+    change_feed
+)
+from app.services.sorted_views import POPULAR, RELEVANCE, encode_cursor, resolve_page
+from app.services.popularity import CHAPTER_READ
+from app.services.bundles import BundleTooLarge, ChapterBundle, select_pages
 from app.utils.url import get_static_url
+from app.utils.http import etag_in, if_range_matches, parse_range
 
 settings = get_settings()
 
@@ -30,10 +48,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.middleware("http")(rate_limit_middleware)
 app.middleware("http")(cache_middleware)
+# 在缓存中间件外层统计热度, 命中缓存的请求同样计入
+app.middleware("http")(popularity_middleware)
+# 限流在缓存外层, 命中缓存的请求同样消耗令牌, 限流头不会被缓存
+app.middleware("http")(rate_limit_middleware)
 app.middleware("http")(security_middleware)
 app.middleware("http")(static_files_middleware)
+# 最外层: 漫画图片直接从磁盘发送, 不经过上面的HTTP中间件
+app.add_middleware(StaticImageMiddleware, pages=page_store, variants=image_variants)
 
 static_dir = Path(settings.TARGET_DIR)
 print(f"静态文件目录: {static_dir.absolute()}")
@@ -47,6 +70,11 @@ class Page(BaseModel):
     chapterId: str
     order: int
     url: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    bytes: Optional[int] = None
+    hash: Optional[str] = None
+    lqip: Optional[str] = None
 
 class Chapter(BaseModel):
     id: str
@@ -74,75 +102,57 @@ class PaginatedResult(BaseModel):
     page: int
     pageSize: int
     hasMore: bool
+    nextCursor: Optional[str] = None
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: Dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"广播消息时出错: {e}")
-
-manager = ConnectionManager()
+class BatchDownloadRequest(BaseModel):
+    ids: List[str]
 
 api_router = FastAPI()
 
-async def notify_clients(action: str, comic_id: str = None):
-    """通知所有连接的客户端数据已更新"""
-    message = {
-        "action": action,
-        "comic_id": comic_id
-    }
-    await manager.broadcast(message)
-
-def download_comic_task(comic_id: str):
-    """后台任务：下载漫画"""
-    try:
-        print(f"开始下载漫画 {comic_id}...")
-        print(f"下载脚本路径: {download_script.absolute()}")
-
-        if not download_script.exists():
-            print(f"错误: 下载脚本不存在: {download_script.absolute()}")
-            return
-
-        env = os.environ.copy()
-        env["BASE_URL"] = settings.BASE_URL
-        print(f"传递给下载脚本的BASE_URL: {settings.BASE_URL}")
-
-        python_exe = "python" if sys.platform.startswith("win") else "python3"
-        print(f"使用Python解释器: {python_exe}")
-
-        result = subprocess.run(
-            [python_exe, str(download_script.absolute()), comic_id],
-            check=False,
-            capture_output=True,
-            text=True,
-            env=env,
-            cwd=os.path.dirname(download_script)
-        )
-
-        if result.returncode != 0:
-            print(f"下载脚本执行失败，返回码: {result.returncode}")
-            print(f"错误输出: {result.stderr}")
-            print(f"标准输出: {result.stdout}")
-        else:
-            print(f"下载脚本执行成功: {result.stdout}")
-            import asyncio
-            asyncio.run(notify_clients("comic_added", comic_id))
-    except Exception as e:
-        print(f"下载漫画 {comic_id} 时出错: {e}")
-        import traceback
-        traceback.print_exc()
+# 目录变更动作 -> WebSocket消息类型
+CHANGE_MESSAGES = {
+    "add": "comic_added",
+    "update": "comic_updated",
+    "delete": "comic_deleted",
+}
+
+def on_catalog_change(change: Dict):
+    """目录变更后失效相关缓存, 并把带版本号的变更推送给客户端, 可能在工作线程中调用"""
+    cache_store.invalidate_comic(change["comicId"])
+    broadcaster.broadcast({
+        "action": CHANGE_MESSAGES[change["action"]],
+        "comic_id": change["comicId"],
+        "version": change["version"],
+        "change": change
+    })
+
+change_feed.add_listener(on_catalog_change)
+
+async def on_download_progress(job):
+    """推送下载任务的状态与进度, 任务完成后重新加载目录, 由目录变更通知客户端"""
+    broadcaster.broadcast({
+        "action": "download_progress",
+        "comic_id": job.comicId,
+        "job": job.to_dict()
+    })
+    if job.status == "done":
+        await run_in_threadpool(catalog_store.refresh)
+
+download_scheduler.add_listener(on_download_progress)
+
+@app.on_event("startup")
+async def start_services():
+    """启动下载调度器(继续执行上次未完成的下载任务)与热度数据的定期写入"""
+    await download_scheduler.start()
+    popularity_tracker.start()
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    """退出前停止下载调度器、关闭WebSocket连接、写入尚未保存的热度数据, 并关闭图片编码进程池"""
+    await download_scheduler.stop()
+    await broadcaster.close()
+    await popularity_tracker.stop()
+    image_variants.shutdown()
 
 @app.get("/")
 async def root():
@@ -162,94 +172,132 @@ def read_root():
     return {"message": "漫画阅读API"}
 
 @api_router.get("/download/{comic_id}")
-async def download_comic(comic_id: str, background_tasks: BackgroundTasks):
-    """下载漫画API"""
+async def download_comic(comic_id: str):
+    """下载漫画API, 同一漫画重复提交时返回已有的任务"""
     if not comic_id.isdigit() or len(comic_id) != 6:
         raise HTTPException(status_code=400, detail="漫画ID必须是6位数字")
 
     if not download_script.exists():
         raise HTTPException(status_code=500, detail="下载脚本不存在")
 
-    background_tasks.add_task(download_comic_task, comic_id)
+    job = download_scheduler.submit(comic_id)
 
-    return {"message": f"已开始下载漫画 {comic_id}，请稍后刷新页面查看"}
+    return {"message": f"已开始下载漫画 {comic_id}，请稍后刷新页面查看", "jobId": job.id, "status": job.status}
 
 @app.get("/download/{comic_id}")
-async def root_download_comic(comic_id: str, background_tasks: BackgroundTasks):
+async def root_download_comic(comic_id: str):
     """根路径下的下载漫画API, 重定向到/api/download/{comic_id}"""
-    return await download_comic(comic_id, background_tasks)
+    return await download_comic(comic_id)
+
+@api_router.post("/downloads/batch")
+async def batch_download(request: BatchDownloadRequest):
+    """批量下载漫画, 任务按批在同一个下载进程中执行, 每批只写一次漫画目录"""
+    invalid = [comic_id for comic_id in request.ids if not comic_id.isdigit() or len(comic_id) != 6]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"漫画ID必须是6位数字: {', '.join(invalid)}")
+    if not request.ids:
+        raise HTTPException(status_code=400, detail="漫画ID列表不能为空")
+
+    if not download_script.exists():
+        raise HTTPException(status_code=500, detail="下载脚本不存在")
+
+    jobs = download_scheduler.submit_many(request.ids)
+    return {
+        "message": f"已提交 {len(jobs)} 个下载任务",
+        "jobs": [{"jobId": job.id, "comicId": job.comicId, "status": job.status} for job in jobs]
+    }
+
+@api_router.get("/downloads")
+async def list_downloads(status: Optional[str] = None):
+    """下载任务列表, 最新的在前, 可按状态筛选"""
+    jobs = download_scheduler.jobs(status)
+    return {"jobs": [job.to_dict() for job in jobs], "total": len(jobs)}
+
+@api_router.get("/downloads/{job_id}")
+async def get_download(job_id: str):
+    """单个下载任务的状态与进度"""
+    job = download_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到ID为{job_id}的下载任务")
+    return job.to_dict()
+
+@api_router.delete("/downloads/{job_id}")
+async def cancel_download(job_id: str):
+    """取消排队或进行中的下载任务"""
+    if download_scheduler.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"找不到ID为{job_id}的下载任务")
+    if not await download_scheduler.cancel(job_id):
+        raise HTTPException(status_code=409, detail="下载任务已结束")
+    return {"message": "下载任务已取消", "success": True}
 
 @api_router.get("/health")
 def health_check():
     """健康检查"""
     return {"status": "ok"}
 
+@api_router.get("/cache/stats")
+def cache_stats():
+    """响应缓存与图片缓存统计"""
+    stats = cache_store.stats()
+    stats["images"] = image_variants.stats()
+    return stats
+
+def paginated(items: List[Dict], total: int, page: int, pageSize: int, next_cursor: Optional[str]) -> Dict:
+    """与PaginatedResult字段一致的分页结果"""
+    return {
+        "items": items,
+        "total": total,
+        "page": page,
+        "pageSize": pageSize,
+        "hasMore": next_cursor is not None,
+        "nextCursor": next_cursor
+    }
+
+def json_response(content: bytes) -> Response:
+    return Response(content=content, media_type="application/json")
+
 @api_router.get("/comics", response_model=PaginatedResult)
-def get_comics(page: int = 1, pageSize: int = 20):
-    """获取漫画列表"""
+def get_comics(page: int = 1, pageSize: int = 20, sort: str = "default", after: str = ""):
+    """获取漫画列表, 支持page分页与after游标分页"""
     try:
-        comics_file = Path(settings.TARGET_DIR) / "comics.json"
-        if not comics_file.exists():
-            return PaginatedResult(items=[], total=0, page=page, pageSize=pageSize, hasMore=False)
-
-        with open(comics_file, "r", encoding="utf-8") as f:
-            comics = json.load(f)
-
-        for comic in comics:
-            if comic.get("cover") and not comic["cover"].startswith(("http://", "https://")):
-                comic["cover"] = get_static_url(comic["cover"], settings)
-
-        start = (page - 1) * pageSize
-        end = start + pageSize
-        paginated_comics = comics[start:end]
-
-        return PaginatedResult(
-            items=paginated_comics,
-            total=len(comics),
-            page=page,
-            pageSize=pageSize,
-            hasMore=end < len(comics)
-        )
+        sort, cursor_entry, start = resolve_page(sort, (page - 1) * pageSize, after)
+
+        def build():
+            comic_ids, next_cursor = catalog_views.page(sort, start, pageSize, cursor_entry)
+            total = len(catalog_store.list_comics())
+            return paginated(response_cache.comics(comic_ids), total, page, pageSize, next_cursor)
+
+        if after or sort == POPULAR or page > settings.response_cache_pages or pageSize > 100:
+            return build()
+        return json_response(response_cache.get(("comics", sort, page, pageSize), build))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"获取漫画列表出错: {e}")
         return PaginatedResult(items=[], total=0, page=page, pageSize=pageSize, hasMore=False)
 
 @api_router.get("/comics/search", response_model=PaginatedResult)
-def search_comics(keyword: str = "", page: int = 1, pageSize: int = 20):
-    """搜索漫画"""
+def search_comics(keyword: str = "", page: int = 1, pageSize: int = 20, sort: str = "", after: str = ""):
+    """搜索漫画, 有关键词时默认按相关度排序"""
     try:
-        comics_file = Path(settings.TARGET_DIR) / "comics.json"
-        if not comics_file.exists():
-            return PaginatedResult(items=[], total=0, page=page, pageSize=pageSize, hasMore=False)
-
-        with open(comics_file, "r", encoding="utf-8") as f:
-            comics = json.load(f)
-
-        for comic in comics:
-            if comic.get("cover") and not comic["cover"].startswith(("http://", "https://")):
-                comic["cover"] = get_static_url(comic["cover"], settings)
-
-        if keyword:
-            filtered_comics = [
-                c for c in comics
-                if keyword.lower() in c["title"].lower() or
-                   keyword.lower() in c["description"].lower() or
-                   any(keyword.lower() in tag.lower() for tag in c["tags"])
-            ]
+        default_sort = RELEVANCE if keyword else "default"
+        sort, cursor_entry, start = resolve_page(sort or default_sort, (page - 1) * pageSize, after)
+
+        if not keyword:
+            total = len(catalog_store.list_comics())
+            comic_ids, next_cursor = catalog_views.page(sort, start, pageSize, cursor_entry)
+        elif sort == RELEVANCE:
+            total, comic_ids = search_index.search(keyword, start, pageSize)
+            end = start + len(comic_ids)
+            next_cursor = encode_cursor(RELEVANCE, offset=end) if end < total else None
         else:
-            filtered_comics = comics
-
-        start = (page - 1) * pageSize
-        end = start + pageSize
-        paginated_comics = filtered_comics[start:end]
-
-        return PaginatedResult(
-            items=paginated_comics,
-            total=len(filtered_comics),
-            page=page,
-            pageSize=pageSize,
-            hasMore=end < len(filtered_comics)
-        )
+            matched = search_index.match(keyword)
+            total = len(matched)
+            comic_ids, next_cursor = catalog_views.sort_ids(matched, sort, start, pageSize, cursor_entry)
+
+        return paginated(response_cache.comics(comic_ids), total, page, pageSize, next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"搜索漫画出错: {e}")
         return PaginatedResult(items=[], total=0, page=page, pageSize=pageSize, hasMore=False)
@@ -258,84 +306,66 @@ def search_comics(keyword: str = "", page: int = 1, pageSize: int = 20):
 def get_latest_comics(limit: int = 10):
     """获取最新更新的漫画"""
     try:
-        comics_file = Path(settings.TARGET_DIR) / "comics.json"
-        if not comics_file.exists():
-            return []
-
-        with open(comics_file, "r", encoding="utf-8") as f:
-            comics = json.load(f)
-
-        for comic in comics:
-            if comic.get("cover") and not comic["cover"].startswith(("http://", "https://")):
-                comic["cover"] = get_static_url(comic["cover"], settings)
+        def build():
+            comic_ids, _ = catalog_views.page("latest", 0, limit)
+            return response_cache.comics(comic_ids)
 
-        sorted_comics = sorted(
-            comics,
-            key=lambda c: c.get("updateTime", ""),
-            reverse=True
-        )
-
-        return sorted_comics[:limit]
+        if limit > 100:
+            return build()
+        return json_response(response_cache.get(("latest", limit), build))
     except Exception as e:
         print(f"获取最新漫画出错: {e}")
         return []
 
+@api_router.get("/comics/popular", response_model=List[Comic])
+def get_popular_comics(limit: int = 10):
+    """获取热门漫画"""
+    try:
+        comic_ids, _ = catalog_views.page(POPULAR, 0, limit)
+        return response_cache.comics(comic_ids)
+    except Exception as e:
+        print(f"获取热门漫画出错: {e}")
+        return []
+
 @api_router.get("/comics/recommended", response_model=List[Comic])
 def get_recommended_comics(limit: int = 6):
     """获取推荐漫画"""
     try:
-        comics_file = Path(settings.TARGET_DIR) / "comics.json"
-        if not comics_file.exists():
-            return []
-
-        with open(comics_file, "r", encoding="utf-8") as f:
-            comics = json.load(f)
-
-        for comic in comics:
-            if comic.get("cover") and not comic["cover"].startswith(("http://", "https://")):
-                comic["cover"] = get_static_url(comic["cover"], settings)
+        comics = catalog_store.list_comics()
 
         import random
-        shuffled_comics = list(comics)
-        random.shuffle(shuffled_comics)
+        sampled_comics = random.sample(comics, min(max(limit, 0), len(comics)))
 
-        return shuffled_comics[:limit]
+        return response_cache.comics(c["id"] for c in sampled_comics)
     except Exception as e:
         print(f"获取推荐漫画出错: {e}")
         return []
 
+@api_router.get("/comics/changes")
+def get_comic_changes(since: Optional[int] = None):
+    """获取since版本之后的目录变更, 版本过旧时返回reset, 客户端应重新加载全部列表"""
+    catalog_store.refresh()
+    changes = change_feed.since(since)
+    return {
+        "version": change_feed.version,
+        "reset": changes is None,
+        "changes": changes or []
+    }
+
 @api_router.get("/comics/{comic_id}", response_model=Optional[Comic])
 def get_comic_detail(comic_id: str):
     """获取漫画详情"""
     try:
-        comics_file = Path(settings.TARGET_DIR) / "comics.json"
-        if not comics_file.exists():
+        if not catalog_store.has_comic_list():
             raise HTTPException(status_code=404, detail="漫画列表不存在")
 
-        with open(comics_file, "r", encoding="utf-8") as f:
-            comics = json.load(f)
-
-        comic = next((c for c in comics if c["id"] == comic_id), None)
-        if not comic:
+        if not catalog_store.get_comic(comic_id):
             raise HTTPException(status_code=404, detail=f"找不到ID为{comic_id}的漫画")
 
-        if comic.get("cover") and not comic["cover"].startswith(("http://", "https://")):
-            comic["cover"] = get_static_url(comic["cover"], settings)
-
-        chapters_file = Path(settings.TARGET_DIR) / "chapters.json"
-        if chapters_file.exists():
-            with open(chapters_file, "r", encoding="utf-8") as f:
-                all_chapters = json.load(f)
-
-            comic_chapters = [ch for ch in all_chapters if ch["comicId"] == comic_id]
-
-            for chapter in comic_chapters:
-                if chapter.get("cover") and not chapter["cover"].startswith(("http://", "https://")):
-                    chapter["cover"] = get_static_url(chapter["cover"], settings)
-
-            comic["chapters"] = comic_chapters
-
-        return comic
+        return json_response(response_cache.get(
+            ("comic", comic_id),
+            lambda: response_cache.comic_detail(comic_id)
+        ))
     except HTTPException:
         raise
     except Exception as e:
@@ -352,71 +382,109 @@ def get_chapter_pages(chapter_id: str):
 
         comic_id, chapter_order = parts
 
-        chapters_file = Path(settings.TARGET_DIR) / "chapters.json"
-        if not chapters_file.exists():
+        if not catalog_store.has_chapter_list():
             raise HTTPException(status_code=404, detail="章节列表不存在")
 
-        with open(chapters_file, "r", encoding="utf-8") as f:
-            chapters = json.load(f)
-
-        chapter = next((ch for ch in chapters if ch["id"] == chapter_id), None)
+        chapter = catalog_store.get_chapter(chapter_id)
         if not chapter:
             raise HTTPException(status_code=404, detail=f"找不到ID为{chapter_id}的章节")
 
-        page_count = chapter.get("pageCount", 0)
-        pages = []
-
-        for i in range(1, page_count + 1):
-            padded_num = f"{i:05d}"
-            url = get_static_url(f"{comic_id}/{padded_num}.webp", settings)
-
-            pages.append({
-                "id": f"{chapter_id}-{i}",
-                "chapterId": chapter_id,
-                "order": i,
-                "url": url
-            })
-
-        return pages
+        def build():
+            pages = []
+
+            # 以入库时生成的页面清单为准, 只返回磁盘上实际存在的页面
+            for i, page in enumerate(page_manifests.pages(comic_id), 1):
+                pages.append({
+                    "id": f"{chapter_id}-{i}",
+                    "chapterId": chapter_id,
+                    "order": i,
+                    "url": get_static_url(f"{comic_id}/{page['file']}", settings),
+                    "width": page["width"],
+                    "height": page["height"],
+                    "bytes": page["bytes"],
+                    "hash": page["hash"],
+                    "lqip": page["lqip"],
+                })
+
+            return pages
+
+        # 目录版本不随重新入库或清单重建变化, 缓存键带上清单的修改时间
+        key = ("pages", chapter_id, page_manifests.generation(comic_id))
+        return json_response(response_cache.get(key, build))
     except HTTPException:
         raise
     except Exception as e:
         print(f"获取章节页面出错: {e}")
         raise HTTPException(status_code=500, detail=f"获取章节页面出错: {str(e)}")
 
+@api_router.get("/bundles/{chapter_id}")
+def get_chapter_bundle(chapter_id: str, request: Request, format: str = "zip", start: int = 1, end: int = 0):
+    """把章节(或start到end页)打包为一个响应, 支持Range断点续传"""
+    chapter = catalog_store.get_chapter(chapter_id)
+    if not chapter:
+        raise HTTPException(status_code=404, detail=f"找不到ID为{chapter_id}的章节")
+
+    comic_id = chapter["comicId"]
+    try:
+        pages = select_pages(page_manifests.pages(comic_id, verify=True), start, end)
+        if not pages:
+            raise HTTPException(status_code=404, detail=f"章节{chapter_id}在该范围内没有页面")
+        bundle = ChapterBundle(pages, lambda name: page_store.locate(comic_id, name), format)
+    except BundleTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {
+        "ETag": bundle.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f'attachment; filename="{chapter_id}.{bundle.format}"',
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_in(if_none_match, bundle.etag):
+        return Response(status_code=304, headers=headers)
+
+    status_code, first, last = 200, 0, bundle.size - 1
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and bundle.size and (not if_range or if_range_matches(if_range, bundle.etag)):
+        try:
+            byte_range = parse_range(range_header, bundle.size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{bundle.size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            status_code, (first, last) = 206, byte_range
+            headers["Content-Range"] = f"bytes {first}-{last}/{bundle.size}"
+
+    # 只有完整下载计入热度, 断点续传的Range请求与304不重复计数
+    if status_code == 200:
+        popularity_tracker.record(comic_id, CHAPTER_READ)
+
+    headers["Content-Length"] = str(last - first + 1)
+    return StreamingResponse(
+        bundle.iter_range(first, last),
+        status_code=status_code,
+        media_type=bundle.media_type,
+        headers=headers
+    )
+
 @api_router.delete("/comics/{comic_id}")
 async def delete_comic(comic_id: str):
     """删除漫画"""
     try:
-        comics_file = Path(settings.TARGET_DIR) / "comics.json"
-        if not comics_file.exists():
+        if not catalog_store.has_comic_list():
             raise HTTPException(status_code=404, detail="漫画列表不存在")
 
-        with open(comics_file, "r", encoding="utf-8") as f:
-            comics = json.load(f)
-
-        comics = [c for c in comics if c["id"] != comic_id]
-
-        with open(comics_file, "w", encoding="utf-8") as f:
-            json.dump(comics, f, ensure_ascii=False, indent=2)
-
-        chapters_file = Path(settings.TARGET_DIR) / "chapters.json"
-        if chapters_file.exists():
-            with open(chapters_file, "r", encoding="utf-8") as f:
-                chapters = json.load(f)
-
-            chapters = [ch for ch in chapters if ch["comicId"] != comic_id]
-
-            with open(chapters_file, "w", encoding="utf-8") as f:
-                json.dump(chapters, f, ensure_ascii=False, indent=2)
+        catalog_store.delete_comic(comic_id)
 
         comic_dir = Path(settings.TARGET_DIR) / comic_id
         if comic_dir.exists():
             import shutil
             shutil.rmtree(comic_dir)
 
-        await notify_clients("comic_deleted", comic_id)
-
         return {"message": f"漫画 {comic_id} 已成功删除"}
     except HTTPException:
         raise
@@ -426,19 +494,7 @@ async def delete_comic(comic_id: str):
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    try:
-        await manager.connect(websocket)
-        print(f"WebSocket客户端已连接")
-        try:
-            while True:
-                data = await websocket.receive_text()
-                print(f"收到WebSocket消息: {data}")
-        except WebSocketDisconnect:
-            manager.disconnect(websocket)
-            print(f"WebSocket客户端已断开连接")
-    except Exception as e:
-        print(f"WebSocket处理出错: {e}")
-        if websocket in manager.active_connections:
-            manager.disconnect(websocket)
+    """推送漫画与下载任务的变更, 见services.broadcaster"""
+    await broadcaster.serve(websocket)
 
 app.mount("/api", api_router)
@@ -1,11 +1,16 @@
 from app.middleware.rate_limit import rate_limit_middleware
-from app.middleware.cache import cache_middleware
+from app.middleware.cache import cache_middleware, cache_store
+from app.middleware.popularity import popularity_middleware
 from app.middleware.security import security_middleware
 from app.middleware.static_files import static_files_middleware
+from app.middleware.static_images import StaticImageMiddleware
 
 __all__ = [
     "rate_limit_middleware",
     "cache_middleware",
+    "cache_store",
+    "popularity_middleware",
     "security_middleware",
-    "static_files_middleware"
+    "static_files_middleware",
+    "StaticImageMiddleware"
 ]
\ No newline at end of file
@@ -1,14 +1,210 @@
 from fastapi import Request, Response
+import asyncio
 import hashlib
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import threading
 import time
 import logging
 from app.config.settings import get_settings
+from app.utils.compression import choose_encoding, compress_variants
+from app.utils.http import etag_in
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-cache_store: Dict[str, Any] = {}
+# 漫画变更后需要失效的列表类接口
+LISTING_PATHS = (
+    "/api/comics",
+    "/api/comics/search",
+    "/api/comics/latest",
+    "/api/comics/popular",
+    "/api/comics/recommended",
+)
+
+
+class LRUResponseCache:
+    """按字节预算限制大小的LRU响应缓存"""
+
+    def __init__(self, max_bytes: int, default_ttl: int, route_ttls: Optional[Dict[str, int]] = None,
+                 stale_ttl: int = 0):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # 过期后仍可在重新计算期间返回给并发请求的时间
+        self.stale_ttl = stale_ttl
+        # 按前缀长度降序, 最长前缀优先匹配
+        self.route_ttls = sorted((route_ttls or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+
+    def ttl_for(self, path: str) -> int:
+        """路由对应的TTL, 0表示不缓存"""
+        for prefix, ttl in self.route_ttls:
+            if path.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """查找缓存
+
+        Returns:
+            (缓存条目, 是否未过期), 已过期但仍在stale_ttl内的条目也会返回
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            age = now - entry["timestamp"]
+            if age < entry["ttl"]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, True
+            self.misses += 1
+            if age < entry["ttl"] + self.stale_ttl:
+                return entry, False
+            self._remove(key)
+            return None, False
+
+    def set(self, key: str, path: str, content: bytes, headers: Dict[str, str], ttl: int):
+        """写入缓存, 返回带ETag与预压缩版本的缓存条目"""
+        # 限流头属于单个客户端的单次请求, 不能随缓存返回给其他请求
+        headers = {
+            k: v for k, v in headers.items()
+            if k.lower() != "content-length" and not k.lower().startswith("x-ratelimit-")
+        }
+        headers.setdefault("cache-control", "no-cache")
+
+        # 每种编码是不同的表示, 各自使用独立的强ETag
+        etag = make_etag(content)
+        representations = {None: (content, etag)}
+        if settings.compression_enabled:
+            for encoding, body in compress_variants(content, settings.compression_min_size).items():
+                representations[encoding] = (body, f'{etag[:-1]}-{encoding}"')
+
+        size = len(key) + sum(len(k) + len(v) for k, v in headers.items())
+        size += sum(len(body) for body, _ in representations.values())
+        entry = {
+            "path": path,
+            "representations": representations,
+            "headers": headers,
+            "timestamp": time.time(),
+            "ttl": ttl,
+            "size": size,
+        }
+        if size > self.max_bytes:
+            return entry
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry["size"]
+
+    def invalidate_comic(self, comic_id: Optional[str] = None):
+        """漫画新增或删除后, 失效列表接口以及该漫画的详情与章节缓存"""
+        paths = set(LISTING_PATHS)
+        chapter_prefix = ()
+        if comic_id:
+            paths.add(f"/api/comics/{comic_id}")
+            chapter_prefix = f"/api/chapters/{comic_id}-"
+
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry["path"] in paths or entry["path"].startswith(chapter_prefix)
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+        logger.debug(f"漫画 {comic_id} 变更, 失效 {len(stale)} 条缓存")
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "coalesced": self.coalesced,
+                "staleHits": self.stale_hits,
+            }
+
+
+def make_etag(content: bytes) -> str:
+    """根据响应内容生成强ETag"""
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match是否与etag匹配(按RFC 7232使用弱比较)"""
+    header = request.headers.get("if-none-match")
+    return bool(header) and etag_in(header, etag)
+
+def cached_response(request: Request, entry: Dict[str, Any]) -> Response:
+    """按Accept-Encoding选择表示; 客户端已有相同内容时返回304, 否则返回完整内容"""
+    representations = entry["representations"]
+    encoding = choose_encoding(
+        request.headers.get("accept-encoding"),
+        [e for e in representations if e is not None]
+    )
+    content, etag = representations[encoding]
+
+    headers = dict(entry["headers"])
+    headers["etag"] = etag
+    if len(representations) > 1:
+        headers["vary"] = "Accept-Encoding"
+
+    if etag_matches(request, etag):
+        not_modified = {k: headers[k] for k in ("etag", "cache-control", "vary") if k in headers}
+        return Response(status_code=304, headers=not_modified)
+
+    if encoding is not None:
+        headers["content-encoding"] = encoding
+    return Response(
+        content=content,
+        media_type=headers.get("content-type", "application/json"),
+        headers=headers
+    )
+
+cache_store = LRUResponseCache(
+    settings.cache_max_bytes,
+    settings.cache_ttl,
+    settings.cache_route_ttls,
+    stale_ttl=settings.cache_stale_ttl
+)
+
+# 正在计算中的缓存键 -> 计算完成后的缓存条目(非200响应时为None)
+inflight_requests: Dict[str, "asyncio.Future[Optional[Dict[str, Any]]]"] = {}
+
 
 def get_cache_key(request: Request) -> str:
     """生成缓存键"""
@@ -23,37 +219,50 @@ async def cache_middleware(request: Request, call_next):
     if request.method != "GET":
         return await call_next(request)
 
+    path = request.url.path
+    ttl = cache_store.ttl_for(path)
+    if request.query_params.get("sort") == "popular":
+        ttl = min(ttl, settings.cache_popular_ttl)
+    if ttl <= 0:
+        return await call_next(request)
+
     cache_key = get_cache_key(request)
-    current_time = time.time()
-
-    if cache_key in cache_store:
-        cached_data = cache_store[cache_key]
-        if current_time - cached_data["timestamp"] < settings.cache_ttl:
-            logger.debug(f"从缓存返回数据: {cache_key}")
-            return Response(
-                content=cached_data["content"],
-                media_type="application/json",
-                headers=cached_data["headers"]
-            )
-
-    response = await call_next(request)
-
-    if response.status_code == 200:
-        response_body = b""
-        async for chunk in response.body_iterator:
-            response_body += chunk
-
-        cache_store[cache_key] = {
-            "content": response_body,
-            "headers": dict(response.headers),
-            "timestamp": current_time
-        }
 
-        return Response(
-            content=response_body,
-            media_type=response.media_type,
-            headers=dict(response.headers),
-            status_code=response.status_code
-        )
+    cached_data, fresh = cache_store.get(cache_key)
+    if cached_data is not None and fresh:
+        logger.debug(f"从缓存返回数据: {cache_key}")
+        return cached_response(request, cached_data)
+
+    inflight = inflight_requests.get(cache_key)
+    if inflight is not None:
+        # 相同请求正在计算: 有过期数据时先返回过期数据, 否则等待其结果
+        if cached_data is not None:
+            cache_store.stale_hits += 1
+            return cached_response(request, cached_data)
+
+        entry = await asyncio.shield(inflight)
+        if entry is not None:
+            cache_store.coalesced += 1
+            return cached_response(request, entry)
+        return await call_next(request)
+
+    future = asyncio.get_running_loop().create_future()
+    inflight_requests[cache_key] = future
+    try:
+        response = await call_next(request)
+
+        if response.status_code == 200:
+            response_body = b""
+            async for chunk in response.body_iterator:
+                response_body += chunk
+
+            entry = cache_store.set(cache_key, path, response_body, dict(response.headers), ttl)
+            future.set_result(entry)
+            return cached_response(request, entry)
 
-    return response
\ No newline at end of file
+        return response
+    finally:
+        if inflight_requests.get(cache_key) is future:
+            del inflight_requests[cache_key]
+        if not future.done():
+            future.set_result(None)
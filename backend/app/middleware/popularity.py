@@ -0,0 +1,34 @@
+from fastapi import Request
+import re
+import logging
+from app.services import popularity_tracker
+from app.services.popularity import DETAIL_VIEW, CHAPTER_READ
+
+logger = logging.getLogger(__name__)
+
+COMIC_DETAIL_PATH = re.compile(r"^/api/comics/([^/]+)$")
+CHAPTER_PAGES_PATH = re.compile(r"^/api/chapters/([^/-]+)-[^/-]+/pages$")
+# /api/comics/下不是漫画详情的接口
+LISTING_NAMES = {"search", "latest", "popular", "recommended", "changes"}
+
+
+def popularity_weight(path: str):
+    """请求对应的(漫画ID, 热度权重), 不计入热度时为None"""
+    match = COMIC_DETAIL_PATH.match(path)
+    if match and match.group(1) not in LISTING_NAMES:
+        return match.group(1), DETAIL_VIEW
+    match = CHAPTER_PAGES_PATH.match(path)
+    if match:
+        return match.group(1), CHAPTER_READ
+    return None
+
+async def popularity_middleware(request: Request, call_next):
+    """热度统计中间件, 位于缓存中间件外层, 命中缓存的详情与章节请求同样计入热度"""
+    response = await call_next(request)
+    if request.method != "GET" or response.status_code not in (200, 304):
+        return response
+
+    target = popularity_weight(request.url.path)
+    if target is not None:
+        popularity_tracker.record(*target)
+    return response
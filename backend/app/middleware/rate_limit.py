@@ -1,35 +1,133 @@
 from fastapi import Request
 from fastapi.responses import JSONResponse
+import math
 import time
-from collections import defaultdict
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 import logging
 from app.config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-request_counts = defaultdict(list)
+
+class TokenBucketLimiter:
+    """按(客户端, 路由前缀)计数的令牌桶限流器
+
+    每个桶只保存剩余令牌数与上次更新时间, 每次请求O(1);
+    桶按最近使用顺序排列, 定期从头部清理长时间空闲的客户端。
+    """
+
+    def __init__(self, default_rate: int, route_rates: Optional[Dict[str, int]] = None, idle_ttl: float = 300):
+        self.default_rate = default_rate
+        # 按前缀长度降序, 最长前缀优先匹配
+        self.route_rates = sorted((route_rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.idle_ttl = idle_ttl
+
+        self._lock = threading.Lock()
+        # (客户端, 路由前缀) -> [剩余令牌数, 上次更新时间]
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+
+    def route_for(self, path: str) -> Tuple[str, int]:
+        """路由前缀及其每分钟请求数, 0表示不限流"""
+        for prefix, rate in self.route_rates:
+            if path.startswith(prefix):
+                return prefix, rate
+        return "", self.default_rate
+
+    def acquire(self, client: str, path: str) -> Tuple[bool, int, int, float]:
+        """尝试消耗一个令牌
+
+        Returns:
+            (是否允许, 桶容量, 剩余令牌数, 需要等待的秒数)
+        """
+        prefix, capacity = self.route_for(path)
+        if capacity <= 0:
+            return True, 0, 0, 0.0
+
+        refill = capacity / 60.0
+        now = time.monotonic()
+        key = (client, prefix)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(capacity), now]
+                self._buckets[key] = bucket
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+
+            allowed = bucket[0] >= 1.0
+            if allowed:
+                bucket[0] -= 1.0
+            tokens = bucket[0]
+
+            if now - self._last_sweep >= self.idle_ttl:
+                self._sweep(now)
+
+        wait = 0.0 if allowed else (1.0 - tokens) / refill
+        return allowed, capacity, int(tokens), wait
+
+    def reset_after(self, capacity: int, remaining: int) -> int:
+        """令牌补满所需的秒数"""
+        if capacity <= 0:
+            return 0
+        return math.ceil((capacity - remaining) * 60.0 / capacity)
+
+    def _sweep(self, now: float):
+        """清理空闲超过idle_ttl的桶, 空闲期间令牌早已补满, 删除不影响限流结果"""
+        removed = 0
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self.idle_ttl:
+                break
+            del self._buckets[key]
+            removed += 1
+        self._last_sweep = now
+        if removed:
+            logger.debug(f"清理 {removed} 个空闲限流桶")
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+rate_limiter = TokenBucketLimiter(
+    settings.rate_limit_requests,
+    settings.rate_limit_routes,
+    idle_ttl=settings.rate_limit_idle_ttl
+)
 
 async def rate_limit_middleware(request: Request, call_next):
     """限流中间件"""
     if not settings.rate_limit_enabled:
         return await call_next(request)
 
-    client_ip = request.client.host
-    current_time = time.time()
+    client_ip = request.client.host if request.client else "unknown"
+    allowed, limit, remaining, wait = rate_limiter.acquire(client_ip, request.url.path)
+    if limit <= 0:
+        return await call_next(request)
 
-    request_counts[client_ip] = [t for t in request_counts[client_ip] if current_time - t < 60]
+    headers = {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(rate_limiter.reset_after(limit, remaining)),
+    }
 
-    if len(request_counts[client_ip]) >= settings.rate_limit_requests:
+    if not allowed:
         logger.warning(f"IP {client_ip} 请求频率超过限制")
+        headers["Retry-After"] = str(max(math.ceil(wait), 1))
         return JSONResponse(
             status_code=429,
             content={
                 "message": "请求频率过高，请稍后再试",
                 "success": False
-            }
+            },
+            headers=headers
         )
 
-    request_counts[client_ip].append(current_time)
-
-    return await call_next(request)
\ No newline at end of file
+    response = await call_next(request)
+    response.headers.update(headers)
+    return response
@@ -1,14 +1,51 @@
 """静态文件中间件"""
 import logging
+from pathlib import Path
 from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse
 from app.config.settings import get_settings
+from app.utils.compression import find_sidecar
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+static_root = Path(settings.TARGET_DIR).resolve()
+
+def precompressed_response(request: Request):
+    """/static下的.json文件存在预压缩版本且客户端接受时, 直接返回预压缩文件"""
+    if request.method != "GET" or not request.url.path.endswith(".json"):
+        return None
+
+    relative = request.url.path[len(settings.STATIC_PATH):].lstrip("/")
+    path = (static_root / relative).resolve()
+    if static_root not in path.parents:
+        return None
+
+    found = find_sidecar(path, request.headers.get("accept-encoding"))
+    if found is None:
+        return None
+
+    sidecar, encoding = found
+    return FileResponse(
+        sidecar,
+        media_type="application/json",
+        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    )
+
+def is_hidden(path: str) -> bool:
+    """/static下以.开头的文件或目录(锁文件、临时文件、旧版本的下载工作区等)不对外提供"""
+    relative = path[len(settings.STATIC_PATH):]
+    return any(part.startswith(".") for part in relative.split("/") if part)
+
 async def static_files_middleware(request: Request, call_next):
     """处理静态文件的中间件，添加适当的响应头"""
-    response = await call_next(request)
+    response = None
+    if request.url.path.startswith(settings.STATIC_PATH):
+        if is_hidden(request.url.path):
+            return JSONResponse(status_code=404, content={"detail": "Not Found"})
+        response = precompressed_response(request)
+    if response is None:
+        response = await call_next(request)
 
     if request.url.path.startswith(settings.STATIC_PATH):
         logger.debug(f"处理静态文件请求: {request.url.path}")
@@ -19,7 +56,7 @@ async def static_files_middleware(request: Request, call_next):
         response.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
         response.headers["Access-Control-Allow-Headers"] = "*"
 
-        if "content-type" not in response.headers:
+        if response.status_code != 304 and "content-type" not in response.headers:
             path = request.url.path.lower()
             if path.endswith(".jpg") or path.endswith(".jpeg"):
                 response.headers["content-type"] = "image/jpeg"
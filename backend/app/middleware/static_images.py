@@ -0,0 +1,192 @@
+"""漫画图片的快速静态文件通道
+
+/static/{comic_id}/{page}.webp 等页面图片占了绝大部分流量, 这里用一个
+ASGI中间件在最外层直接处理, 不经过缓存、限流等HTTP中间件。
+带?w=参数时返回缩放版本(见ImageVariantService); 页面可以是散文件, 也可以位于打包文件中(见PageStore)。
+支持Range请求与ETag/Last-Modified条件请求; 服务器支持ASGI
+http.response.zerocopy扩展时交给服务器用sendfile发送, 否则在线程池中pread分块发送。
+"""
+import logging
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import parse_qsl
+from typing import BinaryIO, List, Optional, Tuple
+
+import anyio
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config.settings import get_settings
+from app.services.page_pack import PageLocation, PageStore
+from app.utils.http import etag_in, if_range_matches, parse_range
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+IMAGE_TYPES = {
+    ".webp": "image/webp",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+}
+
+CHUNK_SIZE = 256 * 1024
+
+# 与static_files_middleware保持一致的缓存时间
+CACHE_CONTROL = "public, max-age=86400"
+
+
+def make_file_etag(st: os.stat_result, offset: int = 0, size: Optional[int] = None) -> str:
+    """根据修改时间与文件大小生成ETag, 打包文件中的页面还包括偏移量"""
+    if size is None or (offset == 0 and size == st.st_size):
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    return f'"{st.st_mtime_ns:x}-{offset:x}-{size:x}"'
+
+
+def not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+def read_at(fd: int, size: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)  # Windows
+    return os.read(fd, size)
+
+
+class StaticImageMiddleware:
+    """直接发送漫画图片的ASGI中间件, 其余请求交给内层应用"""
+
+    def __init__(self, app: ASGIApp, root: Optional[str] = None, prefix: Optional[str] = None,
+                 pages: Optional[PageStore] = None, variants=None):
+        self.app = app
+        self.root = Path(root or settings.TARGET_DIR).resolve()
+        # 定位打包文件或散文件中的页面
+        self.pages = pages or PageStore(str(self.root))
+        # ImageVariantService, 处理?w=缩放参数
+        self.variants = variants
+        prefix = (prefix or settings.STATIC_PATH).rstrip("/")
+        extensions = "|".join(ext[1:] for ext in IMAGE_TYPES)
+        self.pattern = re.compile(
+            rf"^{re.escape(prefix)}/([^/.][^/]*)/([^/.][^/]*\.(?:{extensions}))$", re.IGNORECASE
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        match = self.pattern.match(scope["path"])
+        location = self.pages.locate(*match.groups()) if match else None
+        if location is None:
+            await self.app(scope, receive, send)
+            return
+
+        width = self.requested_width(scope)
+        if width and self.variants is not None:
+            variant = await self.variants.variant(location, width)
+            if variant is not None:
+                location = PageLocation(variant.name, variant)
+
+        try:
+            file = open(location.path, "rb", buffering=0)
+        except OSError:
+            await self.app(scope, receive, send)
+            return
+        with file:
+            st = os.fstat(file.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                await self.app(scope, receive, send)
+                return
+            media_type = IMAGE_TYPES[Path(location.name).suffix.lower()]
+            await self.send_file(scope, send, file, st, media_type, location.offset, location.length)
+
+    @staticmethod
+    def requested_width(scope: Scope) -> Optional[int]:
+        """查询参数中的w, 缺失或无效时为None"""
+        query = scope.get("query_string", b"")
+        if b"w=" not in query:
+            return None
+        for key, value in parse_qsl(query.decode("latin-1")):
+            if key == "w":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    async def send_file(self, scope: Scope, send: Send, file: BinaryIO, st: os.stat_result, media_type: str,
+                        base: int = 0, size: Optional[int] = None):
+        """发送文件中从base开始、长度为size的一段, size为None时发送整个文件"""
+        request_headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        size = st.st_size if size is None else size
+        etag = make_file_etag(st, base, size)
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        headers = [
+            (b"content-type", media_type.encode()),
+            (b"etag", etag.encode()),
+            (b"last-modified", last_modified.encode()),
+            (b"cache-control", CACHE_CONTROL.encode()),
+            (b"accept-ranges", b"bytes"),
+            (b"access-control-allow-origin", b"*"),
+            (b"x-content-type-options", b"nosniff"),
+        ]
+
+        if_none_match = request_headers.get("if-none-match")
+        if_modified_since = request_headers.get("if-modified-since")
+        if (if_none_match and etag_in(if_none_match, etag)) or \
+                (not if_none_match and if_modified_since and not_modified_since(if_modified_since, st.st_mtime)):
+            await self.start(send, 304, headers)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        status, start, end = 200, 0, size - 1
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and size and (not if_range or if_range_matches(if_range, etag, last_modified)):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                headers.append((b"content-range", f"bytes */{size}".encode()))
+                await self.start(send, 416, headers + [(b"content-length", b"0")])
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if byte_range is not None:
+                status, (start, end) = 206, byte_range
+                headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode()))
+
+        length = end - start + 1 if size else 0
+        headers.append((b"content-length", str(length).encode()))
+        await self.start(send, status, headers)
+
+        if scope["method"] == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            await send({"type": "http.response.zerocopy", "file": file, "offset": base + start, "count": length})
+            return
+
+        fd = file.fileno()
+        offset, remaining = base + start, length
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(read_at, fd, min(CHUNK_SIZE, remaining), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # 发送过程中文件被截断
+            await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def start(send: Send, status: int, headers: List[Tuple[bytes, bytes]]):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
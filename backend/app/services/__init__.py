@@ -1,6 +1,74 @@
-from app.services.local_comic_service import LocalComicService
+"""API使用的服务实例
 
-# 创建服务实例
-local_comic_service = LocalComicService()
+实例在首次访问(如 from app.services import catalog_store)时一次性全部创建;
+只导入某个服务模块(下载脚本、命令行工具)时不会创建整个服务图。
+"""
+import threading
 
-__all__ = ["local_comic_service"] 
\ No newline at end of file
+from app.config.settings import get_settings
+
+_lock = threading.Lock()
+_built = False
+
+
+def _build():
+    """按依赖顺序创建全部服务实例, 注册目录监听器的顺序与之前保持一致"""
+    from app.services.catalog import create_catalog_store
+    from app.services.search_index import SearchIndex
+    from app.services.popularity import PopularityTracker
+    from app.services.sorted_views import CatalogViews
+    from app.services.responses import ResponseCache
+    from app.services.image_variants import create_image_variant_service
+    from app.services.page_manifest import ManifestStore
+    from app.services.page_pack import PageStore
+    from app.services.downloads import create_download_scheduler
+    from app.services.local_comic_service import LocalComicService
+    from app.services.broadcaster import Broadcaster
+    from app.services.change_feed import ChangeFeed
+    from app.config.settings import state_path
+
+    settings = get_settings()
+
+    catalog_store = create_catalog_store(settings)
+    search_index = SearchIndex(catalog_store)
+    popularity_tracker = PopularityTracker(
+        state_path(settings, "popularity.json"),
+        half_life=settings.popularity_half_life,
+        flush_interval=settings.popularity_flush_interval,
+        catalog=catalog_store
+    )
+    catalog_views = CatalogViews(catalog_store, popularity_tracker)
+    response_cache = ResponseCache(catalog_store, settings)
+    # 在response_cache之后注册, 变更记录中的漫画数据与列表接口一致
+    change_feed = ChangeFeed(catalog_store, response_cache.comic, settings.catalog_change_log_size)
+    image_variants = create_image_variant_service(settings)
+    page_store = PageStore(settings.TARGET_DIR)
+    page_manifests = ManifestStore(settings.TARGET_DIR, page_store)
+    download_scheduler = create_download_scheduler(settings)
+    local_comic_service = LocalComicService(catalog_store, search_index, catalog_views, download_scheduler)
+    broadcaster = Broadcaster(
+        queue_size=settings.ws_queue_size,
+        heartbeat_interval=settings.ws_heartbeat_interval,
+        send_timeout=settings.ws_send_timeout
+    )
+
+    instances = locals()
+    globals().update({name: instances[name] for name in __all__})
+
+
+def __getattr__(name):
+    global _built
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lock:
+        if not _built:
+            _build()
+            _built = True
+    return globals()[name]
+
+
+__all__ = [
+    "catalog_store", "search_index", "popularity_tracker", "catalog_views",
+    "response_cache", "change_feed", "image_variants", "page_store", "page_manifests",
+    "download_scheduler", "local_comic_service", "broadcaster"
+]
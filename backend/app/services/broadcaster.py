@@ -0,0 +1,156 @@
+"""WebSocket消息广播
+
+每条消息只序列化一次, 然后放入每个连接各自的有界发送队列, 由该连接独立的写任务发送,
+一个慢速客户端不会拖慢其他客户端。队列写满的客户端会被断开(客户端会自动重连并重新加载)。
+broadcast可以在任意线程中调用, 消息总是交给事件循环处理。
+
+写任务定期发送{"action": "ping"}心跳; 回复过pong的客户端超过两个心跳周期没有任何消息时
+视为已断开, 发送超时的连接同样会被断开。
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+PING = json.dumps({"action": "ping"})
+PONG_ACTION = "pong"
+
+# 关闭码: 1008 违反策略(发送过慢), 1001 服务端关闭或对端无响应
+CLOSE_SLOW_CONSUMER = 1008
+CLOSE_GOING_AWAY = 1001
+
+
+class ClientConnection:
+    """一个WebSocket连接及其发送队列"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=queue_size)
+        self.last_seen = time.monotonic()
+        self.last_ping = time.monotonic()
+        # 客户端是否回复过心跳, 旧版客户端不回复, 只依靠发送超时检测
+        self.answers_ping = False
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+
+
+class Broadcaster:
+    """向全部WebSocket客户端并发推送消息"""
+
+    def __init__(self, queue_size: int = 64, heartbeat_interval: float = 30.0, send_timeout: float = 10.0):
+        self.queue_size = queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self.send_timeout = send_timeout
+        self._clients: Set[ClientConnection] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dropped = 0
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    async def serve(self, websocket: WebSocket):
+        """接受连接并读取客户端消息, 直到连接断开"""
+        await websocket.accept()
+        self._loop = asyncio.get_running_loop()
+        client = ClientConnection(websocket, self.queue_size)
+        self._clients.add(client)
+        client.writer = asyncio.create_task(self._write(client))
+        logger.info(f"WebSocket客户端已连接, 当前 {len(self._clients)} 个")
+        try:
+            while not client.closed:
+                try:
+                    # 对端无响应时连接被写任务关闭, 读取不会返回, 定期检查一次
+                    text = await asyncio.wait_for(websocket.receive_text(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    continue
+                client.last_seen = time.monotonic()
+                if self._is_pong(text):
+                    client.answers_ping = True
+                    continue
+                logger.debug(f"收到WebSocket消息: {text}")
+        except WebSocketDisconnect:
+            pass
+        except RuntimeError:
+            # 连接已被写任务关闭
+            pass
+        finally:
+            await self._close(client)
+            logger.info(f"WebSocket客户端已断开, 当前 {len(self._clients)} 个")
+
+    @staticmethod
+    def _is_pong(text: str) -> bool:
+        try:
+            return json.loads(text).get("action") == PONG_ACTION
+        except (ValueError, AttributeError):
+            return False
+
+    def broadcast(self, message: Dict):
+        """推送消息给全部客户端, 可以在任意线程中调用, 不等待发送完成"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        text = json.dumps(message, ensure_ascii=False)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._enqueue(text)
+        else:
+            loop.call_soon_threadsafe(self._enqueue, text)
+
+    def _enqueue(self, text: str):
+        for client in list(self._clients):
+            try:
+                client.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                logger.warning("WebSocket客户端接收过慢, 已断开")
+                self.dropped += 1
+                self._clients.discard(client)
+                asyncio.get_running_loop().create_task(self._close(client, CLOSE_SLOW_CONSUMER))
+
+    async def _write(self, client: ClientConnection):
+        try:
+            while True:
+                timeout = client.last_ping + self.heartbeat_interval - time.monotonic()
+                try:
+                    text = await asyncio.wait_for(client.queue.get(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    if client.answers_ping and time.monotonic() - client.last_seen > 2 * self.heartbeat_interval:
+                        logger.info("WebSocket客户端心跳超时, 已断开")
+                        break
+                    client.last_ping = time.monotonic()
+                    text = PING
+                await asyncio.wait_for(client.websocket.send_text(text), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            return
+        except asyncio.TimeoutError:
+            logger.info("WebSocket发送超时, 已断开")
+        except Exception as e:
+            logger.info(f"WebSocket发送失败, 已断开: {e}")
+        # 写任务自身结束时关闭连接, 读取循环随之退出
+        self._clients.discard(client)
+        asyncio.get_running_loop().create_task(self._close(client, CLOSE_GOING_AWAY))
+
+    async def _close(self, client: ClientConnection, code: int = CLOSE_GOING_AWAY):
+        self._clients.discard(client)
+        if client.closed:
+            return
+        client.closed = True
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        try:
+            await client.websocket.close(code=code)
+        except Exception:
+            # 连接已经断开
+            pass
+
+    async def close(self):
+        """关闭全部连接, 服务退出时调用"""
+        await asyncio.gather(*(self._close(client) for client in list(self._clients)), return_exceptions=True)
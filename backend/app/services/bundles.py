@@ -0,0 +1,160 @@
+"""章节打包下载
+
+把一个章节(或其中一段页面)作为单个响应流式返回, 供前端离线缓存或预取。
+支持两种格式:
+    zip: 不压缩(stored)的zip文件, 可直接解压
+    stream: 简单的长度前缀格式, 每页依次为
+            [2字节文件名长度][文件名][4字节数据长度][图片数据], 整数均为大端序
+
+每页的大小与CRC32来自页面清单, 整个响应的字节布局在发送前就能确定,
+因此可以给出Content-Length并支持Range断点续传; 图片内容在发送时才从磁盘读取。
+"""
+import hashlib
+import struct
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.services.page_pack import PageLocation
+
+ZIP = "zip"
+STREAM = "stream"
+FORMATS = {
+    ZIP: "application/zip",
+    STREAM: "application/octet-stream",
+}
+
+CHUNK_SIZE = 256 * 1024
+# 不使用ZIP64时zip的大小与文件数上限
+ZIP_MAX_SIZE = 0xFFFFFFFF
+ZIP_MAX_ENTRIES = 0xFFFF
+
+# 固定的文件时间(1980-01-01 00:00), 保证相同内容的打包结果逐字节一致
+_DOS_TIME = 0
+_DOS_DATE = (1 << 5) | 1
+# 文件名使用UTF-8编码
+_UTF8_FLAG = 0x0800
+
+
+class BundleTooLarge(ValueError):
+    """打包结果超出zip格式的限制"""
+
+
+class ChapterBundle:
+    """按需生成的章节打包文件
+
+    字节布局由若干段组成, 每段要么是内存中的头部数据, 要么是磁盘上的一张图片。
+    """
+
+    def __init__(self, pages: List[Dict], locate: Callable[[str], Optional[PageLocation]], fmt: str = ZIP):
+        """
+        Args:
+            pages: 页面清单中的页面
+            locate: 文件名 -> 页面数据位置(散文件或打包文件)
+
+        Raises:
+            ValueError: 格式无效或页面缺失
+            BundleTooLarge: zip超过4GB或65535个文件
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的打包格式: {fmt}")
+        if fmt == ZIP and len(pages) > ZIP_MAX_ENTRIES:
+            raise BundleTooLarge("页面过多, 无法打包为zip, 请使用stream格式或缩小页面范围")
+        self.format = fmt
+        self.media_type = FORMATS[fmt]
+
+        self._locate = locate
+        # 每段为(字节数据, None)或(None, 页面位置), 与对应长度
+        self._segments: List[Tuple[Optional[bytes], Optional[PageLocation], int]] = []
+        if fmt == ZIP:
+            self._layout_zip(pages)
+        else:
+            self._layout_stream(pages)
+
+        self.size = sum(length for _, _, length in self._segments)
+        if fmt == ZIP and self.size > ZIP_MAX_SIZE:
+            raise BundleTooLarge("章节过大, 无法打包为zip, 请使用stream格式或缩小页面范围")
+
+        digest = hashlib.blake2b(fmt.encode(), digest_size=16)
+        for page in pages:
+            digest.update(f"{page['file']}:{page['hash']}".encode())
+        self.etag = f'"{digest.hexdigest()}"'
+
+    def _add(self, data: Optional[bytes] = None, page: Optional[Dict] = None):
+        if data is not None:
+            self._segments.append((data, None, len(data)))
+            return
+        location = self._locate(page["file"])
+        if location is None:
+            raise ValueError(f"页面不存在: {page['file']}")
+        self._segments.append((None, location, page["bytes"]))
+
+    def _layout_stream(self, pages: List[Dict]):
+        for page in pages:
+            name = page["file"].encode("utf-8")
+            self._add(struct.pack(">H", len(name)) + name + struct.pack(">I", page["bytes"]))
+            self._add(page=page)
+
+    def _layout_zip(self, pages: List[Dict]):
+        central = []
+        offset = 0
+        for page in pages:
+            name = page["file"].encode("utf-8")
+            size = page["bytes"]
+            crc = page["crc32"]
+            header = struct.pack(
+                "<IHHHHHIIIHH", 0x04034B50, 10, _UTF8_FLAG, 0, _DOS_TIME, _DOS_DATE,
+                crc, size, size, len(name), 0
+            ) + name
+            central.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 10, _UTF8_FLAG, 0, _DOS_TIME, _DOS_DATE,
+                crc, size, size, len(name), 0, 0, 0, 0, 0, offset & ZIP_MAX_SIZE
+            ) + name)
+            self._add(header)
+            self._add(page=page)
+            offset += len(header) + size
+
+        directory = b"".join(central)
+        self._add(directory)
+        self._add(struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, len(pages), len(pages),
+            len(directory), offset & ZIP_MAX_SIZE, 0
+        ))
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """按顺序生成[start, end]闭区间内的字节, 图片分块从磁盘读取"""
+        end = self.size - 1 if end is None else end
+        position = 0
+        for data, location, length in self._segments:
+            segment_end = position + length
+            if segment_end <= start:
+                position = segment_end
+                continue
+            if position > end:
+                break
+
+            first = max(start - position, 0)
+            last = min(end - position + 1, length)
+            if data is not None:
+                yield data[first:last]
+            else:
+                with open(location.path, "rb") as f:
+                    f.seek(location.offset + first)
+                    remaining = last - first
+                    while remaining > 0:
+                        chunk = f.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise IOError(f"页面文件在打包过程中被修改: {location.path}")
+                        remaining -= len(chunk)
+                        yield chunk
+            position = segment_end
+
+
+def select_pages(pages: List[Dict], start: int = 1, end: int = 0) -> List[Dict]:
+    """按页码(从1开始, 闭区间)截取页面, end为0表示到最后一页
+
+    Raises:
+        ValueError: 页码范围无效
+    """
+    if start < 1 or (end and end < start):
+        raise ValueError(f"无效的页码范围: {start}-{end}")
+    return pages[start - 1:end or None]
+
@@ -0,0 +1,303 @@
+"""漫画目录存储
+
+一次性加载 comics.json / chapters.json 并建立字典索引,
+仅在文件的 mtime/size 发生变化时才重新加载。
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from app.utils.compression import write_sidecars
+
+logger = logging.getLogger(__name__)
+
+FileSignature = Optional[Tuple[int, int]]
+
+# 目录变更监听器: (action, comic_id, comic), action为add/update/delete, 删除时comic为None
+CatalogListener = Callable[[str, str, Optional[Dict]], None]
+
+
+class CatalogStore:
+    """基于JSON文件的漫画目录
+
+    返回的字典为内部共享对象, 调用方不要直接修改, 需要改写时先复制。
+    """
+
+    def __init__(self, target_dir: str, precompress: bool = False):
+        self.target_dir = Path(target_dir)
+        # 写入JSON时同时生成.gz/.br预压缩文件, 供/static直接返回
+        self.precompress = precompress
+        self.comics_file = self.target_dir / "comics.json"
+        self.chapters_file = self.target_dir / "chapters.json"
+        self.lock_file = self.target_dir / ".catalog.lock"
+
+        self._lock = threading.RLock()
+        self._signature: Optional[Tuple[FileSignature, FileSignature]] = None
+
+        self._comics_by_id: Dict[str, Dict] = {}
+        self._chapters_by_comic: Dict[str, List[Dict]] = {}
+        self._chapters_by_id: Dict[str, Dict] = {}
+        self._comics_list: Optional[List[Dict]] = []
+        self._chapters_list: List[Dict] = []
+        self._listeners: List[CatalogListener] = []
+        # 目录版本号, 每次漫画变更时单调递增
+        self.version = 0
+
+    @staticmethod
+    def _file_signature(path: Path) -> FileSignature:
+        """文件签名: (mtime_ns, size), 文件不存在时为None"""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _load_json(path: Path) -> List[Dict]:
+        if not path.exists():
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_json(self, path: Path, data: List[Dict]):
+        """先写临时文件再原子替换, 读取方不会看到写了一半的文件"""
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+        if self.precompress:
+            try:
+                write_sidecars(path)
+            except OSError as e:
+                logger.warning(f"写入预压缩文件失败: {path}: {e}")
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程写锁, 防止下载脚本与API同时改写目录时丢失更新"""
+        if fcntl is None:
+            yield
+            return
+
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def add_listener(self, listener: CatalogListener):
+        """注册目录变更监听器, 并立即以add事件回放当前已加载的漫画
+
+        监听器在持有目录锁时被同步调用, 应当尽快返回。
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            for comic_id, comic in self._comics_by_id.items():
+                listener("add", comic_id, comic)
+
+    def _emit(self, action: str, comic_id: str, comic: Optional[Dict]):
+        self.version += 1
+        for listener in self._listeners:
+            try:
+                listener(action, comic_id, comic)
+            except Exception as e:
+                logger.exception(f"目录变更监听器出错: {e}")
+
+    def _reset_index(self, comics: List[Dict], chapters: List[Dict]):
+        """根据完整数据重建全部索引, 并与旧数据对比发出变更事件"""
+        old_comics = self._comics_by_id
+        old_chapters = self._chapters_by_comic
+        chapters_by_comic: Dict[str, List[Dict]] = {}
+        chapters_by_id: Dict[str, Dict] = {}
+        for chapter in chapters:
+            chapters_by_id[chapter["id"]] = chapter
+            chapters_by_comic.setdefault(chapter["comicId"], []).append(chapter)
+        for comic_chapters in chapters_by_comic.values():
+            comic_chapters.sort(key=lambda ch: ch.get("order", 0))
+
+        self._comics_by_id = {comic["id"]: comic for comic in comics}
+        self._chapters_by_comic = chapters_by_comic
+        self._chapters_by_id = chapters_by_id
+        self._comics_list = list(comics)
+        self._chapters_list = chapters
+
+        for comic_id, comic in self._comics_by_id.items():
+            old = old_comics.get(comic_id)
+            if old is None:
+                self._emit("add", comic_id, comic)
+            elif old != comic or old_chapters.get(comic_id) != chapters_by_comic.get(comic_id):
+                self._emit("update", comic_id, comic)
+        for comic_id in old_comics.keys() - self._comics_by_id.keys():
+            self._emit("delete", comic_id, None)
+
+    def _index_comic(self, comic: Dict, chapters: List[Dict]):
+        """新增或替换单个漫画的索引, 需持有self._lock"""
+        comic_id = comic["id"]
+        for chapter in self._chapters_by_comic.pop(comic_id, []):
+            self._chapters_by_id.pop(chapter["id"], None)
+
+        action = "update" if comic_id in self._comics_by_id else "add"
+        self._comics_by_id[comic_id] = comic
+        comic_chapters = sorted(chapters, key=lambda ch: ch.get("order", 0))
+        if comic_chapters:
+            self._chapters_by_comic[comic_id] = comic_chapters
+        for chapter in comic_chapters:
+            self._chapters_by_id[chapter["id"]] = chapter
+        self._comics_list = None
+        self._emit(action, comic_id, comic)
+
+    def _unindex_comic(self, comic_id: str):
+        """移除单个漫画的索引, 需持有self._lock"""
+        existed = self._comics_by_id.pop(comic_id, None) is not None
+        for chapter in self._chapters_by_comic.pop(comic_id, []):
+            self._chapters_by_id.pop(chapter["id"], None)
+        self._comics_list = None
+        if existed:
+            self._emit("delete", comic_id, None)
+
+    def refresh(self) -> bool:
+        """检查文件是否变化, 变化时重新加载并重建索引
+
+        Returns:
+            是否发生了重新加载
+        """
+        signature = (
+            self._file_signature(self.comics_file),
+            self._file_signature(self.chapters_file),
+        )
+        if signature == self._signature:
+            return False
+
+        with self._lock:
+            if signature == self._signature:
+                return False
+
+            try:
+                comics = self._load_json(self.comics_file)
+                chapters = self._load_json(self.chapters_file)
+            except (OSError, ValueError) as e:
+                # 文件可能正被旧版本的下载脚本写入, 保留旧数据, 下次请求时重试
+                logger.warning(f"加载漫画目录失败, 继续使用旧数据: {e}")
+                return False
+
+            self._reset_index(comics, chapters)
+            self._signature = signature
+
+            logger.info(f"已加载漫画目录: {len(comics)} 个漫画, {len(chapters)} 个章节")
+            return True
+
+    def _save(self, comics: List[Dict], chapters: List[Dict]):
+        """写回JSON文件并更新内存索引, 需持有self._lock与文件锁"""
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+        self._write_json(self.comics_file, comics)
+        self._write_json(self.chapters_file, chapters)
+        self._reset_index(comics, chapters)
+        self._signature = (
+            self._file_signature(self.comics_file),
+            self._file_signature(self.chapters_file),
+        )
+
+    def upsert_comic(self, comic: Dict, chapters: List[Dict]):
+        """新增或更新漫画及其全部章节
+
+        已存在的漫画保持原有位置, 不在chapters中的旧章节会被移除。
+        """
+        self.upsert_comics([(comic, chapters)])
+
+    def upsert_comics(self, items: List[Tuple[Dict, List[Dict]]]):
+        """批量新增或更新漫画, 整批只写一次文件
+
+        Args:
+            items: [(漫画, 该漫画的全部章节)]
+        """
+        if not items:
+            return
+        with self._lock, self._file_lock():
+            self.refresh()
+
+            updated = {comic["id"]: comic for comic, _ in items}
+            comics = [updated.pop(c["id"], c) for c in self.list_comics()]
+            comics.extend(updated.values())
+
+            comic_ids = {comic["id"] for comic, _ in items}
+            new_chapters = {ch["id"]: ch for _, chapters in items for ch in chapters}
+            merged_chapters = []
+            for chapter in self._chapters_list:
+                if chapter["id"] in new_chapters:
+                    merged_chapters.append(new_chapters.pop(chapter["id"]))
+                elif chapter["comicId"] not in comic_ids:
+                    merged_chapters.append(chapter)
+            merged_chapters.extend(new_chapters.values())
+
+            self._save(comics, merged_chapters)
+
+    def delete_comic(self, comic_id: str) -> bool:
+        """删除漫画及其全部章节
+
+        Returns:
+            漫画是否存在
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            if comic_id not in self._comics_by_id and comic_id not in self._chapters_by_comic:
+                return False
+
+            comics = [c for c in self.list_comics() if c["id"] != comic_id]
+            chapters = [ch for ch in self._chapters_list if ch["comicId"] != comic_id]
+            self._save(comics, chapters)
+            return True
+
+    def has_comic_list(self) -> bool:
+        """漫画列表是否存在"""
+        self.refresh()
+        return self._signature is not None and self._signature[0] is not None
+
+    def has_chapter_list(self) -> bool:
+        """章节列表是否存在"""
+        self.refresh()
+        return self._signature is not None and self._signature[1] is not None
+
+    def list_comics(self) -> List[Dict]:
+        """按加入顺序返回全部漫画"""
+        self.refresh()
+        comics = self._comics_list
+        if comics is None:
+            with self._lock:
+                if self._comics_list is None:
+                    self._comics_list = list(self._comics_by_id.values())
+                comics = self._comics_list
+        return comics
+
+    def get_comic(self, comic_id: str) -> Optional[Dict]:
+        """根据ID获取漫画, O(1)"""
+        self.refresh()
+        return self._comics_by_id.get(comic_id)
+
+    def get_chapters(self, comic_id: str) -> List[Dict]:
+        """获取漫画的全部章节, 按order排序"""
+        self.refresh()
+        return self._chapters_by_comic.get(comic_id, [])
+
+    def get_chapter(self, chapter_id: str) -> Optional[Dict]:
+        """根据ID获取章节, O(1)"""
+        self.refresh()
+        return self._chapters_by_id.get(chapter_id)
+
+
+def create_catalog_store(settings) -> CatalogStore:
+    """根据配置创建漫画目录存储"""
+    if settings.catalog_backend == "sqlite":
+        from app.services.catalog_sqlite import SqliteCatalogStore
+        return SqliteCatalogStore(settings.TARGET_DIR, settings.catalog_db_path)
+    return CatalogStore(settings.TARGET_DIR, precompress=settings.static_precompress)
@@ -0,0 +1,329 @@
+"""基于SQLite的漫画目录存储
+
+漫画、章节与标签存放在带索引的表中, 单个漫画的新增/更新/删除都在一个事务内完成。
+每次写入都会追加一条变更记录, 各进程据此增量刷新内存索引, 无需重新加载整个目录。
+"""
+import logging
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.services.catalog import CatalogStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comics (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    cover TEXT NOT NULL DEFAULT '',
+    author TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    update_time TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_comics_update_time ON comics(update_time);
+
+CREATE TABLE IF NOT EXISTS comic_tags (
+    comic_id TEXT NOT NULL REFERENCES comics(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (comic_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_comic_tags_tag ON comic_tags(tag);
+
+CREATE TABLE IF NOT EXISTS chapters (
+    id TEXT PRIMARY KEY,
+    comic_id TEXT NOT NULL REFERENCES comics(id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    "order" INTEGER NOT NULL,
+    update_time TEXT NOT NULL DEFAULT '',
+    page_count INTEGER NOT NULL DEFAULT 0,
+    cover TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chapters_comic ON chapters(comic_id, "order");
+
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    comic_id TEXT NOT NULL,
+    action TEXT NOT NULL
+);
+"""
+
+# 变更记录中表示"整体替换"的动作, 读取到时直接全量重新加载
+RESET_ACTION = "reset"
+
+
+class SqliteCatalogStore(CatalogStore):
+    """基于SQLite的漫画目录, 对外接口与CatalogStore一致"""
+
+    def __init__(self, target_dir: str, db_path: Optional[str] = None, change_log_size: int = 10000):
+        super().__init__(target_dir)
+        self.db_path = Path(db_path) if db_path else self.target_dir / "catalog.db"
+        self.change_log_size = change_log_size
+
+        self._local = threading.local()
+        self._last_seq: Optional[int] = None
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+        migrated = self.migrate_from_json(only_if_empty=True)
+        if migrated:
+            logger.info(f"已从JSON文件迁移 {migrated} 个漫画到 {self.db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate: bool = True):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _comic_from_row(row: sqlite3.Row, tags: List[str]) -> Dict:
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "cover": row["cover"],
+            "author": row["author"],
+            "description": row["description"],
+            "tags": tags,
+            "updateTime": row["update_time"],
+            "status": row["status"],
+        }
+
+    @staticmethod
+    def _chapter_from_row(row: sqlite3.Row) -> Dict:
+        chapter = {
+            "id": row["id"],
+            "comicId": row["comic_id"],
+            "title": row["title"],
+            "order": row["order"],
+            "updateTime": row["update_time"],
+            "pageCount": row["page_count"],
+        }
+        if row["cover"] is not None:
+            chapter["cover"] = row["cover"]
+        return chapter
+
+    @staticmethod
+    def _current_seq(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _load_all(self, conn: sqlite3.Connection):
+        tags_by_comic: Dict[str, List[str]] = {}
+        for row in conn.execute("SELECT comic_id, tag FROM comic_tags ORDER BY comic_id, position"):
+            tags_by_comic.setdefault(row["comic_id"], []).append(row["tag"])
+
+        comics = [
+            self._comic_from_row(row, tags_by_comic.get(row["id"], []))
+            for row in conn.execute("SELECT * FROM comics ORDER BY rowid")
+        ]
+        chapters = [
+            self._chapter_from_row(row)
+            for row in conn.execute('SELECT * FROM chapters ORDER BY comic_id, "order"')
+        ]
+        self._reset_index(comics, chapters)
+
+    def _load_comic(self, conn: sqlite3.Connection, comic_id: str):
+        row = conn.execute("SELECT * FROM comics WHERE id = ?", (comic_id,)).fetchone()
+        if row is None:
+            self._unindex_comic(comic_id)
+            return
+
+        tags = [
+            r["tag"] for r in conn.execute(
+                "SELECT tag FROM comic_tags WHERE comic_id = ? ORDER BY position", (comic_id,)
+            )
+        ]
+        chapters = [
+            self._chapter_from_row(r) for r in conn.execute(
+                'SELECT * FROM chapters WHERE comic_id = ? ORDER BY "order"', (comic_id,)
+            )
+        ]
+        self._index_comic(self._comic_from_row(row, tags), chapters)
+
+    def refresh(self) -> bool:
+        """根据变更记录增量刷新内存索引
+
+        变更记录已被裁剪或出现整体替换时退化为全量加载。
+        """
+        conn = self._connect()
+        seq = self._current_seq(conn)
+        if seq == self._last_seq:
+            return False
+
+        with self._lock:
+            if self._last_seq is not None and seq == self._last_seq:
+                return False
+
+            with self._transaction(immediate=False):
+                seq = self._current_seq(conn)
+                changes = []
+                if self._last_seq is not None:
+                    changes = conn.execute(
+                        "SELECT seq, comic_id, action FROM changes WHERE seq > ? ORDER BY seq",
+                        (self._last_seq,)
+                    ).fetchall()
+
+                complete = bool(changes) and changes[0]["seq"] == self._last_seq + 1
+                if not complete or any(c["action"] == RESET_ACTION for c in changes):
+                    self._load_all(conn)
+                    logger.info(f"已加载漫画目录: {len(self._comics_by_id)} 个漫画")
+                else:
+                    for comic_id in dict.fromkeys(c["comic_id"] for c in changes):
+                        self._load_comic(conn, comic_id)
+
+                self._last_seq = seq
+            return True
+
+    def _log_change(self, conn: sqlite3.Connection, comic_id: str, action: str):
+        cursor = conn.execute(
+            "INSERT INTO changes (comic_id, action) VALUES (?, ?)", (comic_id, action)
+        )
+        conn.execute(
+            "DELETE FROM changes WHERE seq <= ?", (cursor.lastrowid - self.change_log_size,)
+        )
+
+    @staticmethod
+    def _write_comic(conn: sqlite3.Connection, comic: Dict, chapters: List[Dict]):
+        comic_id = comic["id"]
+        conn.execute(
+            """
+            INSERT INTO comics (id, title, cover, author, description, update_time, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                title = excluded.title,
+                cover = excluded.cover,
+                author = excluded.author,
+                description = excluded.description,
+                update_time = excluded.update_time,
+                status = excluded.status
+            """,
+            (
+                comic_id,
+                comic["title"],
+                comic.get("cover", ""),
+                comic.get("author", ""),
+                comic.get("description", ""),
+                comic.get("updateTime", ""),
+                comic.get("status", ""),
+            )
+        )
+
+        conn.execute("DELETE FROM comic_tags WHERE comic_id = ?", (comic_id,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO comic_tags (comic_id, tag, position) VALUES (?, ?, ?)",
+            [(comic_id, tag, i) for i, tag in enumerate(comic.get("tags", []))]
+        )
+
+        conn.execute("DELETE FROM chapters WHERE comic_id = ?", (comic_id,))
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO chapters (id, comic_id, title, "order", update_time, page_count, cover)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    ch["id"],
+                    comic_id,
+                    ch["title"],
+                    ch.get("order", 0),
+                    ch.get("updateTime", ""),
+                    ch.get("pageCount", 0),
+                    ch.get("cover"),
+                )
+                for ch in chapters
+            ]
+        )
+
+    def upsert_comic(self, comic: Dict, chapters: List[Dict]):
+        """在一个事务内新增或更新漫画及其全部章节"""
+        self.upsert_comics([(comic, chapters)])
+
+    def upsert_comics(self, items: List[Tuple[Dict, List[Dict]]]):
+        """在一个事务内批量新增或更新漫画"""
+        if not items:
+            return
+        with self._transaction() as conn:
+            for comic, chapters in items:
+                self._write_comic(conn, comic, chapters)
+                self._log_change(conn, comic["id"], "upsert")
+        self.refresh()
+
+    def delete_comic(self, comic_id: str) -> bool:
+        """在一个事务内删除漫画, 章节与标签随外键级联删除"""
+        with self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM comics WHERE id = ?", (comic_id,)).rowcount > 0
+            if deleted:
+                self._log_change(conn, comic_id, "delete")
+        self.refresh()
+        return deleted
+
+    def migrate_from_json(self, only_if_empty: bool = False) -> int:
+        """从comics.json/chapters.json导入全部数据
+
+        Args:
+            only_if_empty: 数据库中已有漫画时跳过导入
+
+        Returns:
+            导入的漫画数量
+        """
+        if not self.comics_file.exists():
+            return 0
+
+        comics = self._load_json(self.comics_file)
+        chapters_by_comic: Dict[str, List[Dict]] = {}
+        for chapter in self._load_json(self.chapters_file):
+            chapters_by_comic.setdefault(chapter["comicId"], []).append(chapter)
+
+        with self._transaction() as conn:
+            if only_if_empty and conn.execute("SELECT 1 FROM comics LIMIT 1").fetchone():
+                return 0
+            for comic in comics:
+                self._write_comic(conn, comic, chapters_by_comic.get(comic["id"], []))
+            self._log_change(conn, "", RESET_ACTION)
+
+        self.refresh()
+        return len(comics)
+
+    def has_comic_list(self) -> bool:
+        return True
+
+    def has_chapter_list(self) -> bool:
+        return True
+
+
+def main():
+    """手动迁移: python -m app.services.catalog_sqlite [数据库路径]"""
+    from app.config.settings import get_settings
+
+    settings = get_settings()
+    db_path = sys.argv[1] if len(sys.argv) > 1 else settings.catalog_db_path
+    store = SqliteCatalogStore(settings.TARGET_DIR, db_path)
+    count = store.migrate_from_json()
+    print(f"已迁移 {count} 个漫画到 {store.db_path}")
+
+
+if __name__ == "__main__":
+    main()
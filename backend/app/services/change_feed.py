@@ -0,0 +1,79 @@
+"""带版本号的目录变更记录
+
+每次目录变更(新增、更新、删除)版本号加1, 最近max_changes条变更连同变更后的
+漫画数据(与列表接口相同的格式)保存在内存中。客户端记录自己的版本号, 通过
+/api/comics/changes?since=版本号 或WebSocket消息增量更新本地数据, 只有版本号
+早于记录范围时才需要重新加载全部列表。
+
+版本号从启动时的毫秒时间戳开始, 服务重启后仍然单调递增; 重启前的变更不再保留,
+持有旧版本号的客户端会收到reset并重新加载。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 变更记录监听器, 可能在任意线程中被调用
+ChangeListener = Callable[[Dict], None]
+
+
+class ChangeFeed:
+    """目录变更记录"""
+
+    def __init__(self, catalog, payload: Callable[[str], Optional[Dict]], max_changes: int = 1000):
+        """
+        Args:
+            payload: 漫画ID -> 变更后的漫画数据
+        """
+        self.payload = payload
+        self._lock = threading.Lock()
+        self._changes: Deque[Dict] = deque(maxlen=max(max_changes, 1))
+        self._listeners: List[ChangeListener] = []
+        self.version = int(time.time() * 1000)
+        # 版本号大于base的变更都在记录中
+        self.base = self.version
+
+        # 目录按需加载, 先完成首次加载; 注册时回放的已有漫画不是变更
+        self._ready = False
+        catalog.refresh()
+        catalog.add_listener(self._on_change)
+        self._ready = True
+
+    def add_listener(self, listener: ChangeListener):
+        self._listeners.append(listener)
+
+    def _on_change(self, action: str, comic_id: str, comic: Optional[Dict]):
+        if not self._ready:
+            return
+        record = None if action == "delete" else self.payload(comic_id)
+        with self._lock:
+            self.version += 1
+            change = {"version": self.version, "action": action, "comicId": comic_id, "comic": record}
+            if len(self._changes) == self._changes.maxlen:
+                self.base = self._changes[0]["version"]
+            self._changes.append(change)
+
+        for listener in self._listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                logger.exception(f"目录变更记录监听器出错: {e}")
+
+    def since(self, version: Optional[int]) -> Optional[List[Dict]]:
+        """version之后的全部变更
+
+        Returns:
+            按版本号排列的变更; 版本号为空、早于记录范围或不属于本服务时为None, 客户端应重新加载
+        """
+        with self._lock:
+            if version is None or version < self.base or version > self.version:
+                return None
+            if not self._changes:
+                return []
+            # 记录中的版本号连续, 直接按偏移量截取
+            start = max(version + 1 - self._changes[0]["version"], 0)
+            return list(islice(self._changes, start, None))
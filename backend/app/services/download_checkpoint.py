@@ -0,0 +1,118 @@
+"""下载断点
+
+每个漫画下载到状态目录中固定的工作区(workspace/{漫画ID}), 失败或中断时保留工作区,
+checkpoint.json记录已下载并校验完整的页面。重新执行时先删除残缺的文件, jmcomic只下载
+缺少的页面; 服务启动时, 调度器为尚未用完重试次数的断点重新排队。
+
+漫画目录发布后, 断点记录待写入漫画列表的条目, 工作区保留到漫画列表写入成功为止;
+写入前中断的漫画重新执行时不再下载, 直接写入记录的条目。
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.services.page_manifest import is_complete_image
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_NAME = "workspace"
+# 旧版本的工作区位于漫画目录中
+LEGACY_WORKSPACE_NAME = ".workspace"
+CHECKPOINT_NAME = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+
+def workspace_root(settings) -> Path:
+    """下载工作区所在目录, 位于状态目录中, 不会经/static公开"""
+    from app.config.settings import state_path
+    return Path(state_path(settings, WORKSPACE_NAME, LEGACY_WORKSPACE_NAME))
+
+
+class DownloadCheckpoint:
+    """单个漫画的下载断点"""
+
+    def __init__(self, workspace: Path, comic_id: str):
+        self.workspace = Path(workspace)
+        self.comic_id = comic_id
+        self.path = self.workspace / CHECKPOINT_NAME
+        self.attempts = 0
+        self.updated_at: Optional[float] = None
+        # 相对download目录的路径 -> 已校验的文件大小
+        self.pages: Dict[str, int] = {}
+        # 已发布但尚未写入漫画列表的条目: {"comic": 漫画信息, "pages": 页面路径列表}
+        self.published: Optional[Dict] = None
+
+    @classmethod
+    def load(cls, workspace: Path, comic_id: str) -> "DownloadCheckpoint":
+        checkpoint = cls(workspace, comic_id)
+        try:
+            with open(checkpoint.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return checkpoint
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取下载断点失败, 重新校验已下载的页面: {e}")
+            return checkpoint
+        if data.get("version") == CHECKPOINT_VERSION and data.get("comicId") == comic_id:
+            checkpoint.attempts = data.get("attempts", 0)
+            checkpoint.updated_at = data.get("updatedAt")
+            checkpoint.pages = data.get("pages", {})
+            checkpoint.published = data.get("published")
+        return checkpoint
+
+    def save(self):
+        self.updated_at = time.time()
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "comicId": self.comic_id,
+            "attempts": self.attempts,
+            "updatedAt": self.updated_at,
+            "pages": self.pages,
+            "published": self.published,
+        }
+        self.workspace.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{CHECKPOINT_NAME}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def verify(self, download_dir: Path) -> int:
+        """校验下载目录中的图片, 删除残缺的文件并记录完整的文件
+
+        已记录且大小未变的文件不再重复校验。
+
+        Returns:
+            已校验完整的页面数
+        """
+        verified: Dict[str, int] = {}
+        download_dir = Path(download_dir)
+        if download_dir.is_dir():
+            for path in download_dir.rglob("*"):
+                if path.suffix.lower() not in IMAGE_EXTENSIONS or not path.is_file():
+                    continue
+                name = path.relative_to(download_dir).as_posix()
+                size = path.stat().st_size
+                if self.pages.get(name) == size or is_complete_image(path):
+                    verified[name] = size
+                else:
+                    logger.info(f"删除残缺的页面: {path}")
+                    path.unlink()
+        self.pages = verified
+        return len(verified)
+
+
+def list_checkpoints(root: Path) -> List[DownloadCheckpoint]:
+    """工作区根目录root中保留的全部下载断点"""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    checkpoints = []
+    for workspace in sorted(root.iterdir()):
+        if workspace.is_dir() and (workspace / CHECKPOINT_NAME).exists():
+            checkpoints.append(DownloadCheckpoint.load(workspace, workspace.name))
+    return checkpoints
@@ -0,0 +1,512 @@
+"""漫画下载调度
+
+下载任务进入持久化队列, 由固定数量(max_concurrent_downloads)的worker依次执行,
+worker每次从队列中取出最多batch_size个任务, 在同一个子进程中运行download_and_process.py,
+每批只启动一次解释器、导入一次jmcomic, 整批完成后只写一次漫画目录, 不会阻塞事件循环。
+子进程不跨批次常驻: 超时或取消时直接结束整个子进程, 下一批总是从干净的进程开始,
+不会继承上一批残留的连接、线程或内存。
+同一漫画已有排队或进行中的任务时直接返回该任务, 不会重复下载。
+任务支持超时与取消; 服务重启时未完成的任务会重新排队, 队列中没有记录但留有下载断点的
+漫画(见download_checkpoint)也会重新排队, 从断点继续下载。
+
+下载脚本以PROGRESS_PREFIX开头的JSON行报告进度, 调度器据此更新任务的
+阶段、页数与字节数, 并按progress_interval限制通知监听器的频率。
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config.settings import state_path
+from app.services.download_checkpoint import list_checkpoints, workspace_root
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING, PROCESSING)
+
+PROGRESS_PREFIX = "@@progress "
+# 下载脚本可以报告的进度字段, comicId表示进度所属的漫画, status为failed时附带error
+PROGRESS_FIELDS = ("comicId", "status", "pagesDone", "pagesTotal", "bytes", "error")
+
+DOWNLOAD_SCRIPT = Path(__file__).resolve().parent.parent / "download_and_process.py"
+
+
+@dataclass
+class DownloadJob:
+    id: str
+    comicId: str
+    status: str = QUEUED
+    createdAt: float = field(default_factory=time.time)
+    startedAt: Optional[float] = None
+    finishedAt: Optional[float] = None
+    error: Optional[str] = None
+    pagesDone: int = 0
+    pagesTotal: Optional[int] = None
+    bytes: int = 0
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["elapsed"] = None
+        if self.startedAt is not None:
+            data["elapsed"] = round((self.finishedAt or time.time()) - self.startedAt, 3)
+        return data
+
+
+# report(job, **progress)
+ProgressReporter = Callable[..., None]
+# runner(jobs, report) -> 任务ID -> 失败原因, 其余任务视为成功
+Runner = Callable[[List[DownloadJob], ProgressReporter], Awaitable[Dict[str, str]]]
+
+
+def parse_progress(line: str) -> Optional[Dict]:
+    """解析下载脚本输出的进度行, 不是进度行时返回None"""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        data = json.loads(line[len(PROGRESS_PREFIX):])
+    except ValueError:
+        return None
+    return {key: data[key] for key in PROGRESS_FIELDS if key in data}
+
+
+async def run_download_script(jobs: List[DownloadJob], report: ProgressReporter,
+                              env: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """在一个子进程中执行一批下载任务, 任务被取消或超时时结束子进程
+
+    Returns:
+        任务ID -> 失败原因; 脚本返回非0时, 没有报告结果的任务都视为失败
+    """
+    by_comic = {job.comicId: job for job in jobs}
+    failed: Dict[str, str] = {}
+    done = set()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(DOWNLOAD_SCRIPT), *by_comic,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=str(DOWNLOAD_SCRIPT.parent),
+        env=env
+    )
+    output: List[str] = []
+    try:
+        async for line in process.stdout:
+            text = line.decode("utf-8", errors="replace").rstrip()
+            progress = parse_progress(text)
+            if progress is not None:
+                job = by_comic.get(progress.pop("comicId", None))
+                error = progress.pop("error", None)
+                if job is None:
+                    continue
+                if progress.get("status") == FAILED:
+                    failed[job.id] = error or "下载失败"
+                elif progress.get("status") == DONE:
+                    done.add(job.id)
+                else:
+                    report(job, **progress)
+                continue
+            logger.debug(f"[下载] {text}")
+            output.append(text)
+            del output[:-20]
+        returncode = await process.wait()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+    if returncode != 0:
+        error = f"下载脚本返回 {returncode}: {' | '.join(output[-5:])}"
+        for job in jobs:
+            if job.id not in done:
+                failed.setdefault(job.id, error)
+    return failed
+
+
+class DownloadTimeout(Exception):
+    """一批任务中的某个任务超时"""
+
+    def __init__(self, job: DownloadJob):
+        super().__init__(job.id)
+        self.job = job
+
+
+class DownloadScheduler:
+    """带持久化队列与并发上限的下载调度器"""
+
+    def __init__(self, queue_path: str, runner: Optional[Runner] = None, max_concurrent: int = 2,
+                 timeout: Optional[float] = None, history_size: int = 200, progress_interval: float = 0.5,
+                 batch_size: int = 1, checkpoint_dir: Optional[str] = None, resume_attempts: int = 3):
+        self.queue_path = Path(queue_path)
+        self.runner = runner or run_download_script
+        self.max_concurrent = max(max_concurrent, 1)
+        # 单个任务的超时, 同一批中的任务依次执行, 从下载脚本报告该漫画开始下载时分别计时
+        self.timeout = timeout
+        self.batch_size = max(batch_size, 1)
+        # 下载工作区根目录, 启动时在其中查找下载断点; 断点的尝试次数达到resume_attempts后不再自动继续
+        self.checkpoint_dir = checkpoint_dir
+        self.resume_attempts = resume_attempts
+        self.history_size = history_size
+        self.progress_interval = progress_interval
+
+        self._jobs: "OrderedDict[str, DownloadJob]" = OrderedDict()
+        # 漫画ID -> 排队或进行中的任务ID
+        self._active: Dict[str, str] = {}
+        # 任务ID -> 执行中的asyncio任务(同一批任务共享), 用于取消
+        self._running: Dict[str, asyncio.Task] = {}
+        self._finished_events: Dict[str, asyncio.Event] = {}
+        # 任务ID -> 上次通知进度的时间, 以及等待发送的节流通知
+        self._last_progress: Dict[str, float] = {}
+        self._pending_progress: Dict[str, asyncio.TimerHandle] = {}
+        self._listeners: List[Callable[[DownloadJob], Awaitable[None]]] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._stopping = False
+
+        self._load()
+
+    def add_listener(self, listener: Callable[[DownloadJob], Awaitable[None]]):
+        """任务状态或进度变化时调用listener(job), 进度通知按progress_interval节流"""
+        self._listeners.append(listener)
+
+    def _load(self):
+        try:
+            with open(self.queue_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取下载队列失败: {e}")
+            return
+
+        names = {f.name for f in fields(DownloadJob)}
+        for item in data.get("jobs", []):
+            job = DownloadJob(**{key: value for key, value in item.items() if key in names})
+            if job.status in ACTIVE_STATES:
+                # 上次退出时未完成的任务重新排队
+                job.status = QUEUED
+                job.startedAt = None
+                job.pagesDone = job.bytes = 0
+                self._active[job.comicId] = job.id
+            self._jobs[job.id] = job
+
+    def _save(self):
+        data = {"jobs": [job.to_dict() for job in self._jobs.values()]}
+        try:
+            self.queue_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.queue_path.with_name(f".{self.queue_path.name}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.queue_path)
+        except OSError as e:
+            logger.error(f"写入下载队列失败: {e}")
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE_STATES]
+        for job_id in finished[:max(len(finished) - self.history_size, 0)]:
+            del self._jobs[job_id]
+            self._finished_events.pop(job_id, None)
+
+    async def start(self):
+        """启动worker, 并把持久化队列中未完成的任务与留有断点的下载放入队列"""
+        self._stopping = False
+        self._resume_checkpoints()
+        self._queue = asyncio.Queue()
+        for job in self._jobs.values():
+            if job.status == QUEUED:
+                self._queue.put_nowait(job.id)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+        logger.info(f"下载调度器已启动, 并发数 {self.max_concurrent}, 待处理任务 {self._queue.qsize()}")
+
+    def _resume_checkpoints(self):
+        if self.checkpoint_dir is None:
+            return
+        for checkpoint in list_checkpoints(self.checkpoint_dir):
+            if checkpoint.comic_id in self._active:
+                continue
+            # 已发布的漫画只差写入漫画列表, 总是继续
+            if checkpoint.attempts >= self.resume_attempts and checkpoint.published is None:
+                logger.warning(
+                    f"漫画 {checkpoint.comic_id} 已尝试 {checkpoint.attempts} 次, 不再自动继续下载, "
+                    f"可手动重新提交"
+                )
+                continue
+            logger.info(f"从断点继续下载漫画 {checkpoint.comic_id}: 已有 {len(checkpoint.pages)} 页")
+            self.submit(checkpoint.comic_id)
+
+    async def stop(self):
+        """停止worker; 正在执行的任务保持排队状态, 下次启动时继续"""
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._save()
+
+    def submit_many(self, comic_ids: List[str]) -> List[DownloadJob]:
+        """批量提交下载任务, 排队的任务会被worker按批取出在同一个子进程中执行"""
+        return [self.submit(comic_id) for comic_id in dict.fromkeys(comic_ids)]
+
+    def submit(self, comic_id: str) -> DownloadJob:
+        """提交下载任务, 同一漫画已有未完成的任务时返回该任务"""
+        job_id = self._active.get(comic_id)
+        if job_id is not None:
+            return self._jobs[job_id]
+
+        job = DownloadJob(id=uuid.uuid4().hex[:12], comicId=comic_id)
+        self._jobs[job.id] = job
+        self._active[comic_id] = job.id
+        self._trim_history()
+        self._save()
+        if self._queue is not None:
+            self._queue.put_nowait(job.id)
+        logger.info(f"下载任务 {job.id} 已排队: 漫画 {comic_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[DownloadJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self, status: Optional[str] = None) -> List[DownloadJob]:
+        """全部任务, 最新的在前
+
+        Args:
+            status: 只返回该状态的任务
+        """
+        return [job for job in reversed(self._jobs.values()) if status is None or job.status == status]
+
+    def report_progress(self, job: DownloadJob, **progress):
+        """更新任务进度, 阶段变化立即通知, 其余进度按progress_interval合并后通知"""
+        if job.status not in ACTIVE_STATES:
+            return
+        status = progress.pop("status", None)
+        for key, value in progress.items():
+            setattr(job, key, value)
+
+        if status in (RUNNING, PROCESSING) and status != job.status:
+            job.status = status
+            if job.startedAt is None:
+                job.startedAt = time.time()
+            self._save()
+            self._send_progress(job)
+            return
+
+        if job.id in self._pending_progress:
+            return
+        delay = self._last_progress.get(job.id, 0.0) + self.progress_interval - time.monotonic()
+        if delay <= 0:
+            self._send_progress(job)
+        else:
+            loop = asyncio.get_running_loop()
+            self._pending_progress[job.id] = loop.call_later(delay, self._send_progress, job)
+
+    def _send_progress(self, job: DownloadJob):
+        handle = self._pending_progress.pop(job.id, None)
+        if handle is not None:
+            handle.cancel()
+        if job.status not in ACTIVE_STATES:
+            return
+        self._last_progress[job.id] = time.monotonic()
+        asyncio.get_running_loop().create_task(self._notify(job))
+
+    async def cancel(self, job_id: str) -> bool:
+        """取消排队或进行中的任务
+
+        同一批中还有其他进行中的任务时不结束子进程, 只把该任务标记为已取消,
+        其结果会被忽略(已下载的漫画仍可能入库)。
+
+        Returns:
+            任务是否被取消, 任务不存在或已结束时为False
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+
+        task = self._running.get(job_id)
+        others = [
+            other_id for other_id, other_task in self._running.items()
+            if other_task is task and other_id != job_id and self._jobs[other_id].status in ACTIVE_STATES
+        ]
+        if task is not None and not others:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if job.status in ACTIVE_STATES:
+            # 仍在队列中(worker取出后会跳过), 或任务在开始执行前就被取消
+            await self._finish(job, CANCELLED)
+        return True
+
+    async def wait(self, job_id: str) -> Optional[DownloadJob]:
+        """等待任务结束"""
+        job = self._jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return job
+        event = self._finished_events.setdefault(job_id, asyncio.Event())
+        await event.wait()
+        return job
+
+    async def _notify(self, job: DownloadJob):
+        for listener in self._listeners:
+            try:
+                await listener(job)
+            except Exception as e:
+                logger.error(f"下载任务监听器出错: {e}")
+
+    async def _finish(self, job: DownloadJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finishedAt = time.time()
+        handle = self._pending_progress.pop(job.id, None)
+        if handle is not None:
+            handle.cancel()
+        self._last_progress.pop(job.id, None)
+        if self._active.get(job.comicId) == job.id:
+            del self._active[job.comicId]
+        self._save()
+        event = self._finished_events.pop(job.id, None)
+        if event is not None:
+            event.set()
+        await self._notify(job)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+
+            batch = [job]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                other = self._jobs.get(self._queue.get_nowait())
+                if other is not None and other.status == QUEUED:
+                    batch.append(other)
+
+            # 同一批的任务在子进程中依次执行, 保持排队状态, 直到下载脚本报告开始下载该漫画
+            task = asyncio.create_task(self._run(batch))
+            for job in batch:
+                self._running[job.id] = task
+            try:
+                # 任务本身被取消时wait正常返回, 只有worker被停止时才抛出CancelledError
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                # worker被停止(服务退出): 结束子进程, 任务保持排队状态
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise
+            finally:
+                for job in batch:
+                    self._running.pop(job.id, None)
+
+    async def _run(self, batch: List[DownloadJob]):
+        comic_ids = ", ".join(job.comicId for job in batch)
+        logger.info(f"开始执行 {len(batch)} 个下载任务: 漫画 {comic_ids}")
+
+        def pending() -> List[DownloadJob]:
+            # 执行期间被单独取消的任务已经结束
+            return [job for job in batch if job.status in ACTIVE_STATES]
+
+        try:
+            failed = await self._run_with_timeout(batch)
+        except DownloadTimeout as e:
+            logger.error(f"下载任务 {e.job.id} 超时: 漫画 {e.job.comicId}")
+            for job in pending():
+                if job is e.job:
+                    await self._finish(job, FAILED, f"超过 {self.timeout} 秒未完成")
+                else:
+                    # 同批中已发布或尚未开始的漫画重新排队, 已发布的漫画不会重新下载
+                    await self._requeue(job)
+        except asyncio.CancelledError:
+            if self._stopping:
+                for job in pending():
+                    job.status = QUEUED
+                    job.startedAt = None
+                    job.pagesDone = job.bytes = 0
+                raise
+            logger.info(f"下载任务已取消: 漫画 {comic_ids}")
+            for job in pending():
+                await self._finish(job, CANCELLED)
+        except Exception as e:
+            logger.error(f"下载任务失败: 漫画 {comic_ids}: {e}")
+            for job in pending():
+                await self._finish(job, FAILED, str(e))
+        else:
+            for job in pending():
+                error = failed.get(job.id)
+                if error is None:
+                    logger.info(f"下载任务 {job.id} 完成")
+                    await self._finish(job, DONE)
+                else:
+                    logger.error(f"下载任务 {job.id} 失败: {error}")
+                    await self._finish(job, FAILED, error)
+
+    async def _run_with_timeout(self, batch: List[DownloadJob]) -> Dict[str, str]:
+        """执行一批任务, 当前漫画超过timeout未完成时结束子进程
+
+        下载脚本依次处理漫画, 报告下一个漫画开始下载时上一个漫画已经结束,
+        因此只需为最近开始的漫画计时。
+
+        Raises:
+            DownloadTimeout: 超时的任务
+        """
+        if not self.timeout:
+            return await self.runner(batch, self.report_progress)
+
+        # [当前漫画的任务, 开始时间], 脚本报告第一个漫画之前按批次开始计时
+        current = [batch[0], time.monotonic()]
+
+        def report(job: DownloadJob, **progress):
+            if progress.get("status") == RUNNING and job is not current[0]:
+                current[:] = [job, time.monotonic()]
+            self.report_progress(job, **progress)
+
+        task = asyncio.ensure_future(self.runner(batch, report))
+        try:
+            while True:
+                remaining = current[1] + self.timeout - time.monotonic()
+                done, _ = await asyncio.wait({task}, timeout=max(remaining, 0))
+                if done:
+                    return task.result()
+                if current[1] + self.timeout <= time.monotonic():
+                    raise DownloadTimeout(current[0])
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def _requeue(self, job: DownloadJob):
+        job.status = QUEUED
+        job.startedAt = None
+        job.pagesDone = job.bytes = 0
+        job.pagesTotal = None
+        self._save()
+        if self._queue is not None:
+            self._queue.put_nowait(job.id)
+        await self._notify(job)
+
+def create_download_scheduler(settings) -> DownloadScheduler:
+    queue_path = settings.download_queue_path or state_path(settings, "downloads.json")
+    env = os.environ.copy()
+    env["BASE_URL"] = settings.BASE_URL
+    # 下载脚本在app目录中运行, 可能读不到.env文件, 显式传入目录配置
+    env["TARGET_DIR"] = settings.TARGET_DIR
+    env["STATE_DIR"] = os.path.dirname(state_path(settings, "downloads.json"))
+    return DownloadScheduler(
+        queue_path,
+        runner=functools.partial(run_download_script, env=env),
+        max_concurrent=settings.max_concurrent_downloads,
+        timeout=settings.download_timeout or None,
+        progress_interval=settings.download_progress_interval,
+        batch_size=settings.download_batch_size,
+        checkpoint_dir=str(workspace_root(settings)),
+        resume_attempts=settings.download_resume_attempts
+    )
@@ -0,0 +1,273 @@
+"""图片缩略图与缩放版本
+
+按原图内容哈希与输出参数命名缓存文件, 相同的页面在不同漫画中只生成一次。
+缓存目录有总大小上限, 超出时按最近访问时间淘汰; 编码在进程池中进行,
+不会阻塞事件循环。Pillow为可选依赖, 未安装时直接返回原图。
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Set, Tuple, Union
+
+from app.services.page_pack import PageLocation, read_page
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow为可选依赖
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 源文件(路径, 页面偏移量, 修改时间, 大小) -> 内容哈希, 避免每次请求都重新读取原图
+_DigestKey = Tuple[str, int, int, int]
+
+
+def render_variant(source: PageLocation, target: str, width: int, max_size: int, quality: int,
+                   image_format: str) -> bool:
+    """生成缩放后的图片, 在进程池中执行
+
+    Returns:
+        是否生成了新文件; 原图不大于目标尺寸时返回False, 应直接使用原图
+    """
+    data = source.path if source.length is None else io.BytesIO(read_page(source))
+    with Image.open(data) as img:
+        width = min(width, max_size)
+        if img.width <= width and img.height <= max_size:
+            return False
+        img.thumbnail((width, max_size), Image.LANCZOS)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp_path, format=image_format.upper(), quality=quality)
+    os.replace(tmp_path, target)
+    return True
+
+
+class ImageVariantService:
+    """带容量上限的图片缩放版本磁盘缓存"""
+
+    def __init__(self, cache_dir: str, widths: Sequence[int], max_bytes: int, quality: int = 80,
+                 max_size: int = 1600, image_format: str = "webp", allowed_types: Optional[Sequence[str]] = None,
+                 workers: int = 2, enabled: bool = True):
+        self.cache_dir = Path(cache_dir)
+        self.widths = sorted(widths)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.max_size = max_size
+        self.image_format = image_format.lower()
+        self.allowed_types = set(allowed_types or ())
+        self.workers = workers
+        self.enabled = enabled and Image is not None
+
+        self._lock = threading.Lock()
+        # 缓存文件名 -> 文件大小, 按最近访问顺序排列
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self.size = 0
+        self._digests: Dict[_DigestKey, str] = {}
+        # 原图已不大于目标尺寸、直接使用原图的缓存文件名
+        self._originals: Set[str] = set()
+        # 缓存文件名 -> 正在生成的任务
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        if enabled and Image is None:
+            logger.warning("未安装Pillow, 图片缩放功能不可用, 将直接返回原图")
+        if self.enabled:
+            self._load()
+
+    def _load(self):
+        """按修改时间(访问时会更新)恢复LRU顺序"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix == ".tmp" or not path.is_file():
+                continue
+            st = path.stat()
+            files.append((st.st_mtime, path.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.size += size
+        logger.info(f"图片缓存: {len(self._entries)} 个文件, {self.size} bytes")
+
+    def snap_width(self, width: int) -> Optional[int]:
+        """把请求的宽度对齐到配置的档位, 防止任意宽度撑爆缓存"""
+        if not self.widths or width <= 0:
+            return None
+        for candidate in self.widths:
+            if candidate >= width:
+                return min(candidate, self.max_size)
+        return min(self.widths[-1], self.max_size)
+
+    def accepts(self, source: PageLocation) -> bool:
+        media_type, _ = mimetypes.guess_type(source.name)
+        return not self.allowed_types or media_type in self.allowed_types
+
+    def _digest(self, source: PageLocation) -> str:
+        st = source.path.stat()
+        key = (str(source.path), source.offset, st.st_mtime_ns, st.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            if source.length is None:
+                hasher = hashlib.blake2b(digest_size=16)
+                with open(source.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        hasher.update(chunk)
+            else:
+                hasher = hashlib.blake2b(read_page(source), digest_size=16)
+            digest = hasher.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def _name(self, digest: str, width: int) -> str:
+        return f"{digest}-w{width}-q{self.quality}.{self.image_format}"
+
+    def _lookup(self, name: str) -> Optional[Path]:
+        """命中时更新LRU顺序; 其他进程(如下载脚本)生成的文件也会被纳入管理"""
+        path = self.cache_dir / name
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                hit = True
+            else:
+                hit = False
+        if hit:
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                with self._lock:
+                    self.size -= self._entries.pop(name, 0)
+                return None
+        if path.is_file():
+            self._add(name, path.stat().st_size)
+            return path
+        return None
+
+    def _add(self, name: str, size: int):
+        with self._lock:
+            self.size -= self._entries.pop(name, 0)
+            self._entries[name] = size
+            self.size += size
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self.size -= oldest_size
+                try:
+                    (self.cache_dir / oldest).unlink()
+                except OSError:
+                    pass
+
+    def _prepare(self, source: PageLocation, width: int) -> Tuple[Optional[int], Optional[str]]:
+        if not self.enabled or not self.accepts(source):
+            return None, None
+        width = self.snap_width(width)
+        if width is None:
+            return None, None
+        try:
+            return width, self._name(self._digest(source), width)
+        except OSError:
+            return None, None
+
+    def _render_args(self, source: PageLocation, name: str, width: int) -> tuple:
+        return source, str(self.cache_dir / name), width, self.max_size, self.quality, self.image_format
+
+    def ensure(self, source: Union[Path, PageLocation], width: int) -> Optional[Path]:
+        """同步生成缩放版本, 用于下载入库时预先生成封面
+
+        Returns:
+            缩放版本路径, 无需缩放或不可用时为None
+        """
+        if isinstance(source, Path):
+            source = PageLocation(source.name, source)
+        width, name = self._prepare(source, width)
+        if name is None or name in self._originals:
+            return None
+        cached = self._lookup(name)
+        if cached is not None:
+            return cached
+        try:
+            if not render_variant(*self._render_args(source, name, width)):
+                self._originals.add(name)
+                return None
+        except Exception as e:
+            logger.warning(f"生成缩放图片失败: {source}: {e}")
+            return None
+        path = self.cache_dir / name
+        self._add(name, path.stat().st_size)
+        return path
+
+    async def variant(self, source: PageLocation, width: int) -> Optional[Path]:
+        """按需生成缩放版本, 编码在进程池中进行, 相同的并发请求只生成一次
+
+        Returns:
+            缩放版本路径, 无需缩放或不可用时为None, 调用方应返回原图
+        """
+        loop = asyncio.get_running_loop()
+        width, name = await loop.run_in_executor(None, self._prepare, source, width)
+        if name is None or name in self._originals:
+            return None
+        cached = self._lookup(name)
+        if cached is not None:
+            return cached
+
+        pending = self._pending.get(name)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = loop.create_future()
+        self._pending[name] = future
+        result = None
+        try:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            rendered = await loop.run_in_executor(
+                self._pool, render_variant, *self._render_args(source, name, width)
+            )
+            if rendered:
+                result = self.cache_dir / name
+                self._add(name, result.stat().st_size)
+            else:
+                self._originals.add(name)
+        except Exception as e:
+            logger.warning(f"生成缩放图片失败: {source}: {e}")
+        finally:
+            del self._pending[name]
+            future.set_result(result)
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "maxBytes": self.max_bytes,
+            }
+
+
+def create_image_variant_service(settings) -> ImageVariantService:
+    cache_dir = settings.image_cache_dir or os.path.join(os.path.dirname(settings.TARGET_DIR), ".image_cache")
+    return ImageVariantService(
+        cache_dir,
+        settings.image_variant_widths,
+        settings.image_cache_max_bytes,
+        quality=settings.image_quality,
+        max_size=settings.image_max_size,
+        image_format=settings.image_format,
+        allowed_types=settings.allowed_image_types,
+        workers=settings.image_workers,
+        enabled=settings.image_variants_enabled
+    )
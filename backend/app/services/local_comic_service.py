@@ -1,9 +1,7 @@
 import logging
 import json
-import subprocess
-import sys
-import os
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 from pathlib import Path
 
 from app.models.comic import Comic, Chapter, Page, PaginatedResult
@@ -15,76 +13,48 @@ settings = get_settings()
 class LocalComicService:
     """本地漫画服务"""
 
-    def __init__(self):
+    def __init__(self, catalog=None, index=None, views=None, downloads=None):
         print('LocalComicService init')
+        self.catalog = catalog
+        self.search_index = index
+        self.views = views
+        self.downloads = downloads
+
+    @staticmethod
+    def _to_comic(data: Dict) -> Comic:
+        """目录中的漫画字典转换为Comic模型"""
+        return Comic(
+            id=data["id"],
+            title=data["title"],
+            cover=data.get("cover", ""),
+            author=data.get("author", ""),
+            description=data.get("description", ""),
+            tags=data.get("tags", []),
+            update_time=datetime.fromisoformat(data["updateTime"]),
+            status=data.get("status", "ongoing"),
+            chapters=[]
+        )
 
     async def download_comic(self, comic_id: str) -> Optional[Comic]:
-        """下载漫画"""
+        """下载漫画, 通过下载调度器执行并等待完成"""
         try:
-            comic_path = self.mock_data_path / comic_id
-            if comic_path.exists():
+            self.catalog.refresh()
+            existing = self.catalog.get_comic(comic_id)
+            if existing:
                 logger.info(f"漫画 {comic_id} 已存在，跳过下载")
-                return await self.get_comic_detail(comic_id)
+                return self._to_comic(existing)
 
-            script_path = Path(__file__).parent.parent / "download_and_process.py"
-            if not script_path.exists():
-                logger.error(f"下载脚本 {script_path} 不存在")
+            job = await self.downloads.wait(self.downloads.submit(comic_id).id)
+            if job is None or job.status != "done":
+                logger.error(f"下载漫画 {comic_id} 失败: {job.error if job else '任务不存在'}")
                 return None
 
-            logger.info(f"开始下载漫画 {comic_id}")
-
-            env = os.environ.copy()
-            base_url = os.environ.get("BASE_URL", "http://localhost:3000")
-            env["BASE_URL"] = base_url
-
-            result = subprocess.run(
-                [sys.executable, str(script_path), comic_id],
-                capture_output=True,
-                text=True,
-                env=env
-            )
-
-            if result.returncode != 0:
-                logger.error(f"下载漫画 {comic_id} 失败: {result.stderr}")
+            self.catalog.refresh()
+            comic = self.catalog.get_comic(comic_id)
+            if not comic:
+                logger.error(f"下载后目录中找不到漫画 {comic_id}")
                 return None
-
-            logger.info(f"下载漫画 {comic_id} 成功: {result.stdout}")
-
-            if not comic_path.exists():
-                logger.error(f"下载后找不到漫画目录 {comic_path}")
-                return None
-
-            info_path = comic_path / "info.json"
-            if not info_path.exists():
-                logger.error(f"找不到漫画信息文件 {info_path}")
-                return None
-
-            with open(info_path, "r", encoding="utf-8") as f:
-                comic_info = json.load(f)
-
-            comic = Comic(
-                id=comic_info["id"],
-                title=comic_info["title"],
-                cover=comic_info["cover"],
-                author=comic_info["author"],
-                description=comic_info["description"],
-                tags=comic_info["tags"],
-                update_time=comic_info["update_time"],
-                status=comic_info["status"],
-                chapters=[
-                    Chapter(
-                        id=chapter["id"],
-                        comic_id=chapter["comic_id"],
-                        title=chapter["title"],
-                        order=chapter["order"],
-                        update_time=chapter["update_time"],
-                        page_count=chapter["page_count"]
-                    )
-                    for chapter in comic_info["chapters"]
-                ]
-            )
-
-            return comic
+            return self._to_comic(comic)
         except Exception as e:
             logger.exception(f"下载漫画 {comic_id} 时出错: {e}")
             return None
@@ -183,38 +153,33 @@ class LocalComicService:
                            sort: str = "newest", tags: Optional[List[str]] = None) -> PaginatedResult:
         """搜索漫画"""
         try:
-            all_comics = await self.get_comics(page=1, page_size=1000)
-            comics = all_comics.items
-
             if keyword:
-                comics = [
-                    comic for comic in comics
-                    if keyword.lower() in comic.title.lower() or
-                       keyword.lower() in comic.description.lower() or
-                       keyword.lower() in comic.author.lower()
-                ]
+                comic_ids = self.search_index.match(keyword)
+                comics = [self.catalog.get_comic(comic_id) for comic_id in comic_ids]
+                comics = [comic for comic in comics if comic]
+            else:
+                comics = list(self.catalog.list_comics())
 
             if tags:
                 comics = [
                     comic for comic in comics
-                    if any(tag in comic.tags for tag in tags)
+                    if any(tag in comic.get("tags", []) for tag in tags)
                 ]
 
-            if sort == "newest":
-                comics.sort(key=lambda x: x.update_time, reverse=True)
-            elif sort == "oldest":
-                comics.sort(key=lambda x: x.update_time)
-
             total = len(comics)
             start_idx = (page - 1) * page_size
             end_idx = start_idx + page_size
-            comics_page = comics[start_idx:end_idx]
+
+            comic_ids, _ = self.views.sort_ids((c["id"] for c in comics), sort, start_idx, page_size)
+            comics_page = [self.catalog.get_comic(comic_id) for comic_id in comic_ids]
+            comics_page = [self._to_comic(comic) for comic in comics_page if comic]
 
             return PaginatedResult(
                 items=comics_page,
                 total=total,
                 page=page,
-                page_size=page_size
+                page_size=page_size,
+                has_more=end_idx < total
             )
         except Exception as e:
             logger.exception(f"搜索漫画时出错: {e}")
@@ -222,7 +187,8 @@ class LocalComicService:
                 items=[],
                 total=0,
                 page=page,
-                page_size=page_size
+                page_size=page_size,
+                has_more=False
             )
 
     async def get_chapter_pages(self, chapter_id: str) -> List[Page]:
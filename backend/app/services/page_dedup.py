@@ -0,0 +1,181 @@
+"""页面内容去重
+
+入库时按内容哈希把每页保存到对象目录(同一内容只存一份), 漫画目录中的页面
+是指向对象的硬链接。不同漫画中相同的页面(汉化组声明、广告、重复的封面等)
+在磁盘与页缓存中都只占一份空间。无法创建硬链接时(跨文件系统、Windows等)退回为复制。
+
+共享同一个inode的页面不能原地修改, 所有写入都必须先写临时文件再替换。
+
+用法:
+    python -m app.services.page_dedup            对已有漫画去重
+    python -m app.services.page_dedup --report   统计节省的空间
+    python -m app.services.page_dedup --gc       删除不再被任何漫画引用的对象
+"""
+import hashlib
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.services.page_manifest import list_pages
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(path: Path) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class PageObjectStore:
+    """按内容哈希存放页面的对象目录"""
+
+    def __init__(self, object_dir: str):
+        self.object_dir = Path(object_dir)
+
+    def object_path(self, digest: str, suffix: str) -> Path:
+        return self.object_dir / digest[:2] / f"{digest}{suffix.lower()}"
+
+    def store(self, source: Path, dest: Path, digest: Optional[str] = None) -> bool:
+        """把source保存到对象目录并在dest创建硬链接
+
+        Returns:
+            内容是否已经存在(即本次去重节省了空间)
+        """
+        source, dest = Path(source), Path(dest)
+        obj = self.object_path(digest or content_hash(source), source.suffix)
+        existed = obj.exists()
+        if not existed:
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            tmp_obj = obj.with_name(f".{obj.name}.{os.getpid()}.tmp")
+            if tmp_obj.exists():
+                tmp_obj.unlink()
+            # 源文件通常是下载工作区中随后会被删除的文件, 直接链接而不复制数据
+            try:
+                os.link(source, tmp_obj)
+            except OSError:
+                shutil.copy2(source, tmp_obj)
+            os.replace(tmp_obj, obj)
+
+        # 首次出现的页面在原地去重时, 对象就是由dest链接而来, 无需再链接
+        if dest.exists() and os.path.samefile(obj, dest):
+            return existed
+
+        tmp_dest = dest.with_name(f".{dest.name}.tmp")
+        if tmp_dest.exists():
+            tmp_dest.unlink()
+        try:
+            os.link(obj, tmp_dest)
+        except OSError as e:
+            logger.debug(f"无法创建硬链接, 改为复制: {e}")
+            shutil.copy2(obj, tmp_dest)
+            existed = False
+        os.replace(tmp_dest, dest)
+        # 两者已经是同一文件时rename什么也不做, 临时链接仍然留在原处
+        if tmp_dest.exists():
+            tmp_dest.unlink()
+        return existed
+
+    def dedup_dir(self, comic_dir: Path) -> Tuple[int, int]:
+        """把漫画目录中已有的页面替换为指向对象的硬链接
+
+        Returns:
+            (处理的页面数, 节省的字节数)
+        """
+        count = saved = 0
+        for path in list_pages(Path(comic_dir)):
+            st = path.stat()
+            digest = content_hash(path)
+            obj = self.object_path(digest, path.suffix)
+            if obj.exists() and os.path.samefile(obj, path):
+                continue
+            if self.store(path, path, digest):
+                saved += st.st_size
+            count += 1
+        return count, saved
+
+    def gc(self) -> Tuple[int, int]:
+        """删除链接数为1(没有漫画引用)的对象
+
+        Returns:
+            (删除的对象数, 释放的字节数)
+        """
+        removed = freed = 0
+        if not self.object_dir.exists():
+            return removed, freed
+        for path in self.object_dir.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            st = path.stat()
+            if st.st_nlink <= 1:
+                path.unlink()
+                removed += 1
+                freed += st.st_size
+        return removed, freed
+
+
+def space_report(target_dir: str) -> Dict[str, int]:
+    """统计漫画目录中页面的逻辑大小与实际占用(相同inode只计一次)"""
+    logical = pages = 0
+    inodes: Dict[Tuple[int, int], int] = {}
+    for comic_dir in Path(target_dir).iterdir():
+        if not comic_dir.is_dir() or comic_dir.name.startswith("."):
+            continue
+        for path in list_pages(comic_dir):
+            st = path.stat()
+            pages += 1
+            logical += st.st_size
+            inodes[(st.st_dev, st.st_ino)] = st.st_size
+    physical = sum(inodes.values())
+    return {
+        "pages": pages,
+        "uniquePages": len(inodes),
+        "logicalBytes": logical,
+        "physicalBytes": physical,
+        "savedBytes": logical - physical,
+    }
+
+
+def create_object_store(settings) -> PageObjectStore:
+    # 硬链接要求对象目录与漫画目录位于同一文件系统, 默认放在漫画目录旁边
+    object_dir = settings.page_object_dir or os.path.join(os.path.dirname(settings.TARGET_DIR), ".page_objects")
+    return PageObjectStore(object_dir)
+
+
+def main():
+    """对已有漫画去重, 或统计节省的空间、清理未引用的对象"""
+    from app.config.settings import get_settings
+
+    settings = get_settings()
+    store = create_object_store(settings)
+    args = sys.argv[1:]
+
+    if "--report" in args:
+        report = space_report(settings.TARGET_DIR)
+        print(f"页面: {report['pages']} (不同内容 {report['uniquePages']})")
+        print(f"逻辑大小: {report['logicalBytes'] / 1048576:.1f} MB")
+        print(f"实际占用: {report['physicalBytes'] / 1048576:.1f} MB")
+        print(f"节省空间: {report['savedBytes'] / 1048576:.1f} MB")
+        return
+
+    if "--gc" in args:
+        removed, freed = store.gc()
+        print(f"删除 {removed} 个未引用的对象, 释放 {freed / 1048576:.1f} MB")
+        return
+
+    total_count = total_saved = 0
+    for comic_dir in sorted(Path(settings.TARGET_DIR).iterdir()):
+        if comic_dir.is_dir() and not comic_dir.name.startswith("."):
+            count, saved = store.dedup_dir(comic_dir)
+            total_count += count
+            total_saved += saved
+    print(f"处理 {total_count} 个页面, 节省 {total_saved / 1048576:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
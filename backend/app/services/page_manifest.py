@@ -0,0 +1,368 @@
+"""漫画页面清单
+
+入库时为每个漫画目录生成manifest.json, 记录每页的文件名、宽高、字节数、
+内容哈希、CRC32与极小的低质量占位图(LQIP), 阅读器据此提前预留版面并渐进加载。
+章节页面接口以清单为准, 不再依赖可能不准确的pageCount。
+
+用法:
+    python -m app.services.page_manifest [漫画ID ...]
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow为可选依赖, 未安装时不生成LQIP
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+PAGE_PATTERN = re.compile(r"^(\d+)\.(webp|jpe?g|png|gif)$", re.IGNORECASE)
+
+LQIP_SIZE = 16
+
+
+def file_hash(path: Path) -> Tuple[str, int]:
+    """文件内容的blake2b哈希(128位)与CRC32(用于打包下载的zip)"""
+    with open(path, "rb") as f:
+        return _stream_hash(f)
+
+
+def _stream_hash(f: BinaryIO) -> Tuple[str, int]:
+    hasher = hashlib.blake2b(digest_size=16)
+    crc = 0
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        hasher.update(chunk)
+        crc = zlib.crc32(chunk, crc)
+    return hasher.hexdigest(), crc
+
+
+def image_size(path: Union[Path, BinaryIO]) -> Optional[Tuple[int, int]]:
+    """只读取文件头获取图片宽高, 支持webp/png/gif/jpeg
+
+    Args:
+        path: 文件路径或已打开的二进制文件对象
+
+    Returns:
+        (宽, 高), 无法识别时为None
+    """
+    if hasattr(path, "read"):
+        return _image_size(path)
+    with open(path, "rb") as f:
+        return _image_size(f)
+
+
+def _image_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    head = f.read(32)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", head[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(head[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+        return None
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack("<HH", head[6:10])
+    if head[:2] == b"\xff\xd8":
+        return _jpeg_size(f)
+    return None
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        # SOF0-SOF15, 排除DHT(C4)、JPG(C8)、DAC(CC)
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def is_complete_image(path: Path) -> bool:
+    """按格式检查文件尾(或webp声明的长度), 判断图片是否被完整写入"""
+    try:
+        size = path.stat().st_size
+        with open(path, "rb") as f:
+            head = f.read(12)
+            f.seek(max(size - 16, 0))
+            tail = f.read()
+    except OSError:
+        return False
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return struct.unpack("<I", head[4:8])[0] + 8 <= size
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return tail.endswith(b"IEND\xaeB`\x82")
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return tail.endswith(b";")
+    if head[:2] == b"\xff\xd8":
+        # 部分编码器会在EOI之后追加填充字节
+        return b"\xff\xd9" in tail
+    return False
+
+
+def make_lqip(path: Union[Path, BinaryIO]) -> Optional[str]:
+    """生成宽高不超过16像素的占位图data URI, 未安装Pillow时为None"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            img.draft("RGB", (LQIP_SIZE * 4, LQIP_SIZE * 4))
+            img = img.convert("RGB")
+            img.thumbnail((LQIP_SIZE, LQIP_SIZE))
+            buffer = io.BytesIO()
+            img.save(buffer, format="WEBP", quality=30)
+    except Exception as e:
+        logger.warning(f"生成占位图失败: {getattr(path, 'name', path)}: {e}")
+        return None
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def page_number(name: str) -> Optional[int]:
+    match = PAGE_PATTERN.match(name)
+    return int(match.group(1)) if match else None
+
+
+def list_pages(comic_dir: Path) -> List[Path]:
+    """漫画目录中按页码排序的页面图片(散文件)"""
+    pages = []
+    for path in comic_dir.iterdir():
+        number = page_number(path.name)
+        if number is not None and path.is_file():
+            pages.append((number, path))
+    return [path for _, path in sorted(pages)]
+
+
+def page_entry(path: Path) -> Dict:
+    size = image_size(path) or (None, None)
+    digest, crc = file_hash(path)
+    return {
+        "file": path.name,
+        "width": size[0],
+        "height": size[1],
+        "bytes": path.stat().st_size,
+        "hash": digest,
+        "crc32": crc,
+        "lqip": make_lqip(path),
+    }
+
+
+def packed_page_entry(name: str, data: bytes) -> Dict:
+    """打包文件中一页的清单条目"""
+    digest, crc = _stream_hash(io.BytesIO(data))
+    size = image_size(io.BytesIO(data)) or (None, None)
+    return {
+        "file": name,
+        "width": size[0],
+        "height": size[1],
+        "bytes": len(data),
+        "hash": digest,
+        "crc32": crc,
+        "lqip": make_lqip(io.BytesIO(data)),
+    }
+
+
+def build_manifest(comic_dir: Path, previous: Optional[Dict] = None) -> Dict:
+    """扫描漫画目录生成清单, 大小未变的页面沿用previous中的数据
+
+    与PageStore一致, 打包文件(pages.idx)中的页面优先, 其余页面取自散文件。
+    """
+    from app.services.page_pack import read_pack, read_slice
+
+    comic_dir = Path(comic_dir)
+    reuse = {}
+    if previous:
+        reuse = {page["file"]: page for page in previous.get("pages", [])}
+
+    pack_name, packed = read_pack(comic_dir) or (None, {})
+    names = {name: None for name in packed if page_number(name) is not None}
+    for path in list_pages(comic_dir):
+        names.setdefault(path.name, path)
+
+    pages = []
+    pack = open(comic_dir / pack_name, "rb") if packed else None
+    try:
+        for name in sorted(names, key=page_number):
+            path = names[name]
+            size = path.stat().st_size if path is not None else packed[name][1]
+            old = reuse.get(name)
+            if old is not None and old.get("bytes") == size and old.get("crc32") is not None:
+                pages.append(old)
+            elif path is not None:
+                pages.append(page_entry(path))
+            else:
+                pages.append(packed_page_entry(name, read_slice(pack, *packed[name])))
+    finally:
+        if pack is not None:
+            pack.close()
+    return {"version": MANIFEST_VERSION, "pages": pages}
+
+
+def write_manifest(comic_dir: Path) -> Dict:
+    """生成并原子写入漫画目录的清单
+
+    找不到任何页面时不写入, 已有的非空清单保持不变。
+    """
+    comic_dir = Path(comic_dir)
+    previous = read_manifest(comic_dir)
+    manifest = build_manifest(comic_dir, previous)
+    if not manifest["pages"]:
+        logger.warning(f"漫画目录中没有页面, 不写入空的页面清单: {comic_dir}")
+        return previous if previous is not None and previous.get("pages") else manifest
+    path = comic_dir / MANIFEST_NAME
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(comic_dir: Path) -> Optional[Dict]:
+    path = Path(comic_dir) / MANIFEST_NAME
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+class ManifestStore:
+    """按文件修改时间缓存的页面清单, 缺失时在首次访问时生成"""
+
+    def __init__(self, target_dir: str, page_store=None):
+        self.target_dir = Path(target_dir)
+        # PageStore, 校验时按打包文件或散文件取页面大小
+        self.page_store = page_store
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[int, Dict]] = {}
+
+    def get(self, comic_id: str) -> Optional[Dict]:
+        """漫画的页面清单, 漫画目录不存在时为None"""
+        comic_dir = self.target_dir / comic_id
+        path = comic_dir / MANIFEST_NAME
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+
+        if mtime is not None:
+            with self._lock:
+                cached = self._cache.get(comic_id)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            manifest = read_manifest(comic_dir)
+            if manifest is not None:
+                with self._lock:
+                    self._cache[comic_id] = (mtime, manifest)
+                return manifest
+
+        if not comic_dir.is_dir():
+            return None
+        logger.info(f"漫画 {comic_id} 没有页面清单, 正在生成")
+        manifest = write_manifest(comic_dir)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            # 没有页面时不写入清单, 也不缓存, 页面就位后再生成
+            return manifest
+        with self._lock:
+            self._cache[comic_id] = (mtime, manifest)
+        return manifest
+
+    def generation(self, comic_id: str) -> Optional[int]:
+        """清单文件的修改时间(纳秒), 用作缓存键的一部分; 清单不存在时为None"""
+        try:
+            return (self.target_dir / comic_id / MANIFEST_NAME).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def pages(self, comic_id: str, verify: bool = False) -> List[Dict]:
+        """漫画的页面列表
+
+        Args:
+            verify: 检查清单中的文件大小与磁盘一致, 不一致时重新生成清单
+        """
+        manifest = self.get(comic_id)
+        if manifest is None:
+            return []
+        if verify and not self._matches_disk(comic_id, manifest):
+            logger.info(f"漫画 {comic_id} 的页面清单已过期, 正在重新生成")
+            manifest = write_manifest(self.target_dir / comic_id)
+            self.discard(comic_id)
+        return manifest["pages"]
+
+    def _matches_disk(self, comic_id: str, manifest: Dict) -> bool:
+        comic_dir = self.target_dir / comic_id
+        for page in manifest["pages"]:
+            if page.get("crc32") is None:
+                return False
+            if self.page_store is not None:
+                size = self.page_store.size(comic_id, page["file"])
+            else:
+                try:
+                    size = (comic_dir / page["file"]).stat().st_size
+                except OSError:
+                    size = None
+            if size != page["bytes"]:
+                return False
+        return True
+
+    def discard(self, comic_id: str):
+        with self._lock:
+            self._cache.pop(comic_id, None)
+
+
+def main():
+    """为指定漫画(默认全部)重新生成页面清单"""
+    from app.config.settings import get_settings
+
+    target_dir = Path(get_settings().TARGET_DIR)
+    comic_ids = sys.argv[1:] or sorted(d.name for d in target_dir.iterdir() if d.is_dir() and not d.name.startswith("."))
+    for comic_id in comic_ids:
+        comic_dir = target_dir / comic_id
+        if not comic_dir.is_dir():
+            print(f"漫画目录不存在: {comic_dir}")
+            continue
+        manifest = write_manifest(comic_dir)
+        print(f"{comic_id}: {len(manifest['pages'])} 页")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""打包存储的漫画页面
+
+可选的存储格式: 每个漫画目录中的全部页面顺序写入一个打包文件,
+pages.idx记录打包文件名与每页的偏移量与长度。大型漫画库因此不再需要数百万个小文件,
+读取页面时只需在同一个打包文件上按偏移量读取。没有打包文件的漫画仍使用散文件。
+
+每次打包写入新的打包文件(pages.{代号}.pack), 替换索引后再删除旧文件, 持有旧索引的
+读取方只会读到旧文件中的正确数据或找不到文件, 不会按旧偏移量读到新文件的内容。
+
+用法:
+    python -m app.services.page_pack [--remove-loose] [漫画ID ...]   打包
+    python -m app.services.page_pack --unpack [漫画ID ...]           还原为散文件
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.services.page_manifest import list_pages, write_manifest
+
+logger = logging.getLogger(__name__)
+
+# 索引中没有记录打包文件名时(旧版本)使用的文件名
+PACK_NAME = "pages.pack"
+PACK_PATTERN = re.compile(r"^pages(\.[0-9a-f]+)?\.pack$")
+INDEX_NAME = "pages.idx"
+INDEX_VERSION = 1
+
+# 页面在打包文件中按该值对齐, 便于按页读取时与文件系统块对齐
+ALIGNMENT = 4096
+
+
+class PageLocation(NamedTuple):
+    """页面数据所在的文件与区间, length为None表示整个文件"""
+    name: str
+    path: Path
+    offset: int = 0
+    length: Optional[int] = None
+
+
+def read_pack(comic_dir: Path) -> Optional[Tuple[str, Dict[str, Tuple[int, int]]]]:
+    """读取索引
+
+    Returns:
+        (打包文件名, 文件名 -> (偏移量, 长度)), 没有打包文件时为None
+    """
+    try:
+        with open(Path(comic_dir) / INDEX_NAME, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != INDEX_VERSION:
+        return None
+    pack_name = data.get("pack", PACK_NAME)
+    if not PACK_PATTERN.match(pack_name):
+        return None
+    return pack_name, {name: (offset, length) for name, offset, length in data["pages"]}
+
+
+def read_index(comic_dir: Path) -> Optional[Dict[str, Tuple[int, int]]]:
+    pack = read_pack(comic_dir)
+    return pack[1] if pack is not None else None
+
+
+def pack_comic(comic_dir: Path, remove_loose: bool = False) -> int:
+    """把漫画目录中的散页面写入打包文件
+
+    先写临时文件再原子替换, 打包过程中读取方仍能读到旧数据。
+    删除散文件前会先生成页面清单, 之后清单不再需要扫描目录。
+
+    Returns:
+        打包的页面数
+    """
+    comic_dir = Path(comic_dir)
+    pages = list_pages(comic_dir)
+    if not pages:
+        return 0
+
+    write_manifest(comic_dir)
+
+    entries: List[Tuple[str, int, int]] = []
+    pack_name = f"pages.{time.time_ns():x}.pack"
+    pack_path = comic_dir / pack_name
+    tmp_pack = pack_path.with_name(f".{pack_name}.tmp")
+    with open(tmp_pack, "wb") as out:
+        for path in pages:
+            padding = -out.tell() % ALIGNMENT
+            if padding:
+                out.write(b"\0" * padding)
+            offset = out.tell()
+            with open(path, "rb") as f:
+                length = 0
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    out.write(chunk)
+                    length += len(chunk)
+            entries.append((path.name, offset, length))
+        out.flush()
+        os.fsync(out.fileno())
+
+    index_path = comic_dir / INDEX_NAME
+    tmp_index = index_path.with_name(f".{INDEX_NAME}.tmp")
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "pack": pack_name, "pages": entries}, f, separators=(",", ":"))
+
+    # 新打包文件使用新文件名, 就位后再替换索引, 最后删除不再被索引引用的旧打包文件
+    os.replace(tmp_pack, pack_path)
+    os.replace(tmp_index, index_path)
+    remove_stale_packs(comic_dir, pack_name)
+
+    if remove_loose:
+        for path in pages:
+            path.unlink()
+    return len(entries)
+
+
+def remove_stale_packs(comic_dir: Path, keep: Optional[str] = None):
+    """删除索引不再引用的打包文件(包括中断的打包留下的文件)"""
+    for path in Path(comic_dir).iterdir():
+        if PACK_PATTERN.match(path.name) and path.name != keep:
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"删除旧打包文件失败: {path}: {e}")
+
+
+def unpack_comic(comic_dir: Path) -> int:
+    """把打包文件还原为散文件并删除打包文件
+
+    Returns:
+        还原的页面数
+    """
+    comic_dir = Path(comic_dir)
+    packed = read_pack(comic_dir)
+    if packed is None:
+        return 0
+
+    pack_name, index = packed
+    with open(comic_dir / pack_name, "rb") as pack:
+        for name, (offset, length) in index.items():
+            target = comic_dir / name
+            if target.exists():
+                continue
+            tmp_path = target.with_name(f".{name}.tmp")
+            with open(tmp_path, "wb") as out:
+                out.write(read_slice(pack, offset, length))
+            os.replace(tmp_path, target)
+
+    (comic_dir / INDEX_NAME).unlink()
+    remove_stale_packs(comic_dir)
+    return len(index)
+
+
+def read_slice(f, offset: int, length: int) -> bytes:
+    """读取文件中的一段, 不改变共享文件对象的读取位置"""
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), length, offset)
+    f.seek(offset)  # Windows
+    return f.read(length)
+
+
+def read_page(location: PageLocation) -> bytes:
+    """读取整页数据"""
+    with open(location.path, "rb") as f:
+        if location.length is None:
+            return f.read()
+        return read_slice(f, location.offset, location.length)
+
+
+class PageStore:
+    """按漫画ID与文件名定位页面数据, 优先使用打包文件, 否则使用散文件"""
+
+    def __init__(self, target_dir: str):
+        self.target_dir = Path(target_dir)
+        self._lock = threading.Lock()
+        # 漫画ID -> (索引文件修改时间, (打包文件名, 文件名 -> (偏移量, 长度)))
+        self._indexes: Dict[str, Tuple[int, Tuple[str, Dict[str, Tuple[int, int]]]]] = {}
+
+    def _index(self, comic_id: str) -> Optional[Tuple[str, Dict[str, Tuple[int, int]]]]:
+        comic_dir = self.target_dir / comic_id
+        try:
+            mtime = (comic_dir / INDEX_NAME).stat().st_mtime_ns
+        except OSError:
+            if comic_id in self._indexes:
+                with self._lock:
+                    self._indexes.pop(comic_id, None)
+            return None
+
+        with self._lock:
+            cached = self._indexes.get(comic_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        packed = read_pack(comic_dir)
+        if packed is not None:
+            with self._lock:
+                self._indexes[comic_id] = (mtime, packed)
+        return packed
+
+    def locate(self, comic_id: str, name: str) -> Optional[PageLocation]:
+        """页面数据的位置, 页面不存在时为None"""
+        packed = self._index(comic_id)
+        if packed is not None and name in packed[1]:
+            pack_name, index = packed
+            offset, length = index[name]
+            return PageLocation(name, self.target_dir / comic_id / pack_name, offset, length)
+
+        path = self.target_dir / comic_id / name
+        if path.is_file():
+            return PageLocation(name, path)
+        return None
+
+    def size(self, comic_id: str, name: str) -> Optional[int]:
+        location = self.locate(comic_id, name)
+        if location is None:
+            return None
+        if location.length is not None:
+            return location.length
+        try:
+            return location.path.stat().st_size
+        except OSError:
+            return None
+
+
+def main():
+    """打包或还原指定漫画(默认全部)的页面"""
+    from app.config.settings import get_settings
+
+    args = sys.argv[1:]
+    remove_loose = "--remove-loose" in args
+    unpack = "--unpack" in args
+    comic_ids = [arg for arg in args if not arg.startswith("--")]
+
+    target_dir = Path(get_settings().TARGET_DIR)
+    if not comic_ids:
+        comic_ids = sorted(d.name for d in target_dir.iterdir() if d.is_dir() and not d.name.startswith("."))
+
+    for comic_id in comic_ids:
+        comic_dir = target_dir / comic_id
+        if not comic_dir.is_dir():
+            print(f"漫画目录不存在: {comic_dir}")
+            continue
+        if unpack:
+            print(f"{comic_id}: 还原 {unpack_comic(comic_dir)} 页")
+        else:
+            print(f"{comic_id}: 打包 {pack_comic(comic_dir, remove_loose)} 页")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""漫画热度统计
+
+在内存中累计详情页浏览与章节阅读次数, 按指数衰减计算热度,
+由后台任务按固定间隔在线程池中批量写入磁盘, 记录访问时不做任何磁盘IO。
+
+衰减使用固定参考时间: 内部分值 = 热度 * exp(λ * (t - t0)),
+所有漫画随时间按相同比例衰减, 因此一次访问只会增大一个漫画的分值,
+排行榜可以只维护前K名的有序列表, 而无需每次请求重新排序整个目录。
+"""
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 访问类型对应的热度权重
+DETAIL_VIEW = 1.0
+CHAPTER_READ = 2.0
+
+# 参考时间的指数超过该值时重新归一化, 防止浮点溢出
+_MAX_EXPONENT = 50.0
+
+
+class PopularityTracker:
+    """带时间衰减的漫画热度计数器"""
+
+    def __init__(self, path: str, half_life: float = 7 * 86400, flush_interval: float = 60,
+                 top_size: int = 1000, catalog=None):
+        self.path = Path(path)
+        self.decay_rate = math.log(2) / half_life
+        self.flush_interval = flush_interval
+        self.top_size = top_size
+
+        self._lock = threading.RLock()
+        self._scores: Dict[str, float] = {}
+        self._reference_time = time.time()
+        # 前top_size名, 按(-分值, 漫画ID)升序排列
+        self._top: List[Tuple[float, str]] = []
+
+        self._dirty = False
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+        self._load()
+
+        self.catalog = catalog
+        if catalog is not None:
+            catalog.add_listener(self.on_catalog_change)
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取热度数据失败, 从零开始统计: {e}")
+            return
+
+        self._reference_time = data.get("time", time.time())
+        self._scores = {k: float(v) for k, v in data.get("scores", {}).items() if v > 0}
+        self._rebuild_top()
+        logger.info(f"已加载 {len(self._scores)} 个漫画的热度数据")
+
+    def _rebuild_top(self):
+        top = heapq.nlargest(self.top_size, self._scores.items(), key=lambda item: item[1])
+        self._top = sorted((-score, comic_id) for comic_id, score in top)
+
+    def _normalize(self, now: float):
+        """把参考时间移动到now, 所有内部分值同比例缩小"""
+        factor = math.exp(-self.decay_rate * (now - self._reference_time))
+        self._scores = {k: v * factor for k, v in self._scores.items() if v * factor > 1e-9}
+        self._reference_time = now
+        self._rebuild_top()
+
+    def record(self, comic_id: str, weight: float = DETAIL_VIEW):
+        """记录一次访问"""
+        now = time.time()
+        with self._lock:
+            exponent = self.decay_rate * (now - self._reference_time)
+            if exponent > _MAX_EXPONENT:
+                self._normalize(now)
+                exponent = 0.0
+
+            old_score = self._scores.get(comic_id)
+            new_score = (old_score or 0.0) + weight * math.exp(exponent)
+            self._scores[comic_id] = new_score
+
+            if old_score is not None:
+                i = bisect.bisect_left(self._top, (-old_score, comic_id))
+                if i < len(self._top) and self._top[i] == (-old_score, comic_id):
+                    del self._top[i]
+            entry = (-new_score, comic_id)
+            if len(self._top) < self.top_size or entry < self._top[-1]:
+                bisect.insort(self._top, entry)
+                if len(self._top) > self.top_size:
+                    self._top.pop()
+
+            self._dirty = True
+
+    def remove(self, comic_id: str):
+        """删除漫画的热度数据"""
+        with self._lock:
+            if self._scores.pop(comic_id, None) is None:
+                return
+            self._rebuild_top()
+            self._dirty = True
+
+    def on_catalog_change(self, action: str, comic_id: str, comic: Optional[Dict]):
+        """目录变更监听器: 删除漫画时同时清除其热度"""
+        if action == "delete":
+            self.remove(comic_id)
+
+    def score(self, comic_id: str) -> float:
+        """当前时刻的衰减后热度"""
+        with self._lock:
+            value = self._scores.get(comic_id, 0.0)
+            return value * math.exp(-self.decay_rate * (time.time() - self._reference_time))
+
+    def top(self, offset: int = 0, limit: int = 20, candidates: Optional[Set[str]] = None) -> List[str]:
+        """按热度降序返回漫画ID
+
+        只包含有访问记录的漫画。优先从前K名有序列表中读取,
+        超出前K名时才对剩余漫画排序。
+
+        Args:
+            candidates: 只在这些漫画中排序, 为None时不做限制
+        """
+        offset = max(offset, 0)
+        end = offset + max(limit, 0)
+
+        with self._lock:
+            result = []
+            for _, comic_id in self._top:
+                if candidates is None or comic_id in candidates:
+                    result.append(comic_id)
+                    if len(result) >= end:
+                        return result[offset:end]
+
+            if len(self._top) < self.top_size:
+                # 前K名列表未满, 说明已经包含了全部有热度的漫画
+                return result[offset:end]
+
+            in_top = {comic_id for _, comic_id in self._top}
+            source = self._scores.keys() if candidates is None else candidates
+            rest = (
+                (comic_id, self._scores[comic_id]) for comic_id in source
+                if comic_id in self._scores and comic_id not in in_top
+            )
+            more = heapq.nlargest(end - len(result), rest, key=lambda item: item[1])
+            result.extend(comic_id for comic_id, _ in more)
+            return result[offset:end]
+
+    def count(self, candidates: Optional[Set[str]] = None) -> int:
+        """有热度的漫画数量"""
+        with self._lock:
+            if candidates is None:
+                return len(self._scores)
+            return sum(1 for comic_id in candidates if comic_id in self._scores)
+
+    def rank(self, offset: int = 0, limit: int = 20, comic_ids: Optional[Sequence[str]] = None) -> List[str]:
+        """按热度排序的一页漫画ID, 没有热度的漫画按原有顺序排在后面
+
+        Args:
+            comic_ids: 参与排序的漫画ID, 为None时使用整个目录
+        """
+        offset = max(offset, 0)
+        limit = max(limit, 0)
+        candidates = None if comic_ids is None else set(comic_ids)
+
+        result = self.top(offset, limit, candidates)
+        if len(result) >= limit:
+            return result
+
+        if comic_ids is None:
+            comic_ids = [comic["id"] for comic in self.catalog.list_comics()] if self.catalog else []
+        with self._lock:
+            skip = max(offset - self.count(candidates), 0)
+            unscored = (comic_id for comic_id in comic_ids if comic_id not in self._scores)
+            result.extend(itertools.islice(unscored, skip, skip + limit - len(result)))
+        return result
+
+    def start(self):
+        """启动后台写入任务, 需要在事件循环中调用"""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """停止后台写入任务并写入尚未保存的数据"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await asyncio.to_thread(self.flush)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"写入热度数据失败: {e}")
+
+    def flush(self):
+        """把当前热度写入磁盘, 在线程池中调用; 同一时刻只有一次写入"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                now = time.time()
+                factor = math.exp(-self.decay_rate * (now - self._reference_time))
+                data = {
+                    "time": now,
+                    "scores": {k: v * factor for k, v in self._scores.items()},
+                }
+                self._dirty = False
+
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"写入热度数据失败: {e}")
+                self._dirty = True
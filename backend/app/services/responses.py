@@ -0,0 +1,112 @@
+"""预序列化的API响应
+
+漫画与章节的封面在加载时一次性转换为完整URL, 热门接口的JSON字节
+按目录版本号缓存, 命中时直接返回, 跳过pydantic校验与序列化。
+依赖目录以外数据的响应(如章节页面)需要把对应的版本放进缓存键。
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from app.utils.url import get_static_url
+
+logger = logging.getLogger(__name__)
+
+COMIC_FIELDS = ("id", "title", "cover", "author", "description", "tags", "updateTime", "status")
+CHAPTER_FIELDS = ("id", "comicId", "title", "order", "updateTime", "pageCount", "cover")
+
+
+def dump_json(data: Any) -> bytes:
+    """与FastAPI JSONResponse相同的紧凑格式"""
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class ResponseCache:
+    """按目录版本号缓存的响应字节"""
+
+    def __init__(self, catalog, settings, max_entries: int = 4096):
+        self.catalog = catalog
+        self.settings = settings
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._comics: Dict[str, Dict] = {}
+        self._version = -1
+        self._bytes: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+        catalog.add_listener(self.on_catalog_change)
+
+    def _resolve_url(self, path: Optional[str]) -> Optional[str]:
+        if path and not path.startswith(("http://", "https://")):
+            return get_static_url(path, self.settings)
+        return path
+
+    def _resolve_cover(self, path: Optional[str]) -> Optional[str]:
+        """封面使用缩略图, 避免列表页下载整页原图"""
+        if path and self.settings.image_variants_enabled and not path.startswith(("http://", "https://")):
+            return f"{get_static_url(path, self.settings)}?w={self.settings.image_cover_width}"
+        return self._resolve_url(path)
+
+    def on_catalog_change(self, action: str, comic_id: str, comic: Optional[Dict]):
+        """目录变更监听器: 维护已转换封面URL的漫画数据"""
+        if action == "delete":
+            self._comics.pop(comic_id, None)
+            return
+
+        payload = {field: comic.get(field) for field in COMIC_FIELDS}
+        payload["cover"] = self._resolve_cover(payload["cover"])
+        payload["chapters"] = None
+        self._comics[comic_id] = payload
+
+    def comic(self, comic_id: str) -> Optional[Dict]:
+        """列表中使用的漫画数据, 调用方不要修改"""
+        return self._comics.get(comic_id)
+
+    def comics(self, comic_ids) -> List[Dict]:
+        """按顺序返回多个漫画, 忽略不存在的ID"""
+        comics = (self._comics.get(comic_id) for comic_id in comic_ids)
+        return [comic for comic in comics if comic]
+
+    def comic_detail(self, comic_id: str) -> Optional[Dict]:
+        """带章节列表的漫画详情"""
+        comic = self._comics.get(comic_id)
+        if comic is None:
+            return None
+
+        detail = dict(comic)
+        if self.catalog.has_chapter_list():
+            chapters = []
+            for chapter in self.catalog.get_chapters(comic_id):
+                payload = {field: chapter.get(field) for field in CHAPTER_FIELDS}
+                payload["cover"] = self._resolve_cover(payload["cover"])
+                chapters.append(payload)
+            detail["chapters"] = chapters
+        return detail
+
+    def get(self, key: Hashable, build: Callable[[], Any]) -> bytes:
+        """返回key对应的JSON字节, 目录版本变化后重新构建
+
+        build抛出的异常(如HTTPException)原样向上传递, 不会被缓存。
+        """
+        self.catalog.refresh()
+        version = self.catalog.version
+
+        with self._lock:
+            if version != self._version:
+                self._bytes.clear()
+                self._version = version
+            content = self._bytes.get(key)
+            if content is not None:
+                self._bytes.move_to_end(key)
+                return content
+
+        content = dump_json(build())
+
+        with self._lock:
+            if version == self._version:
+                self._bytes[key] = content
+                if len(self._bytes) > self.max_entries:
+                    self._bytes.popitem(last=False)
+        return content
@@ -0,0 +1,201 @@
+"""漫画搜索倒排索引
+
+中日韩文字按单字与相邻双字(bigram)切分, 其余文字(拉丁、西里尔等)按单词切分,
+覆盖标题、作者、简介与标签。索引随目录变更事件增量更新。
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 平假名/片假名、CJK统一表意文字(含扩展A与兼容区)、韩文音节
+_CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# 其余文字按Unicode字母数字切分, 不含下划线与中日韩文字
+_TOKEN_RE = re.compile(f"([{_CJK_CHARS}]+)|([^\\W_{_CJK_CHARS}]+)")
+_PHRASE_RE = re.compile(r'"([^"]+)"')
+
+# 各字段命中时的权重
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "author": 2.0,
+    "tags": 2.0,
+    "description": 1.0,
+}
+
+
+def normalize(text: str) -> str:
+    """全角转半角并统一大小写(casefold, 如ß与ss视为相同)"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """切分已规范化的文本
+
+    中日韩文字连续片段输出每个单字及相邻双字, 其余输出Unicode字母数字单词。
+    """
+    for match in _TOKEN_RE.finditer(text):
+        run = match.group(1)
+        if run is None:
+            yield match.group(2)
+            continue
+        yield from run
+        for i in range(len(run) - 1):
+            yield run[i:i + 2]
+
+
+def query_tokens(term: str) -> Set[str]:
+    """查询词的检索token: 中日韩片段只取双字, 单字片段才使用单字"""
+    tokens = set()
+    for match in _TOKEN_RE.finditer(term):
+        run = match.group(1)
+        if run is None:
+            tokens.add(match.group(2))
+        elif len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class SearchIndex:
+    """漫画倒排索引, 支持相关度排序、多词AND与引号短语查询"""
+
+    def __init__(self, catalog=None):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_tokens: Dict[str, Dict[str, float]] = {}
+        self._doc_texts: Dict[str, str] = {}
+
+        self.catalog = catalog
+        if catalog is not None:
+            catalog.add_listener(self.on_catalog_change)
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    def on_catalog_change(self, action: str, comic_id: str, comic: Optional[Dict]):
+        """目录变更监听器"""
+        if action == "delete":
+            self.remove(comic_id)
+        else:
+            self.add(comic)
+
+    @staticmethod
+    def _fields(comic: Dict) -> Dict[str, str]:
+        return {
+            "title": normalize(comic.get("title", "")),
+            "author": normalize(comic.get("author", "")),
+            "tags": normalize(" ".join(comic.get("tags", []))),
+            "description": normalize(comic.get("description", "")),
+        }
+
+    def add(self, comic: Dict):
+        """新增或替换一个漫画的索引"""
+        comic_id = comic["id"]
+        fields = self._fields(comic)
+
+        weights: Dict[str, float] = {}
+        for field, text in fields.items():
+            field_weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                weights[token] = weights.get(token, 0.0) + field_weight
+
+        with self._lock:
+            self._remove_locked(comic_id)
+            for token, weight in weights.items():
+                self._postings.setdefault(token, {})[comic_id] = weight
+            self._doc_tokens[comic_id] = weights
+            self._doc_texts[comic_id] = "\n".join(fields.values())
+
+    def remove(self, comic_id: str):
+        """移除一个漫画的索引"""
+        with self._lock:
+            self._remove_locked(comic_id)
+
+    def _remove_locked(self, comic_id: str):
+        weights = self._doc_tokens.pop(comic_id, None)
+        if weights is None:
+            return
+        self._doc_texts.pop(comic_id, None)
+        for token in weights:
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(comic_id, None)
+            if not posting:
+                del self._postings[token]
+
+    @staticmethod
+    def parse_query(query: str) -> Tuple[List[str], List[str]]:
+        """拆分查询: 引号内为短语, 其余按空白拆分为AND的词"""
+        query = normalize(query)
+        phrases = [p.strip() for p in _PHRASE_RE.findall(query) if p.strip()]
+        terms = _PHRASE_RE.sub(" ", query).split()
+        return terms, phrases
+
+    def _score_locked(self, query: str) -> Dict[str, float]:
+        terms, phrases = self.parse_query(query)
+
+        tokens: Set[str] = set()
+        for term in terms + phrases:
+            tokens |= query_tokens(term)
+        if not tokens:
+            return {}
+
+        postings = []
+        for token in tokens:
+            posting = self._postings.get(token)
+            if not posting:
+                return {}
+            postings.append((token, posting))
+
+        # 从最短的倒排表开始求交集
+        postings.sort(key=lambda item: len(item[1]))
+        candidates = set(postings[0][1])
+        for _, posting in postings[1:]:
+            candidates.intersection_update(posting.keys())
+            if not candidates:
+                return {}
+
+        # 双字交集只是近似匹配, 引号短语需要逐字核对原文
+        if phrases:
+            candidates = {
+                comic_id for comic_id in candidates
+                if all(phrase in self._doc_texts[comic_id] for phrase in phrases)
+            }
+
+        total_docs = len(self._doc_tokens)
+        scores: Dict[str, float] = {}
+        for token, posting in postings:
+            idf = math.log(1 + total_docs / len(posting))
+            for comic_id in candidates:
+                scores[comic_id] = scores.get(comic_id, 0.0) + posting[comic_id] * idf
+        return scores
+
+    def match(self, query: str) -> Set[str]:
+        """返回匹配查询的全部漫画ID"""
+        if self.catalog is not None:
+            self.catalog.refresh()
+        with self._lock:
+            return set(self._score_locked(query))
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[str]]:
+        """按相关度搜索
+
+        Returns:
+            (匹配总数, 当前页的漫画ID列表)
+        """
+        if self.catalog is not None:
+            self.catalog.refresh()
+        with self._lock:
+            scores = self._score_locked(query)
+
+        offset = max(offset, 0)
+        limit = max(limit, 0)
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: item[1])
+        return len(scores), [comic_id for comic_id, _ in top[offset:offset + limit]]
@@ -0,0 +1,258 @@
+"""漫画列表的预排序视图与游标分页
+
+按加入顺序、更新时间与标题维护有序列表, 随目录变更事件增量插入/删除,
+分页时无需对整个目录排序。游标记录上一页最后一项的排序键(keyset),
+即使下载过程中插入了新漫画, 后续页也不会重复或遗漏。
+"""
+import base64
+import bisect
+import heapq
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Entry = Tuple[Any, str]
+
+# 排序方式 -> (视图名, 是否降序)
+SORTS = {
+    "default": ("order", False),
+    "newest": ("update_time", True),
+    "latest": ("update_time", True),
+    "oldest": ("update_time", False),
+    "title": ("title", False),
+}
+POPULAR = "popular"
+RELEVANCE = "relevance"
+
+# 视图名 -> keyset游标中排序键的类型
+KEY_TYPES = {
+    "order": int,
+    "update_time": str,
+    "title": str,
+}
+
+
+def encode_cursor(sort: str, entry: Optional[Entry] = None, offset: Optional[int] = None) -> str:
+    """生成不透明的分页游标"""
+    data = {"s": sort}
+    if entry is not None:
+        data["k"] = list(entry)
+    else:
+        data["o"] = offset
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Optional[Entry], Optional[int]]:
+    """解析分页游标
+
+    Returns:
+        (排序方式, keyset排序键, 偏移量), 排序键与偏移量只有一个不为None
+
+    Raises:
+        ValueError: 游标格式无效, 或排序键与排序方式不匹配
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw.decode("utf-8"))
+        sort = data["s"]
+        if "k" in data:
+            key, comic_id = data["k"]
+            entry = (key, comic_id)
+            offset = None
+        else:
+            entry = None
+            offset = data["o"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+    if not isinstance(sort, str) or (sort not in SORTS and sort not in (POPULAR, RELEVANCE)):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    if entry is not None:
+        # 排序键类型必须与视图一致, 否则二分查找时无法比较
+        key_type = KEY_TYPES[SORTS[sort][0]] if sort in SORTS else None
+        if key_type is None or not _is_type(entry[0], key_type) or not isinstance(entry[1], str):
+            raise ValueError(f"无效的分页游标: {cursor}")
+    elif not _is_type(offset, int):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return sort, entry, offset
+
+
+def _is_type(value: Any, expected: type) -> bool:
+    # bool是int的子类, 不能作为页码或顺序
+    return isinstance(value, expected) and not isinstance(value, bool)
+
+
+def resolve_page(sort: str, offset: int, after: Optional[str]) -> Tuple[str, Optional[Entry], int]:
+    """合并offset分页参数与after游标
+
+    提供游标时, 排序方式与位置都以游标为准。
+
+    Returns:
+        (排序方式, keyset排序键, 偏移量)
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    if not after:
+        return sort, None, max(offset, 0)
+    sort, entry, cursor_offset = decode_cursor(after)
+    return sort, entry, max(cursor_offset or 0, 0)
+
+
+class SortedView:
+    """按(排序键, 漫画ID)升序排列的有序列表"""
+
+    def __init__(self, key_func: Callable[[str, Dict], Any]):
+        self.key_func = key_func
+        self._entries: List[Entry] = []
+        self._entry_by_id: Dict[str, Entry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entry(self, comic_id: str) -> Optional[Entry]:
+        return self._entry_by_id.get(comic_id)
+
+    def insert(self, comic_id: str, comic: Dict):
+        entry = (self.key_func(comic_id, comic), comic_id)
+        if self._entry_by_id.get(comic_id) == entry:
+            return
+        self.remove(comic_id)
+        bisect.insort(self._entries, entry)
+        self._entry_by_id[comic_id] = entry
+
+    def remove(self, comic_id: str):
+        entry = self._entry_by_id.pop(comic_id, None)
+        if entry is None:
+            return
+        i = bisect.bisect_left(self._entries, entry)
+        if i < len(self._entries) and self._entries[i] == entry:
+            del self._entries[i]
+
+    def page(self, offset: int, limit: int, descending: bool = False) -> List[Entry]:
+        """按偏移量取一页, O(limit)"""
+        offset = max(offset, 0)
+        limit = max(limit, 0)
+        if not descending:
+            return self._entries[offset:offset + limit]
+        end = len(self._entries) - offset
+        if end <= 0:
+            return []
+        return self._entries[max(end - limit, 0):end][::-1]
+
+    def after(self, entry: Entry, limit: int, descending: bool = False) -> List[Entry]:
+        """取排在entry之后的一页, O(log n + limit)"""
+        limit = max(limit, 0)
+        if not descending:
+            i = bisect.bisect_right(self._entries, entry)
+            return self._entries[i:i + limit]
+        i = bisect.bisect_left(self._entries, entry)
+        return self._entries[max(i - limit, 0):i][::-1]
+
+
+class CatalogViews:
+    """漫画目录的预排序视图集合"""
+
+    def __init__(self, catalog, popularity=None):
+        self.catalog = catalog
+        self.popularity = popularity
+
+        self._lock = threading.Lock()
+        self._next_order = 0
+        self._order: Dict[str, int] = {}
+        self._views = {
+            "order": SortedView(lambda comic_id, comic: self._order[comic_id]),
+            "update_time": SortedView(lambda comic_id, comic: comic.get("updateTime", "")),
+            "title": SortedView(lambda comic_id, comic: comic.get("title", "")),
+        }
+
+        catalog.add_listener(self.on_catalog_change)
+
+    def on_catalog_change(self, action: str, comic_id: str, comic: Optional[Dict]):
+        """目录变更监听器"""
+        with self._lock:
+            if action == "delete":
+                self._order.pop(comic_id, None)
+                for view in self._views.values():
+                    view.remove(comic_id)
+                return
+
+            if comic_id not in self._order:
+                self._order[comic_id] = self._next_order
+                self._next_order += 1
+            for view in self._views.values():
+                view.insert(comic_id, comic)
+
+    def page(self, sort: str, offset: int = 0, limit: int = 20,
+             entry: Optional[Entry] = None) -> Tuple[List[str], Optional[str]]:
+        """整个目录按sort排序后的一页
+
+        Args:
+            entry: keyset游标中的排序键, 提供时忽略offset
+
+        Returns:
+            (漫画ID列表, 下一页游标), 没有下一页时游标为None
+
+        Raises:
+            ValueError: 排序方式无效
+        """
+        self.catalog.refresh()
+
+        if sort == POPULAR:
+            total = len(self._order)
+            comic_ids = self.popularity.rank(offset, limit)
+            end = offset + len(comic_ids)
+            return comic_ids, encode_cursor(sort, offset=end) if end < total else None
+
+        if sort not in SORTS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        view_name, descending = SORTS[sort]
+        view = self._views[view_name]
+
+        with self._lock:
+            if entry is not None:
+                entries = view.after(entry, limit + 1, descending)
+            else:
+                entries = view.page(offset, limit + 1, descending)
+
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        next_cursor = encode_cursor(sort, entry=entries[-1]) if has_more and entries else None
+        return [comic_id for _, comic_id in entries], next_cursor
+
+    def sort_ids(self, comic_ids: Iterable[str], sort: str, offset: int = 0, limit: int = 20,
+                 entry: Optional[Entry] = None) -> Tuple[List[str], Optional[str]]:
+        """对一组漫画ID(如搜索结果)排序并取一页, 只需O(m log k)而非整体排序
+
+        Raises:
+            ValueError: 排序方式无效
+        """
+        if sort == POPULAR:
+            comic_ids = list(comic_ids)
+            page_ids = self.popularity.rank(offset, limit, comic_ids)
+            end = offset + len(page_ids)
+            return page_ids, encode_cursor(sort, offset=end) if end < len(comic_ids) else None
+
+        if sort not in SORTS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        view_name, descending = SORTS[sort]
+        view = self._views[view_name]
+
+        with self._lock:
+            entries = (view.entry(comic_id) for comic_id in comic_ids)
+            entries = [e for e in entries if e is not None]
+
+        if entry is not None:
+            entries = [e for e in entries if (e < entry if descending else e > entry)]
+            offset = 0
+
+        select = heapq.nlargest if descending else heapq.nsmallest
+        top = select(offset + limit + 1, entries)
+        page_entries = top[offset:offset + limit]
+        has_more = len(top) > offset + limit
+        next_cursor = encode_cursor(sort, entry=page_entries[-1]) if has_more and page_entries else None
+        return [comic_id for _, comic_id in page_entries], next_cursor
@@ -0,0 +1,133 @@
+"""入库时的页面转码
+
+可选的入库阶段: 在进程池中把漫画目录中的页面重新编码为配置的格式与质量
+(image_format/image_quality), 长边超过image_max_size时先缩小。已经是目标格式且
+尺寸不超限的页面, 以及重新编码后反而更大的页面保持原样。每页转码前后的大小
+记录在漫画目录的transcode.json中。
+
+页面可能是下载目录或对象目录中文件的硬链接, 转码结果总是写入新文件再替换, 不修改原文件。
+"""
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from app.services.page_manifest import list_pages
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow为可选依赖, 未安装时跳过转码
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+REPORT_NAME = "transcode.json"
+
+# 配置的格式 -> (Pillow格式, 文件扩展名)
+FORMATS = {
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+    "jpg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+}
+
+
+def transcode_page(path: str, image_format: str, quality: int, max_size: int) -> Tuple[str, int, int]:
+    """把单页重新编码为目标格式, 在进程池中执行
+
+    Returns:
+        (处理后的文件名, 原大小, 处理后大小), 保持原样时两个大小相同
+    """
+    path = Path(path)
+    before = path.stat().st_size
+    pil_format, suffix = FORMATS[image_format]
+    with Image.open(path) as img:
+        if getattr(img, "is_animated", False):
+            return path.name, before, before
+        oversized = max(img.size) > max_size
+        if not oversized and img.format == pil_format:
+            return path.name, before, before
+
+        if oversized:
+            img.thumbnail((max_size, max_size), Image.LANCZOS)
+        if pil_format == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, format=pil_format, quality=quality)
+
+    data = buffer.getvalue()
+    if len(data) >= before and not oversized:
+        # 原图已经比目标编码更小
+        return path.name, before, before
+
+    target = path.with_suffix(suffix)
+    tmp_path = target.with_name(f".{target.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, target)
+    if target != path:
+        path.unlink()
+    return target.name, before, len(data)
+
+
+def transcode_dir(comic_dir: Path, image_format: str = "webp", quality: int = 80, max_size: int = 1600,
+                  workers: Optional[int] = None,
+                  on_page: Optional[Callable[[int, int, int], None]] = None) -> Optional[Dict]:
+    """并行转码漫画目录中的全部页面, 并写入transcode.json
+
+    Args:
+        workers: 进程数, None表示CPU核数
+        on_page: 每完成一页调用on_page(已完成页数, 原总大小, 处理后总大小)
+
+    Returns:
+        转码记录, 未安装Pillow或格式不支持时为None
+    """
+    image_format = image_format.lower()
+    if Image is None:
+        logger.warning("未安装Pillow, 跳过页面转码")
+        return None
+    if image_format not in FORMATS:
+        logger.warning(f"不支持的转码格式: {image_format}")
+        return None
+
+    comic_dir = Path(comic_dir)
+    pages = list_pages(comic_dir)
+    results: Dict[str, Tuple[str, int, int]] = {}
+    total_before = total_after = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(transcode_page, str(path), image_format, quality, max_size): path.name
+            for path in pages
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.warning(f"转码失败, 保留原图: {name}: {e}")
+                size = (comic_dir / name).stat().st_size
+                results[name] = (name, size, size)
+            total_before += results[name][1]
+            total_after += results[name][2]
+            if on_page is not None:
+                on_page(len(results), total_before, total_after)
+
+    report = {
+        "format": image_format,
+        "quality": quality,
+        "maxSize": max_size,
+        "bytesBefore": total_before,
+        "bytesAfter": total_after,
+        # 原文件名 -> [处理后的文件名, 原大小, 处理后大小]
+        "pages": {path.name: list(results[path.name]) for path in pages},
+    }
+    tmp_path = comic_dir / f".{REPORT_NAME}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, comic_dir / REPORT_NAME)
+    return report
@@ -0,0 +1,110 @@
+"""响应压缩工具函数"""
+import gzip
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖, 未安装时只提供gzip
+    brotli = None
+
+# 按优先级排列的可用编码
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+SIDECAR_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    """按指定编码压缩内容"""
+    if encoding == "br":
+        return brotli.compress(content, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(content, compresslevel=6, mtime=0)
+    raise ValueError(f"不支持的压缩编码: {encoding}")
+
+
+def compress_variants(content: bytes, min_size: int = 1024) -> Dict[str, bytes]:
+    """生成各编码的压缩版本, 只保留比原文更小的结果"""
+    if len(content) < min_size:
+        return {}
+    variants = {}
+    for encoding in SUPPORTED_ENCODINGS:
+        compressed = compress(content, encoding)
+        if len(compressed) < len(content):
+            variants[encoding] = compressed
+    return variants
+
+
+def choose_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """根据Accept-Encoding从可用编码中选择最合适的一个
+
+    Returns:
+        编码名称, 客户端不接受任何可用编码时为None
+    """
+    if not accept_encoding:
+        return None
+
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def sidecar_path(path: Path, encoding: str) -> Path:
+    return path.with_name(path.name + SIDECAR_SUFFIXES[encoding])
+
+
+def write_sidecars(path: Path, min_size: int = 1024):
+    """在文件旁写入.gz/.br预压缩版本, 文件过小时删除旧的预压缩文件"""
+    content = path.read_bytes()
+    variants = compress_variants(content, min_size)
+    for encoding in SIDECAR_SUFFIXES:
+        sidecar = sidecar_path(path, encoding)
+        if encoding not in variants:
+            if sidecar.exists():
+                sidecar.unlink()
+            continue
+        tmp_path = sidecar.with_name(f".{sidecar.name}.tmp")
+        tmp_path.write_bytes(variants[encoding])
+        os.replace(tmp_path, sidecar)
+
+
+def find_sidecar(path: Path, accept_encoding: Optional[str]) -> Optional[Tuple[Path, str]]:
+    """查找与原文件同步且客户端可接受的预压缩文件
+
+    Returns:
+        (预压缩文件路径, 编码), 不存在时为None
+    """
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+    available = {}
+    for encoding in SIDECAR_SUFFIXES:
+        sidecar = sidecar_path(path, encoding)
+        try:
+            if sidecar.stat().st_mtime_ns >= mtime:
+                available[encoding] = sidecar
+        except OSError:
+            continue
+
+    encoding = choose_encoding(accept_encoding, [e for e in ("br", "gzip") if e in available])
+    if encoding is None:
+        return None
+    return available[encoding], encoding
@@ -0,0 +1,56 @@
+"""HTTP条件请求与Range请求工具函数"""
+from typing import Optional, Tuple
+
+
+def etag_in(header: str, etag: str) -> bool:
+    """etag是否出现在If-None-Match/If-Range列表中(弱比较)"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip() in (etag, f"W/{etag}") for tag in header.split(","))
+
+
+def if_range_matches(header: str, etag: str, last_modified: Optional[str] = None) -> bool:
+    """If-Range是否仍指向当前表示(RFC 9110 13.1.5)
+
+    实体标签使用强比较, 弱标签与*都不匹配; 日期必须与Last-Modified完全相同。
+    不匹配时应忽略Range, 返回完整内容。
+    """
+    header = header.strip()
+    if header.startswith('"'):
+        return header == etag and not etag.startswith("W/")
+    if header.startswith("W/") or header == "*":
+        return False
+    return last_modified is not None and header == last_modified
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析单个bytes区间
+
+    Returns:
+        闭区间(start, end); 多区间或格式无效时返回None, 按完整文件响应
+
+    Raises:
+        ValueError: 区间超出文件范围
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, sep, last = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            length = int(last)
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if not first:
+        # bytes=-0 是合法语法但不满足任何字节, 应返回416
+        if length <= 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, min(end, size - 1)
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 测试使用临时漫画目录, 不读写mock数据
+os.environ.setdefault("TARGET_DIR", tempfile.mkdtemp(prefix="jmreader-test-"))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+backend_dir = str(Path(__file__).resolve().parent.parent)
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
@@ -0,0 +1,63 @@
+import io
+import zipfile
+import zlib
+
+import pytest
+
+from app.services.bundles import ZIP_MAX_ENTRIES, BundleTooLarge, ChapterBundle, select_pages
+from app.services.page_pack import PageLocation
+
+
+def make_pages(tmp_path, count):
+    pages = []
+    for i in range(1, count + 1):
+        data = f"page-{i}".encode() * i
+        path = tmp_path / f"{i:05d}.webp"
+        path.write_bytes(data)
+        pages.append({"file": path.name, "bytes": len(data), "crc32": zlib.crc32(data), "hash": str(i)})
+    return pages
+
+
+def locate_in(tmp_path):
+    return lambda name: PageLocation(name, tmp_path / name)
+
+
+def test_zip_bundle_is_valid(tmp_path):
+    pages = make_pages(tmp_path, 3)
+    bundle = ChapterBundle(pages, locate_in(tmp_path))
+
+    content = b"".join(bundle.iter_range())
+
+    assert len(content) == bundle.size
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        assert archive.testzip() is None
+        assert archive.read("00002.webp") == b"page-2page-2"
+
+
+def test_ranges_concatenate_to_full_bundle(tmp_path):
+    bundle = ChapterBundle(make_pages(tmp_path, 4), locate_in(tmp_path), "stream")
+    full = b"".join(bundle.iter_range())
+
+    cut = bundle.size // 3
+    assert b"".join(bundle.iter_range(0, cut)) + b"".join(bundle.iter_range(cut + 1)) == full
+
+
+def test_zip_entry_limit(tmp_path):
+    pages = [{"file": f"{i}.webp", "bytes": 0, "crc32": 0, "hash": ""} for i in range(ZIP_MAX_ENTRIES + 1)]
+
+    with pytest.raises(BundleTooLarge):
+        ChapterBundle(pages, locate_in(tmp_path))
+
+
+def test_missing_page(tmp_path):
+    pages = make_pages(tmp_path, 1)
+    with pytest.raises(ValueError):
+        ChapterBundle(pages, lambda name: None)
+
+
+def test_select_pages():
+    pages = [{"file": str(i)} for i in range(1, 6)]
+    assert [p["file"] for p in select_pages(pages, 2, 3)] == ["2", "3"]
+    assert [p["file"] for p in select_pages(pages, 4)] == ["4", "5"]
+    with pytest.raises(ValueError):
+        select_pages(pages, 0)
@@ -0,0 +1,109 @@
+import asyncio
+
+from app.services.downloads import DONE, FAILED, QUEUED, RUNNING, DownloadScheduler, parse_progress
+
+
+def make_scheduler(tmp_path, runner, **kwargs):
+    kwargs.setdefault("max_concurrent", 1)
+    return DownloadScheduler(str(tmp_path / "downloads.json"), runner=runner, **kwargs)
+
+
+def test_batched_jobs_stay_queued_until_started(tmp_path):
+    seen = []
+
+    async def runner(jobs, report):
+        for job in jobs:
+            report(job, status=RUNNING)
+            # 正在下载的漫画之外, 同批的其他任务仍在排队
+            seen.append([(other.comicId, other.status, other.startedAt is not None) for other in jobs])
+            await asyncio.sleep(0)
+        return {}
+
+    async def main():
+        scheduler = make_scheduler(tmp_path, runner, batch_size=3)
+        jobs = scheduler.submit_many(["a", "b", "c"])
+        await scheduler.start()
+        for job in jobs:
+            await scheduler.wait(job.id)
+        await scheduler.stop()
+        return jobs
+
+    jobs = asyncio.run(main())
+
+    assert seen[0] == [("a", RUNNING, True), ("b", QUEUED, False), ("c", QUEUED, False)]
+    assert seen[1] == [("a", RUNNING, True), ("b", RUNNING, True), ("c", QUEUED, False)]
+    assert [job.status for job in jobs] == [DONE, DONE, DONE]
+    assert jobs[0].startedAt <= jobs[1].startedAt <= jobs[2].startedAt
+
+
+def test_failed_jobs_in_batch(tmp_path):
+    async def runner(jobs, report):
+        return {jobs[1].id: "boom"}
+
+    async def main():
+        scheduler = make_scheduler(tmp_path, runner, batch_size=2)
+        jobs = scheduler.submit_many(["a", "b"])
+        await scheduler.start()
+        for job in jobs:
+            await scheduler.wait(job.id)
+        await scheduler.stop()
+        return jobs
+
+    a, b = asyncio.run(main())
+
+    assert (a.status, a.error) == (DONE, None)
+    assert (b.status, b.error) == (FAILED, "boom")
+
+
+def test_timeout_fails_only_the_current_job(tmp_path):
+    calls = []
+
+    async def runner(jobs, report):
+        calls.append([job.comicId for job in jobs])
+        for job in jobs:
+            report(job, status=RUNNING)
+            slow = job.comicId == "b" and len(calls) == 1
+            await asyncio.sleep(1 if slow else 0.05)
+        return {}
+
+    async def main():
+        # 整批耗时超过timeout, 但每个漫画单独计时
+        scheduler = make_scheduler(tmp_path, runner, batch_size=3, timeout=0.3)
+        jobs = scheduler.submit_many(["a", "b", "c"])
+        await scheduler.start()
+        for job in jobs:
+            await scheduler.wait(job.id)
+        await scheduler.stop()
+        return jobs
+
+    jobs = asyncio.run(main())
+
+    assert calls == [["a", "b", "c"], ["a", "c"]]
+    assert [job.status for job in jobs] == [DONE, FAILED, DONE]
+
+
+def test_restart_requeues_unfinished_jobs(tmp_path):
+    async def never_finishes(jobs, report):
+        report(jobs[0], status=RUNNING, pagesDone=3)
+        await asyncio.sleep(3600)
+
+    async def first_run():
+        scheduler = make_scheduler(tmp_path, never_finishes)
+        job = scheduler.submit("a")
+        await scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+        return job.id
+
+    job_id = asyncio.run(first_run())
+
+    restarted = make_scheduler(tmp_path, never_finishes)
+    job = restarted.get(job_id)
+    assert (job.status, job.startedAt, job.pagesDone) == (QUEUED, None, 0)
+
+
+def test_parse_progress():
+    line = '@@progress {"comicId": "1", "status": "running", "pagesDone": 2, "extra": 1}'
+    assert parse_progress(line) == {"comicId": "1", "status": "running", "pagesDone": 2}
+    assert parse_progress("plain output") is None
+    assert parse_progress("@@progress {broken") is None
@@ -0,0 +1,55 @@
+import pytest
+
+from app.utils.http import etag_in, if_range_matches, parse_range
+
+ETAG = '"abc-123"'
+LAST_MODIFIED = "Sat, 17 Oct 2026 08:00:00 GMT"
+
+
+def test_if_range_strong_etag():
+    assert if_range_matches(ETAG, ETAG)
+    assert if_range_matches(f" {ETAG} ", ETAG)
+    assert not if_range_matches('"other"', ETAG)
+
+
+def test_if_range_rejects_weak_and_wildcard():
+    assert not if_range_matches(f"W/{ETAG}", ETAG)
+    assert not if_range_matches("*", ETAG)
+    assert not if_range_matches(ETAG + ', "other"', ETAG)
+
+
+def test_if_range_date():
+    assert if_range_matches(LAST_MODIFIED, ETAG, LAST_MODIFIED)
+    assert not if_range_matches("Sat, 17 Oct 2026 07:59:59 GMT", ETAG, LAST_MODIFIED)
+    # 没有Last-Modified时日期无法验证
+    assert not if_range_matches(LAST_MODIFIED, ETAG)
+
+
+def test_etag_in():
+    assert etag_in(ETAG, ETAG)
+    assert etag_in(f'"x", W/{ETAG}', ETAG)
+    assert etag_in("*", ETAG)
+    assert not etag_in('"x", "y"', ETAG)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=5-", (5, 99)),
+    ("bytes=90-200", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    # 格式无效或多区间: 忽略Range, 返回完整内容
+    ("bytes=x-", None),
+    ("bytes=-x", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=5", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
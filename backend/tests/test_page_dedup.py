@@ -0,0 +1,63 @@
+import os
+
+from app.services.page_dedup import PageObjectStore
+
+
+def write_page(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_dedup_dir_leaves_no_temp_files(tmp_path):
+    store = PageObjectStore(tmp_path / "objects")
+    comic_dir = tmp_path / "comics" / "100001"
+    write_page(comic_dir / "00001.webp", b"page-1")
+    write_page(comic_dir / "00002.webp", b"page-2")
+
+    count, saved = store.dedup_dir(comic_dir)
+
+    assert count == 2
+    assert saved == 0
+    assert sorted(p.name for p in comic_dir.iterdir()) == ["00001.webp", "00002.webp"]
+    for page in comic_dir.iterdir():
+        # 对象与漫画页面各一个链接
+        assert page.stat().st_nlink == 2
+
+
+def test_store_links_duplicate_content(tmp_path):
+    store = PageObjectStore(tmp_path / "objects")
+    first = write_page(tmp_path / "a" / "00001.webp", b"same")
+    second = write_page(tmp_path / "b" / "00001.webp", b"same")
+
+    assert store.store(first, first) is False
+    assert store.store(second, second) is True
+    assert os.path.samefile(first, second)
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_store_from_separate_source(tmp_path):
+    store = PageObjectStore(tmp_path / "objects")
+    source = write_page(tmp_path / "download" / "1.webp", b"data")
+    dest = tmp_path / "comic" / "00001.webp"
+    dest.parent.mkdir()
+
+    store.store(source, dest)
+
+    assert dest.read_bytes() == b"data"
+    assert not list(dest.parent.glob("*.tmp"))
+
+
+def test_gc_frees_orphaned_objects(tmp_path):
+    store = PageObjectStore(tmp_path / "objects")
+    comic_dir = tmp_path / "comics" / "100001"
+    kept = write_page(comic_dir / "00001.webp", b"kept")
+    removed = write_page(comic_dir / "00002.webp", b"removed")
+    store.dedup_dir(comic_dir)
+
+    removed.unlink()
+
+    assert store.gc() == (1, len(b"removed"))
+    assert store.gc() == (0, 0)
+    assert kept.read_bytes() == b"kept"
+    assert len(list((tmp_path / "objects").glob("*/*"))) == 1
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from app.services.page_pack import INDEX_NAME, PACK_NAME, PageStore, pack_comic, read_page, unpack_comic
+
+
+def make_comic(root, comic_id, pages):
+    comic_dir = root / comic_id
+    comic_dir.mkdir(parents=True)
+    for name, data in pages.items():
+        (comic_dir / name).write_bytes(data)
+    return comic_dir
+
+
+def pack_files(comic_dir):
+    return sorted(p.name for p in comic_dir.glob("pages*.pack"))
+
+
+def test_pack_and_locate(tmp_path):
+    comic_dir = make_comic(tmp_path, "1", {"00001.webp": b"one", "00002.webp": b"two"})
+    store = PageStore(str(tmp_path))
+
+    assert pack_comic(comic_dir, remove_loose=True) == 2
+
+    assert not (comic_dir / "00001.webp").exists()
+    assert read_page(store.locate("1", "00002.webp")) == b"two"
+    assert store.size("1", "00001.webp") == 3
+
+
+def test_repack_never_serves_new_data_at_old_offsets(tmp_path):
+    comic_dir = make_comic(tmp_path, "1", {"00001.webp": b"old-1", "00002.webp": b"old-2"})
+    store = PageStore(str(tmp_path))
+    pack_comic(comic_dir)
+    old_location = store.locate("1", "00002.webp")
+
+    (comic_dir / "00001.webp").write_bytes(b"a much longer first page")
+    pack_comic(comic_dir)
+
+    # 旧打包文件已删除: 持有旧索引的读取方得到错误而不是错位的数据
+    assert len(pack_files(comic_dir)) == 1
+    with pytest.raises(FileNotFoundError):
+        read_page(old_location)
+    assert read_page(store.locate("1", "00002.webp")) == b"old-2"
+    assert read_page(store.locate("1", "00001.webp")) == b"a much longer first page"
+
+
+def test_legacy_index_without_pack_name(tmp_path):
+    comic_dir = make_comic(tmp_path, "1", {})
+    (comic_dir / PACK_NAME).write_bytes(b"abcdef")
+    (comic_dir / INDEX_NAME).write_text(json.dumps({"version": 1, "pages": [["00001.webp", 2, 3]]}))
+
+    assert read_page(PageStore(str(tmp_path)).locate("1", "00001.webp")) == b"cde"
+
+
+def test_unpack_removes_pack(tmp_path):
+    comic_dir = make_comic(tmp_path, "1", {"00001.webp": b"one"})
+    pack_comic(comic_dir, remove_loose=True)
+
+    assert unpack_comic(comic_dir) == 1
+
+    assert (comic_dir / "00001.webp").read_bytes() == b"one"
+    assert pack_files(comic_dir) == []
+    assert not (comic_dir / INDEX_NAME).exists()
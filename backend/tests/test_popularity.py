@@ -0,0 +1,35 @@
+import asyncio
+import json
+
+from app.services.popularity import CHAPTER_READ, DETAIL_VIEW, PopularityTracker
+
+
+def test_record_does_not_write(tmp_path):
+    path = tmp_path / "popularity.json"
+    tracker = PopularityTracker(str(path), flush_interval=0)
+
+    tracker.record("1", DETAIL_VIEW)
+    tracker.record("2", CHAPTER_READ)
+
+    assert not path.exists()
+    assert tracker.top() == ["2", "1"]
+
+
+def test_background_flush_and_stop(tmp_path):
+    path = tmp_path / "popularity.json"
+
+    async def main():
+        tracker = PopularityTracker(str(path), flush_interval=0.05)
+        tracker.start()
+        tracker.record("1", DETAIL_VIEW)
+        await asyncio.sleep(0.2)
+        first = json.loads(path.read_text())
+        tracker.record("2", CHAPTER_READ)
+        await tracker.stop()
+        return first
+
+    first = asyncio.run(main())
+
+    assert set(first["scores"]) == {"1"}
+    assert set(json.loads(path.read_text())["scores"]) == {"1", "2"}
+    assert PopularityTracker(str(path)).top() == ["2", "1"]
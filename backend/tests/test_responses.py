@@ -0,0 +1,43 @@
+import json
+import os
+
+from app.services.page_manifest import MANIFEST_NAME, MANIFEST_VERSION, ManifestStore
+from app.services.responses import ResponseCache
+
+
+class FakeCatalog:
+    version = 1
+
+    def add_listener(self, listener):
+        pass
+
+    def refresh(self):
+        pass
+
+
+def write_pages(comic_dir, files, mtime_ns):
+    path = comic_dir / MANIFEST_NAME
+    path.write_text(json.dumps({"version": MANIFEST_VERSION, "pages": [{"file": f} for f in files]}))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_pages_cache_follows_manifest_generation(tmp_path):
+    comic_dir = tmp_path / "1"
+    comic_dir.mkdir()
+    manifests = ManifestStore(str(tmp_path))
+    cache = ResponseCache(FakeCatalog(), settings=None)
+
+    def pages():
+        key = ("pages", "1-1", manifests.generation("1"))
+        return json.loads(cache.get(key, lambda: [p["file"] for p in manifests.pages("1")]))
+
+    write_pages(comic_dir, ["00001.webp"], 1_000_000_000)
+    assert pages() == ["00001.webp"]
+
+    # 重新入库只重写清单, 目录版本号不变
+    write_pages(comic_dir, ["00001.webp", "00002.webp"], 2_000_000_000)
+    assert pages() == ["00001.webp", "00002.webp"]
+
+
+def test_generation_without_manifest(tmp_path):
+    assert ManifestStore(str(tmp_path)).generation("missing") is None
@@ -0,0 +1,34 @@
+from app.services.search_index import SearchIndex, normalize, tokenize
+
+
+def _index(*titles):
+    index = SearchIndex()
+    for i, title in enumerate(titles, 1):
+        index.add({"id": str(i), "title": title, "tags": []})
+    return index
+
+
+def test_tokenize_unicode_words():
+    tokens = list(tokenize(normalize("Café Привет x_y ＡＢＣ１")))
+    assert tokens == ["café", "привет", "x", "y", "abc1"]
+
+
+def test_tokenize_cjk_bigrams():
+    assert list(tokenize(normalize("abc漫画"))) == ["abc", "漫", "画", "漫画"]
+
+
+def test_search_non_ascii_words():
+    index = _index("Café Noir", "Приключения Бобра", "Straße")
+
+    assert index.match("CAFÉ") == {"1"}
+    assert index.match("приключения") == {"2"}
+    assert index.match("STRASSE") == {"3"}
+    assert index.match("noir бобра") == set()
+
+
+def test_search_cjk():
+    index = _index("进击的巨人", "巨大机器人")
+
+    assert index.match("巨人") == {"1"}
+    assert index.match("巨") == {"1", "2"}
+    assert index.match('"机器人"') == {"2"}
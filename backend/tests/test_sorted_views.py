@@ -0,0 +1,58 @@
+import base64
+import json
+
+import pytest
+
+from app.services.sorted_views import SortedView, decode_cursor, encode_cursor, resolve_page
+
+
+def raw_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("title", ("漫画", "42"))) == ("title", ("漫画", "42"), None)
+    assert decode_cursor(encode_cursor("default", (3, "7"))) == ("default", (3, "7"), None)
+    assert decode_cursor(encode_cursor("popular", offset=40)) == ("popular", None, 40)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "!!!",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode("ascii"),
+    raw_cursor([]),
+    raw_cursor({"k": [1, "1"]}),
+    raw_cursor({"s": "unknown", "o": 0}),
+    raw_cursor({"s": "default", "k": ["1", "1"]}),
+    raw_cursor({"s": "default", "k": [True, "1"]}),
+    raw_cursor({"s": "title", "k": ["a", 1]}),
+    raw_cursor({"s": "title", "k": ["a"]}),
+    raw_cursor({"s": "popular", "k": [1, "1"]}),
+    raw_cursor({"s": "popular", "o": "20"}),
+    raw_cursor({"s": "popular", "o": False}),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_resolve_page():
+    assert resolve_page("title", -5, None) == ("title", None, 0)
+    # 游标中的排序方式优先于请求参数
+    assert resolve_page("title", 0, encode_cursor("newest", ("2024", "1"))) == ("newest", ("2024", "1"), 0)
+    assert resolve_page("title", 0, encode_cursor("popular", offset=20)) == ("popular", None, 20)
+
+
+def test_keyset_paging_survives_inserts():
+    view = SortedView(lambda comic_id, comic: comic["order"])
+    for i in range(1, 6):
+        view.insert(str(i), {"order": i})
+
+    first = view.page(0, 2)
+    assert [comic_id for _, comic_id in first] == ["1", "2"]
+
+    # 在已读位置之前插入新漫画, 下一页不重复也不遗漏
+    view.insert("0", {"order": 0})
+    last = decode_cursor(encode_cursor("default", first[-1]))[1]
+    assert [comic_id for _, comic_id in view.after(last, 2)] == ["3", "4"]
+    assert [comic_id for _, comic_id in view.after((4, "4"), 2, descending=True)] == ["3", "2"]
@@ -1,5 +1,5 @@
 import { get } from '@/utils/request'
-import type { Comic, Page, PaginatedResult, SearchParams } from '@/types'
+import type { CatalogChanges, Comic, Page, PaginatedResult, SearchParams } from '@/types'
 
 // 获取漫画列表
 export async function getComics(page = 1, pageSize = 20): Promise<PaginatedResult<Comic>> {
@@ -77,4 +77,15 @@ export async function getRecommendedComics(limit = 6): Promise<Comic[]> {
     console.error('获取推荐漫画失败', error)
     return []
   }
-}
\ No newline at end of file
+}
+
+// 获取指定版本之后的目录变更
+export async function getComicChanges(since: number | null = null): Promise<CatalogChanges | null> {
+  try {
+    const result = await get<CatalogChanges>('/comics/changes', since === null ? {} : { since })
+    return result
+  } catch (error) {
+    console.error('获取目录变更失败', error)
+    return null
+  }
+}
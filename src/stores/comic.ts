@@ -1,6 +1,6 @@
 import { defineStore } from 'pinia'
 import { ref, computed, onMounted, onUnmounted } from 'vue'
-import type { Comic, Chapter, Page } from '@/types'
+import type { CatalogChange, Comic, Chapter, Page } from '@/types'
 import * as comicApi from '@/api/comic'
 import { onMessage } from '@/utils/websocket'
 
@@ -15,6 +15,8 @@ export const useComicStore = defineStore('comic', () => {
   const currentPages = ref<Page[]>([])
   const loading = ref(false)
   const error = ref<string | null>(null)
+  // 本地数据对应的目录版本号, 为null时尚未同步
+  const catalogVersion = ref<number | null>(null)
 
   // 计算属性
   const hasComics = computed(() => comics.value.length > 0)
@@ -27,6 +29,13 @@ export const useComicStore = defineStore('comic', () => {
     try {
       loading.value = true
       error.value = null
+      // 先记录版本号再加载列表, 加载期间的变更会随后通过WebSocket补上
+      if (catalogVersion.value === null) {
+        const result = await comicApi.getComicChanges()
+        if (result) {
+          catalogVersion.value = result.version
+        }
+      }
       const result = await comicApi.getComics(page, pageSize)
       comics.value = result.items
       return result
@@ -162,33 +171,93 @@ export const useComicStore = defineStore('comic', () => {
     error.value = null
   }
 
-  // 处理WebSocket消息
-  function handleComicAdded(data: any) {
-    console.log('收到漫画添加通知:', data)
-    // 刷新漫画列表
+  // 重新加载全部列表
+  function reloadComics() {
     fetchComics()
     fetchLatestComics()
     fetchRecommendedComics()
   }
 
-  function handleComicDeleted(data: any) {
-    console.log('收到漫画删除通知:', data)
-    // 刷新漫画列表
-    fetchComics()
-    fetchLatestComics()
-    fetchRecommendedComics()
-    
-    // 如果当前正在查看的漫画被删除，重置状态
-    if (currentComic.value && currentComic.value.id.toString() === data.comic_id) {
-      currentComic.value = null
-      currentChapter.value = null
-      currentPages.value = []
+  // 把一条目录变更应用到本地列表
+  function applyChange(change: CatalogChange) {
+    const lists = [comics, latestComics, recommendedComics, filteredComics]
+    const sameComic = (comic: Comic) => comic.id.toString() === change.comicId
+
+    if (change.action === 'delete' || !change.comic) {
+      lists.forEach(list => {
+        list.value = list.value.filter(comic => !sameComic(comic))
+      })
+
+      // 如果当前正在查看的漫画被删除，重置状态
+      if (currentComic.value && sameComic(currentComic.value)) {
+        currentComic.value = null
+        currentChapter.value = null
+        currentPages.value = []
+      }
+      return
+    }
+
+    const updated = change.comic
+    let found = false
+    lists.forEach(list => {
+      const index = list.value.findIndex(sameComic)
+      if (index !== -1) {
+        list.value.splice(index, 1, updated)
+        found = true
+      }
+    })
+
+    // 新增的漫画是最新更新的漫画
+    if (change.action === 'add' && !found) {
+      const limit = latestComics.value.length || 10
+      latestComics.value = [updated, ...latestComics.value].slice(0, limit)
+      comics.value.push(updated)
     }
+
+    if (currentComic.value && sameComic(currentComic.value)) {
+      currentComic.value = { ...updated, chapters: currentComic.value.chapters }
+    }
+  }
+
+  // 拉取本地版本之后的全部变更, 版本过旧时重新加载全部列表
+  async function syncChanges() {
+    const result = await comicApi.getComicChanges(catalogVersion.value)
+    if (!result) {
+      return
+    }
+    if (result.reset) {
+      catalogVersion.value = result.version
+      reloadComics()
+      return
+    }
+    result.changes.forEach(applyChange)
+    catalogVersion.value = result.version
+  }
+
+  // 处理WebSocket目录变更消息, 版本号连续时直接应用, 否则先补齐错过的变更
+  function handleCatalogChange(data: any) {
+    console.log('收到目录变更通知:', data)
+    const version = catalogVersion.value
+    if (version !== null && data.version <= version) {
+      return
+    }
+    if (version !== null && data.version === version + 1 && data.change) {
+      applyChange(data.change)
+      catalogVersion.value = data.version
+      return
+    }
+    syncChanges()
   }
 
   // 注册WebSocket消息处理
-  onMessage('comic_added', handleComicAdded)
-  onMessage('comic_deleted', handleComicDeleted)
+  onMessage('comic_added', handleCatalogChange)
+  onMessage('comic_updated', handleCatalogChange)
+  onMessage('comic_deleted', handleCatalogChange)
+  onMessage('open', () => {
+    if (catalogVersion.value !== null) {
+      syncChanges()
+    }
+  })
 
   return {
     // 状态
@@ -201,6 +270,7 @@ export const useComicStore = defineStore('comic', () => {
     currentPages,
     loading,
     error,
+    catalogVersion,
 
     // 计算属性
     hasComics,
@@ -216,6 +286,7 @@ export const useComicStore = defineStore('comic', () => {
     fetchChapterPages,
     searchComics,
     fetchComicsByTag,
+    syncChanges,
     resetState
   }
 }) 
\ No newline at end of file
@@ -51,6 +51,21 @@ export interface PaginatedResult<T> {
   hasMore: boolean;
 }
 
+// 目录变更类型定义
+export interface CatalogChange {
+  version: number;
+  action: 'add' | 'update' | 'delete';
+  comicId: string;
+  comic: Comic | null;
+}
+
+// 目录变更列表类型定义, reset为true时需要重新加载全部列表
+export interface CatalogChanges {
+  version: number;
+  reset: boolean;
+  changes: CatalogChange[];
+}
+
 // 主题模式类型定义
 export type ThemeMode = 'light' | 'dark' | 'auto';
 
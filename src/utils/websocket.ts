@@ -44,12 +44,21 @@ export function initWebSocket() {
     ws.onopen = () => {
       console.log('WebSocket连接已建立')
       wsConnected.value = true
+
+      // 重新连接后, 断开期间错过的消息需要由处理函数自行补齐
+      messageHandlers['open']?.forEach(handler => handler({}))
     }
 
     // 接收消息
     ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data)
+
+        // 回复服务端心跳, 服务端据此判断连接是否存活
+        if (data.action === 'ping') {
+          ws?.send(JSON.stringify({ action: 'pong' }))
+          return
+        }
         console.log('收到WebSocket消息:', data)
 
         // 如果有action字段，触发对应的处理函数